@@ -3,10 +3,12 @@
 """
 from typing import List, Optional, Dict, Any
 from fastapi import APIRouter, Depends, Query, HTTPException, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from utils.database import get_db
-from utils.exceptions import NLQueryException, ValidationException
+from utils.exceptions import NLQueryException, ValidationException, ResourceNotFoundException
+from utils.permissions import require_permissions, Permissions
 from schemas.base import DataResponse, PaginatedResponse
 from schemas.nlquery_schemas import (
     QueryTaskCreate, QueryTaskResponse, QueryTaskStatus, QueryTaskResult,
@@ -17,6 +19,10 @@ from schemas.nlquery_schemas import (
     QueryStatistics, QueryOptimizationSuggestion
 )
 from services.nl2sql.query_processor import get_query_processor
+from services.query_engine.result_store import get_result_store
+from services.query_engine.result_export import (
+    get_result_exporter, ExportFormat, ExportJob, ExportStatus, EXPORT_MEDIA_TYPES
+)
 
 router = APIRouter()
 
@@ -26,18 +32,21 @@ router = APIRouter()
 async def submit_query(
     query_data: QueryTaskCreate,
     db: AsyncSession = Depends(get_db),
-    current_user_id: int = 1  # TODO: 从认证中间件获取
+    current_user: dict = Depends(require_permissions(Permissions.QUERY_EXECUTE))
 ):
     """提交自然语言查询任务"""
     try:
         processor = get_query_processor()
         
+        # 用户角色作为问题缓存的范围，不同角色不共享缓存的SQL
         result = await processor.submit_query(
             user_question=query_data.user_question,
-            user_id=current_user_id,
+            user_id=current_user["id"],
             selected_theme_id=query_data.selected_theme_id,
             selected_table_ids=query_data.selected_table_ids,
-            query_type=query_data.query_type.value
+            query_type=query_data.query_type.value,
+            preview=query_data.preview,
+            user_roles=[role["name"] for role in current_user.get("roles", [])]
         )
         
         return DataResponse(data=result)
@@ -72,9 +81,21 @@ async def get_query_result(
     try:
         processor = get_query_processor()
         result = await processor.get_task_result(task_id)
+        result_store = get_result_store()
+        
+        # 已落盘的大结果从Parquet文件按页读取
+        if result_store.has_result(task_id):
+            total_rows = result.get("result_row_count", 0)
+            result["result_data"] = await result_store.read_page(task_id, (page - 1) * size, size)
+            result["pagination"] = {
+                "page": page,
+                "size": size,
+                "total": total_rows,
+                "pages": (total_rows + size - 1) // size
+            }
         
         # 如果有结果数据，进行分页处理
-        if result.get("result_data") and isinstance(result["result_data"], list):
+        elif result.get("result_data") and isinstance(result["result_data"], list):
             total_rows = len(result["result_data"])
             start_idx = (page - 1) * size
             end_idx = start_idx + size
@@ -149,7 +170,8 @@ async def submit_batch_query(
                 user_id=current_user_id,
                 selected_theme_id=query_data.selected_theme_id,
                 selected_table_ids=query_data.selected_table_ids,
-                query_type=query_data.query_type.value
+                query_type=query_data.query_type.value,
+                preview=query_data.preview
             )
             task_ids.append(result["task_id"])
         
@@ -182,6 +204,89 @@ async def get_batch_status(
     })
 
 
+# ========== 结果导出 ==========
+def _get_export_job(export_id: str, current_user: dict) -> ExportJob:
+    """获取导出任务，只有发起人和超级用户可以访问"""
+    try:
+        job = get_result_exporter().get_job(export_id)
+    except ResourceNotFoundException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    if job.user_id != current_user.get("id") and not current_user.get("is_superuser"):
+        raise HTTPException(status_code=403, detail="无权访问该导出任务")
+    return job
+
+
+def _check_task_owner(task_id: str, current_user: dict, action: str = "导出该查询任务的结果"):
+    """只有查询任务的发起人和超级用户可以导出其结果或通过反馈使其SQL缓存失效"""
+    task_info = get_query_processor().active_tasks.get(task_id)
+    if task_info is None:
+        raise HTTPException(status_code=404, detail=f"任务 {task_id} 不存在")
+    
+    if task_info["user_id"] != current_user.get("id") and not current_user.get("is_superuser"):
+        raise HTTPException(status_code=403, detail=f"无权{action}")
+
+
+@router.post("/export/{task_id}", response_model=DataResponse[Dict[str, Any]], summary="导出查询结果")
+async def export_query_result(
+    task_id: str,
+    export_format: ExportFormat = Query(ExportFormat.CSV, alias="format", description="导出格式"),
+    current_user: dict = Depends(require_permissions(Permissions.QUERY_EXPORT))
+):
+    """重新执行任务的最终SQL，将完整结果流式写入导出文件，进度通过WebSocket推送"""
+    _check_task_owner(task_id, current_user)
+    try:
+        processor = get_query_processor()
+        result = await processor.get_task_result(task_id)
+        if result.get("status") != "success" or not result.get("final_sql"):
+            raise ValidationException("只能导出执行成功的查询结果")
+        
+        job = get_result_exporter().start_export(task_id, result["final_sql"], export_format, current_user.get("id"))
+        return DataResponse(data=job.to_dict())
+        
+    except ValidationException as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except NLQueryException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/export/{export_id}/status", response_model=DataResponse[Dict[str, Any]], summary="获取导出任务状态")
+async def get_export_status(
+    export_id: str,
+    current_user: dict = Depends(require_permissions(Permissions.QUERY_EXPORT))
+):
+    """获取导出任务进度"""
+    return DataResponse(data=_get_export_job(export_id, current_user).to_dict())
+
+
+@router.get("/export/{export_id}/download", summary="下载导出文件")
+async def download_export(
+    export_id: str,
+    current_user: dict = Depends(require_permissions(Permissions.QUERY_EXPORT))
+):
+    """以分块传输下载已完成的导出文件"""
+    job = _get_export_job(export_id, current_user)
+    if job.status != ExportStatus.COMPLETED:
+        raise HTTPException(status_code=409, detail=f"导出任务状态为 {job.status.value}，无法下载")
+    
+    return StreamingResponse(
+        get_result_exporter().iter_file(export_id),
+        media_type=EXPORT_MEDIA_TYPES[job.format],
+        headers={"Content-Disposition": f'attachment; filename="{job.filename}"'}
+    )
+
+
+@router.post("/export/{export_id}/cancel", response_model=DataResponse[Dict[str, Any]], summary="取消导出任务")
+async def cancel_export(
+    export_id: str,
+    current_user: dict = Depends(require_permissions(Permissions.QUERY_EXPORT))
+):
+    """取消进行中的导出任务"""
+    _get_export_job(export_id, current_user)
+    job = await get_result_exporter().cancel(export_id)
+    return DataResponse(data=job.to_dict())
+
+
 # ========== 查询历史 ==========
 @router.get("/history", response_model=PaginatedResponse[QueryHistoryResponse], summary="获取查询历史")
 async def get_query_history(
@@ -279,10 +384,24 @@ async def execute_favorite_query(
 @router.post("/feedback", response_model=DataResponse[QueryFeedbackResponse], summary="提交查询反馈")
 async def submit_query_feedback(
     feedback_data: QueryFeedbackCreate,
-    current_user_id: int = 1,  # TODO: 从认证中间件获取
+    current_user: dict = Depends(require_permissions(Permissions.QUERY_EXECUTE)),
     db: AsyncSession = Depends(get_db)
 ):
     """提交查询结果反馈"""
+    # 负面反馈：删除该任务问题和SQL的问题缓存及语义缓存，避免相同或相似问题继续复用；
+    # 只有任务发起人的反馈可以使缓存失效
+    negative = (
+        feedback_data.feedback_type == "bad"
+        or (feedback_data.rating is not None and feedback_data.rating <= 2)
+        or (feedback_data.sql_accuracy is not None and feedback_data.sql_accuracy <= 2)
+    )
+    if negative:
+        _check_task_owner(feedback_data.task_id, current_user, "对该查询任务提交负面反馈")
+        try:
+            get_query_processor().invalidate_task_sql(feedback_data.task_id)
+        except NLQueryException as e:
+            raise HTTPException(status_code=404, detail=str(e))
+    
     # TODO: 实现查询反馈功能
     return DataResponse(data={"message": "查询反馈功能开发中..."})
 
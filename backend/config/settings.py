@@ -21,6 +21,7 @@ class Settings(BaseSettings):
     
     # 安全配置
     SECRET_KEY: str = Field(default="your-secret-key-here", env="SECRET_KEY")
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = Field(default=1440, env="ACCESS_TOKEN_EXPIRE_MINUTES")
     ALLOWED_ORIGINS: List[str] = Field(
         default=["http://localhost:3000", "http://127.0.0.1:3000", 
                 "http://localhost:3001", "http://127.0.0.1:3001",
@@ -54,6 +55,22 @@ class Settings(BaseSettings):
     QUERY_ENGINE_USER: Optional[str] = Field(default=None, env="QUERY_ENGINE_USER")
     QUERY_ENGINE_PASSWORD: Optional[str] = Field(default=None, env="QUERY_ENGINE_PASSWORD")
     QUERY_ENGINE_PATH: str = Field(default="database/business.duckdb", env="QUERY_ENGINE_PATH")
+    # 只读副本，格式: "host[:port[:weight]],..."，为空时所有查询在主库执行
+    QUERY_ENGINE_REPLICAS: Optional[str] = Field(default=None, env="QUERY_ENGINE_REPLICAS")
+    QUERY_ENGINE_REPLICA_FALLBACK_TO_PRIMARY: bool = Field(default=True, env="QUERY_ENGINE_REPLICA_FALLBACK_TO_PRIMARY")
+    QUERY_ENGINE_REPLICA_HEALTH_CHECK_INTERVAL: int = Field(default=5, env="QUERY_ENGINE_REPLICA_HEALTH_CHECK_INTERVAL")
+    QUERY_ENGINE_REPLICA_MAX_FAILURES: int = Field(default=3, env="QUERY_ENGINE_REPLICA_MAX_FAILURES")
+    QUERY_RESULT_FORMAT: str = Field(default="arrow", env="QUERY_RESULT_FORMAT")
+    DUCKDB_EXECUTOR_WORKERS: int = Field(default=4, env="DUCKDB_EXECUTOR_WORKERS")
+    DUCKDB_EXECUTOR_QUEUE_SIZE: int = Field(default=100, env="DUCKDB_EXECUTOR_QUEUE_SIZE")
+    DUCKDB_MEMORY_LIMIT: Optional[str] = Field(default=None, env="DUCKDB_MEMORY_LIMIT")
+    DUCKDB_MEMORY_FRACTION: float = Field(default=0.75, env="DUCKDB_MEMORY_FRACTION")
+    DUCKDB_THREADS: int = Field(default=0, env="DUCKDB_THREADS")
+    DUCKDB_TEMP_DIRECTORY: str = Field(default="database/duckdb_tmp", env="DUCKDB_TEMP_DIRECTORY")
+    DUCKDB_MAX_TEMP_DIRECTORY_SIZE: Optional[str] = Field(default=None, env="DUCKDB_MAX_TEMP_DIRECTORY_SIZE")
+    DUCKDB_ENABLE_PROGRESS_BAR: bool = Field(default=False, env="DUCKDB_ENABLE_PROGRESS_BAR")
+    # DuckDB无法感知绕过查询引擎的原地更新，结果缓存默认关闭
+    DUCKDB_RESULT_CACHE_ENABLED: bool = Field(default=False, env="DUCKDB_RESULT_CACHE_ENABLED")
     
     # LLM配置
     LLM_PROVIDER: str = Field(default="openai", env="LLM_PROVIDER")
@@ -62,15 +79,66 @@ class Settings(BaseSettings):
     LLM_MODEL: str = Field(default="gpt-4-turbo", env="LLM_MODEL")
     LLM_TEMPERATURE: float = Field(default=0.1, env="LLM_TEMPERATURE")
     LLM_MAX_TOKENS: int = Field(default=4000, env="LLM_MAX_TOKENS")
+    LLM_MAX_CONCURRENCY: int = Field(default=8, env="LLM_MAX_CONCURRENCY")
+    LLM_MAX_QUEUE_SIZE: int = Field(default=100, env="LLM_MAX_QUEUE_SIZE")
+    LLM_CALL_TIMEOUT: int = Field(default=120, env="LLM_CALL_TIMEOUT")
+    LLM_STREAMING_ENABLED: bool = Field(default=True, env="LLM_STREAMING_ENABLED")
+    LLM_STREAM_NOTIFY_INTERVAL_MS: int = Field(default=100, env="LLM_STREAM_NOTIFY_INTERVAL_MS")
     
     # 向量数据库配置
     VECTOR_DB_PATH: str = Field(default="database/vector_db", env="VECTOR_DB_PATH")
     VECTOR_DB_COLLECTION: str = Field(default="taosha_knowledge", env="VECTOR_DB_COLLECTION")
+    NL2SQL_CACHE_ENABLED: bool = Field(default=True, env="NL2SQL_CACHE_ENABLED")
+    NL2SQL_CACHE_SIMILARITY_THRESHOLD: float = Field(default=0.92, env="NL2SQL_CACHE_SIMILARITY_THRESHOLD")
+    NL2SQL_CACHE_MAX_ENTRIES: int = Field(default=5000, env="NL2SQL_CACHE_MAX_ENTRIES")
+    NL2SQL_CACHE_TTL: int = Field(default=7 * 86400, env="NL2SQL_CACHE_TTL")
+    NL2SQL_QUESTION_CACHE_ENABLED: bool = Field(default=True, env="NL2SQL_QUESTION_CACHE_ENABLED")
+    NL2SQL_QUESTION_CACHE_MAX_ENTRIES: int = Field(default=10000, env="NL2SQL_QUESTION_CACHE_MAX_ENTRIES")
+    NL2SQL_QUESTION_CACHE_TTL: int = Field(default=3600, env="NL2SQL_QUESTION_CACHE_TTL")
     
     # 查询配置
     QUERY_TIMEOUT: int = Field(default=30, env="QUERY_TIMEOUT")
     MAX_RETRY_COUNT: int = Field(default=3, env="MAX_RETRY_COUNT")
     MAX_RESULT_ROWS: int = Field(default=1000, env="MAX_RESULT_ROWS")
+    QUERY_STREAM_BATCH_SIZE: int = Field(default=1000, env="QUERY_STREAM_BATCH_SIZE")
+    QUERY_RESULT_CACHE_ENABLED: bool = Field(default=True, env="QUERY_RESULT_CACHE_ENABLED")
+    QUERY_RESULT_CACHE_MAX_BYTES: int = Field(default=256 * 1024 * 1024, env="QUERY_RESULT_CACHE_MAX_BYTES")
+    QUERY_RESULT_CACHE_TTL: int = Field(default=300, env="QUERY_RESULT_CACHE_TTL")
+    QUERY_COALESCING_ENABLED: bool = Field(default=True, env="QUERY_COALESCING_ENABLED")
+    RESULT_STORE_DIR: str = Field(default="database/query_results", env="RESULT_STORE_DIR")
+    RESULT_SPILL_THRESHOLD_BYTES: int = Field(default=16 * 1024 * 1024, env="RESULT_SPILL_THRESHOLD_BYTES")
+    RESULT_SPILL_ROW_GROUP_SIZE: int = Field(default=10000, env="RESULT_SPILL_ROW_GROUP_SIZE")
+    EXPORT_DIR: str = Field(default="database/exports", env="EXPORT_DIR")
+    EXPORT_MAX_ROWS: int = Field(default=1000000, env="EXPORT_MAX_ROWS")
+    EXPORT_BATCH_SIZE: int = Field(default=10000, env="EXPORT_BATCH_SIZE")
+    EXPORT_MAX_CONCURRENT: int = Field(default=2, env="EXPORT_MAX_CONCURRENT")
+    EXPORT_FILE_TTL: int = Field(default=3600, env="EXPORT_FILE_TTL")
+    SCHEMA_REFRESH_INTERVAL: int = Field(default=30, env="SCHEMA_REFRESH_INTERVAL")
+    PREPARED_STATEMENT_CACHE_SIZE: int = Field(default=128, env="PREPARED_STATEMENT_CACHE_SIZE")
+    # MySQL的SQL级 PREPARE/EXECUTE 每次执行仍重新优化，且参数经会话变量多一次往返，默认关闭
+    MYSQL_PREPARED_STATEMENT_CACHE_SIZE: int = Field(default=0, env="MYSQL_PREPARED_STATEMENT_CACHE_SIZE")
+    QUERY_SCHEDULER_ENABLED: bool = Field(default=True, env="QUERY_SCHEDULER_ENABLED")
+    QUERY_SCHEDULER_MAX_CONCURRENCY: int = Field(default=0, env="QUERY_SCHEDULER_MAX_CONCURRENCY")
+    QUERY_SCHEDULER_MAX_QUEUE_SIZE: int = Field(default=1000, env="QUERY_SCHEDULER_MAX_QUEUE_SIZE")
+    QUERY_ADMISSION_ENABLED: bool = Field(default=True, env="QUERY_ADMISSION_ENABLED")
+    QUERY_ADMISSION_MAX_SCAN_ROWS: int = Field(default=100_000_000, env="QUERY_ADMISSION_MAX_SCAN_ROWS")
+    QUERY_ADMISSION_MAX_SCAN_BYTES: int = Field(default=10 * 1024 ** 3, env="QUERY_ADMISSION_MAX_SCAN_BYTES")
+    QUERY_ADMISSION_DOWNGRADE_ROWS: int = Field(default=100_000, env="QUERY_ADMISSION_DOWNGRADE_ROWS")
+    QUERY_PREVIEW_ENABLED: bool = Field(default=False, env="QUERY_PREVIEW_ENABLED")
+    QUERY_PREVIEW_ROWS: int = Field(default=200, env="QUERY_PREVIEW_ROWS")
+    QUERY_PREVIEW_LATENCY_MS: int = Field(default=1500, env="QUERY_PREVIEW_LATENCY_MS")
+    QUERY_PREVIEW_MIN_SAMPLE_PERCENT: float = Field(default=1.0, env="QUERY_PREVIEW_MIN_SAMPLE_PERCENT")
+    QUERY_BATCH_MAX_PARALLEL: int = Field(default=4, env="QUERY_BATCH_MAX_PARALLEL")
+    QUERY_ROLLUP_ENABLED: bool = Field(default=False, env="QUERY_ROLLUP_ENABLED")
+    QUERY_ROLLUP_MIN_FREQUENCY: int = Field(default=5, env="QUERY_ROLLUP_MIN_FREQUENCY")
+    QUERY_ROLLUP_MAX_ROLLUPS: int = Field(default=20, env="QUERY_ROLLUP_MAX_ROLLUPS")
+    QUERY_ROLLUP_MAX_DIMENSIONS: int = Field(default=6, env="QUERY_ROLLUP_MAX_DIMENSIONS")
+    QUERY_ROLLUP_MIN_BASE_ROWS: int = Field(default=100000, env="QUERY_ROLLUP_MIN_BASE_ROWS")
+    QUERY_ROLLUP_HISTORY_DAYS: int = Field(default=30, env="QUERY_ROLLUP_HISTORY_DAYS")
+    QUERY_ROLLUP_MINE_INTERVAL: int = Field(default=3600, env="QUERY_ROLLUP_MINE_INTERVAL")
+    QUERY_ROLLUP_REFRESH_INTERVAL: int = Field(default=60, env="QUERY_ROLLUP_REFRESH_INTERVAL")
+    QUERY_ROLLUP_FULL_REBUILD_INTERVAL: int = Field(default=86400, env="QUERY_ROLLUP_FULL_REBUILD_INTERVAL")
+    QUERY_ROLLUP_VERIFY_INTERVAL: int = Field(default=0, env="QUERY_ROLLUP_VERIFY_INTERVAL")
     
     # WebSocket配置
     WS_HEARTBEAT_INTERVAL: int = Field(default=30, env="WS_HEARTBEAT_INTERVAL")
@@ -110,7 +178,41 @@ class Settings(BaseSettings):
             db_path.parent.mkdir(parents=True, exist_ok=True)
             return {
                 "type": "duckdb",
-                "path": self.QUERY_ENGINE_PATH
+                "path": self.QUERY_ENGINE_PATH,
+                "result_format": self.QUERY_RESULT_FORMAT,
+                "stream_batch_size": self.QUERY_STREAM_BATCH_SIZE,
+                "executor_workers": self.DUCKDB_EXECUTOR_WORKERS,
+                "executor_queue_size": self.DUCKDB_EXECUTOR_QUEUE_SIZE,
+                "memory_limit": self.DUCKDB_MEMORY_LIMIT,
+                "memory_fraction": self.DUCKDB_MEMORY_FRACTION,
+                "threads": self.DUCKDB_THREADS,
+                "temp_directory": self.DUCKDB_TEMP_DIRECTORY,
+                "max_temp_directory_size": self.DUCKDB_MAX_TEMP_DIRECTORY_SIZE,
+                "enable_progress_bar": self.DUCKDB_ENABLE_PROGRESS_BAR,
+                "query_timeout": self.QUERY_TIMEOUT,
+                "result_cache_enabled": self.QUERY_RESULT_CACHE_ENABLED and self.DUCKDB_RESULT_CACHE_ENABLED,
+                "result_cache_max_bytes": self.QUERY_RESULT_CACHE_MAX_BYTES,
+                "result_cache_ttl": self.QUERY_RESULT_CACHE_TTL,
+                "query_coalescing_enabled": self.QUERY_COALESCING_ENABLED,
+                "schema_refresh_interval": self.SCHEMA_REFRESH_INTERVAL,
+                "prepared_statement_cache_size": self.PREPARED_STATEMENT_CACHE_SIZE,
+                "scheduler_enabled": self.QUERY_SCHEDULER_ENABLED,
+                "scheduler_max_concurrency": self.QUERY_SCHEDULER_MAX_CONCURRENCY,
+                "scheduler_max_queue_size": self.QUERY_SCHEDULER_MAX_QUEUE_SIZE,
+                "preview_rows": self.QUERY_PREVIEW_ROWS,
+                "preview_latency_ms": self.QUERY_PREVIEW_LATENCY_MS,
+                "preview_min_sample_percent": self.QUERY_PREVIEW_MIN_SAMPLE_PERCENT,
+                "batch_max_parallel": self.QUERY_BATCH_MAX_PARALLEL,
+                "rollup_enabled": self.QUERY_ROLLUP_ENABLED,
+                "rollup_min_frequency": self.QUERY_ROLLUP_MIN_FREQUENCY,
+                "rollup_max_rollups": self.QUERY_ROLLUP_MAX_ROLLUPS,
+                "rollup_max_dimensions": self.QUERY_ROLLUP_MAX_DIMENSIONS,
+                "rollup_min_base_rows": self.QUERY_ROLLUP_MIN_BASE_ROWS,
+                "rollup_history_days": self.QUERY_ROLLUP_HISTORY_DAYS,
+                "rollup_mine_interval": self.QUERY_ROLLUP_MINE_INTERVAL,
+                "rollup_refresh_interval": self.QUERY_ROLLUP_REFRESH_INTERVAL,
+                "rollup_full_rebuild_interval": self.QUERY_ROLLUP_FULL_REBUILD_INTERVAL,
+                "rollup_verify_interval": self.QUERY_ROLLUP_VERIFY_INTERVAL
             }
         elif self.QUERY_ENGINE_TYPE == "mysql":
             return {
@@ -119,7 +221,26 @@ class Settings(BaseSettings):
                 "port": self.QUERY_ENGINE_PORT,
                 "database": self.QUERY_ENGINE_DATABASE,
                 "user": self.QUERY_ENGINE_USER,
-                "password": self.QUERY_ENGINE_PASSWORD
+                "password": self.QUERY_ENGINE_PASSWORD,
+                "replicas": self.QUERY_ENGINE_REPLICAS,
+                "replica_fallback_to_primary": self.QUERY_ENGINE_REPLICA_FALLBACK_TO_PRIMARY,
+                "replica_health_check_interval": self.QUERY_ENGINE_REPLICA_HEALTH_CHECK_INTERVAL,
+                "replica_max_failures": self.QUERY_ENGINE_REPLICA_MAX_FAILURES,
+                "stream_batch_size": self.QUERY_STREAM_BATCH_SIZE,
+                "query_timeout": self.QUERY_TIMEOUT,
+                "result_cache_enabled": self.QUERY_RESULT_CACHE_ENABLED,
+                "result_cache_max_bytes": self.QUERY_RESULT_CACHE_MAX_BYTES,
+                "result_cache_ttl": self.QUERY_RESULT_CACHE_TTL,
+                "query_coalescing_enabled": self.QUERY_COALESCING_ENABLED,
+                "schema_refresh_interval": self.SCHEMA_REFRESH_INTERVAL,
+                "prepared_statement_cache_size": self.MYSQL_PREPARED_STATEMENT_CACHE_SIZE,
+                "scheduler_enabled": self.QUERY_SCHEDULER_ENABLED,
+                "scheduler_max_concurrency": self.QUERY_SCHEDULER_MAX_CONCURRENCY,
+                "scheduler_max_queue_size": self.QUERY_SCHEDULER_MAX_QUEUE_SIZE,
+                "preview_rows": self.QUERY_PREVIEW_ROWS,
+                "preview_latency_ms": self.QUERY_PREVIEW_LATENCY_MS,
+                "preview_min_sample_percent": self.QUERY_PREVIEW_MIN_SAMPLE_PERCENT,
+                "batch_max_parallel": self.QUERY_BATCH_MAX_PARALLEL
             }
         else:
             raise ValueError(f"不支持的查询引擎类型: {self.QUERY_ENGINE_TYPE}")
@@ -19,6 +19,9 @@ from utils.logger import setup_logging
 from api.v1.api import api_router
 # from utils.database import DatabaseManager
 from utils.exceptions import TaoshaException
+from services.query_engine.engine_factory import (
+    QueryEngineFactory, get_connected_engine, health_check_engines
+)
 
 
 @asynccontextmanager
@@ -33,12 +36,20 @@ async def lifespan(app: FastAPI):
     # await db_manager.initialize()
     
     logger = get_settings().logger
+    
+    # 预热默认查询引擎的连接池，失败时在首次查询时重试
+    try:
+        await get_connected_engine()
+    except Exception as e:
+        logger.warning(f"查询引擎预热失败: {e}")
+    
     logger.info("淘沙分析平台后端服务启动完成")
     
     yield
     
     # 关闭时执行
     # await db_manager.close()
+    await QueryEngineFactory.close_all_engines()
     logger.info("淘沙分析平台后端服务关闭完成")
 
 
@@ -99,7 +110,9 @@ def create_app() -> FastAPI:
     
     @app.get("/health")
     async def health_check():
-        return {"status": "healthy"}
+        engines = await health_check_engines()
+        healthy = all(engine["status"] == "healthy" for engine in engines.values())
+        return {"status": "healthy" if healthy else "degraded", "engines": engines}
     
     return app
 
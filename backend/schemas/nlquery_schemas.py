@@ -20,6 +20,7 @@ class QueryTaskCreate(BaseCreateSchema):
     query_type: QueryTypeEnum = Field(default=QueryTypeEnum.NATURAL_LANGUAGE, description="查询类型")
     selected_theme_id: Optional[int] = Field(None, description="选择的数据主题ID")
     selected_table_ids: Optional[List[int]] = Field(default=[], description="选择的表ID列表")
+    preview: Optional[bool] = Field(None, description="是否先返回预览结果（前N行或抽样近似），精确结果就绪后推送")
     
     @validator('user_question')
     def validate_user_question(cls, v):
@@ -156,7 +157,7 @@ class QueryFavoriteListParams(BaseListParams):
 # ========== 查询反馈相关 ==========
 class QueryFeedbackCreate(BaseCreateSchema):
     """提交查询反馈请求"""
-    task_id: int = Field(..., description="任务ID")
+    task_id: str = Field(..., description="任务UUID（提交查询时返回的task_id）")
     feedback_type: str = Field(..., description="反馈类型(good/bad/suggestion)")
     rating: Optional[int] = Field(None, ge=1, le=5, description="评分(1-5)")
     feedback_content: Optional[str] = Field(None, description="反馈内容")
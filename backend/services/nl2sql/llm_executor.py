@@ -0,0 +1,158 @@
+"""
+LLM调用执行器
+Vanna的SQL生成、向量检索和训练接口都是同步调用（OpenAI请求、ChromaDB读写），
+在独立的有界线程池中执行，避免一次LLM往返阻塞整个事件循环
+"""
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+from config.settings import get_settings
+from utils.logger import get_logger
+from utils.exceptions import LLMException
+
+logger = get_logger(__name__)
+
+
+class LLMExecutor:
+    """
+    LLM线程池执行器
+    
+    线程数即同时进行的LLM/向量库调用上限，超出的调用排队等待；
+    队列已满时直接拒绝，避免请求无限堆积
+    """
+    
+    def __init__(
+        self,
+        max_workers: int = 8,
+        max_queue_size: int = 100,
+        timeout: Optional[float] = None,
+        thread_name_prefix: str = "llm"
+    ):
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=thread_name_prefix
+        )
+        self._lock = threading.Lock()
+        
+        # 运行指标
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._max_queue_depth = 0
+        self._total_wait_ms = 0.0
+        self._total_run_ms = 0.0
+        # {操作名: 调用次数}
+        self._calls_by_operation: Dict[str, int] = {}
+    
+    async def run(self, operation: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        在工作线程中执行 func(*args, **kwargs)
+        
+        Args:
+            operation: 操作名，用于统计（如 generate_sql、train）
+            func: 同步函数
+        
+        Returns:
+            func的返回值
+        """
+        with self._lock:
+            if self._queued >= self.max_queue_size:
+                self._rejected += 1
+                raise LLMException(f"LLM调用队列已满（{self.max_queue_size}），请稍后重试")
+            self._queued += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queued)
+            self._calls_by_operation[operation] = self._calls_by_operation.get(operation, 0) + 1
+        
+        submitted_at = time.perf_counter()
+        call = functools.partial(func, *args, **kwargs)
+        
+        def task():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._total_wait_ms += (started_at - submitted_at) * 1000
+            
+            succeeded = False
+            try:
+                result = call()
+                succeeded = True
+                return result
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._total_run_ms += (time.perf_counter() - started_at) * 1000
+                    if succeeded:
+                        self._completed += 1
+                    else:
+                        self._failed += 1
+        
+        future = self._executor.submit(task)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            # 已开始的同步调用无法中断，只停止等待；尚未开始的直接取消
+            if future.cancel():
+                with self._lock:
+                    self._queued -= 1
+            with self._lock:
+                self._timed_out += 1
+            raise LLMException(f"LLM调用超时（{operation}，{self.timeout}秒）")
+        except asyncio.CancelledError:
+            # 尚未开始执行的任务随协程一起取消，并归还队列名额
+            if future.cancel():
+                with self._lock:
+                    self._queued -= 1
+            raise
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取线程池运行指标"""
+        with self._lock:
+            finished = self._completed + self._failed
+            started = finished + self._running
+            return {
+                "pool_size": self.max_workers,
+                "max_queue_size": self.max_queue_size,
+                "active_workers": self._running,
+                "queue_depth": self._queued,
+                "max_queue_depth": self._max_queue_depth,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "avg_wait_ms": round(self._total_wait_ms / started, 2) if started else 0.0,
+                "avg_run_ms": round(self._total_run_ms / finished, 2) if finished else 0.0,
+                "calls_by_operation": dict(self._calls_by_operation)
+            }
+    
+    def shutdown(self):
+        """关闭线程池（不等待仍在进行的LLM请求）"""
+        self._executor.shutdown(wait=False)
+        logger.info("LLM执行线程池已关闭")
+
+
+# 全局LLM执行器实例
+_llm_executor: Optional[LLMExecutor] = None
+
+
+def get_llm_executor() -> LLMExecutor:
+    """获取LLM执行器实例（单例模式）"""
+    global _llm_executor
+    if _llm_executor is None:
+        settings = get_settings()
+        _llm_executor = LLMExecutor(
+            max_workers=settings.LLM_MAX_CONCURRENCY,
+            max_queue_size=settings.LLM_MAX_QUEUE_SIZE,
+            timeout=settings.LLM_CALL_TIMEOUT or None
+        )
+    return _llm_executor
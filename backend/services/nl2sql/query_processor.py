@@ -3,15 +3,23 @@
 整合工作流引擎和Vanna服务，提供统一的查询处理接口
 """
 import uuid
+import time
 import asyncio
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Set, Coroutine
 from datetime import datetime
 
 from .workflow_engine import WorkflowEngine, WorkflowState
 from .vanna_service import get_vanna_service
+from .question_cache import QuestionCache, make_question_key
+from services.query_engine.query_registry import query_registry
+from services.query_engine.result_store import get_result_store
+from services.query_engine.scheduler import scheduling_scope, QueryLane
+from services.query_engine.engine_factory import get_connected_engine
+from services.websocket.manager import connection_manager
+from config.settings import get_settings
 from utils.logger import get_logger
-from utils.exceptions import NLQueryException, ValidationException
-from models.nlquery_models import TaskStatusEnum
+from utils.exceptions import NLQueryException, ValidationException, QueryCancelledException
+from models.nlquery_models import TaskStatusEnum, NodeStatusEnum, NodeTypeEnum
 
 logger = get_logger(__name__)
 
@@ -23,6 +31,16 @@ class QueryProcessor:
         self.workflow_engine = WorkflowEngine()
         self.vanna_service = get_vanna_service()
         self.active_tasks: Dict[str, Dict[str, Any]] = {}
+        # 后台任务的强引用，事件循环只持有弱引用，未引用的任务可能在完成前被回收
+        self._background_tasks: Set[asyncio.Task] = set()
+        
+        settings = get_settings()
+        self.question_cache: Optional[QuestionCache] = None
+        if settings.NL2SQL_QUESTION_CACHE_ENABLED:
+            self.question_cache = QuestionCache(
+                max_entries=settings.NL2SQL_QUESTION_CACHE_MAX_ENTRIES,
+                ttl=settings.NL2SQL_QUESTION_CACHE_TTL
+            )
     
     async def submit_query(
         self,
@@ -30,7 +48,9 @@ class QueryProcessor:
         user_id: int,
         selected_theme_id: Optional[int] = None,
         selected_table_ids: Optional[List[int]] = None,
-        query_type: str = "natural_language"
+        query_type: str = "natural_language",
+        preview: Optional[bool] = None,
+        user_roles: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         """
         提交查询请求
@@ -41,6 +61,8 @@ class QueryProcessor:
             selected_theme_id: 选择的数据主题ID
             selected_table_ids: 选择的表ID列表
             query_type: 查询类型
+            preview: 是否先返回预览结果，为空时使用全局配置
+            user_roles: 用户角色列表，作为问题缓存的用户范围
             
         Returns:
             查询任务信息
@@ -54,6 +76,11 @@ class QueryProcessor:
                 user_question, user_id, selected_theme_id, selected_table_ids
             )
             
+            # 第一级问题缓存：规范化问题和用户范围完全一致时复用上次的最终SQL
+            cache_key, cached_sql, cache_log = self._lookup_question_cache(
+                user_question, selected_theme_id, selected_table_ids, user_roles
+            )
+            
             # 创建初始状态
             initial_state = WorkflowState(
                 task_id=task_id,
@@ -67,14 +94,18 @@ class QueryProcessor:
                 error_code=None,
                 generated_sql=None,
                 final_sql=None,
+                cached_sql=cached_sql,
+                semantic_cache_hit=False,
+                execution_row_limit=None,
                 sql_validation_result=None,
+                preview_mode=get_settings().QUERY_PREVIEW_ENABLED if preview is None else preview,
                 execution_result=None,
                 result_row_count=None,
                 result_columns=None,
                 result_data=None,
                 llm_messages=[],
                 llm_tokens_used=0,
-                node_execution_log=[],
+                node_execution_log=[cache_log] if cache_log else [],
                 retry_count=0,
                 max_retries=3
             )
@@ -87,21 +118,27 @@ class QueryProcessor:
                 "query_type": query_type,
                 "status": TaskStatusEnum.PENDING.value,
                 "created_at": datetime.now(),
+                "question_cache_key": cache_key,
+                "cached_sql": cached_sql,
                 "state": initial_state
             }
             
             self.active_tasks[task_id] = task_info
             
             # 异步执行工作流
-            asyncio.create_task(self._execute_query_workflow(task_id, initial_state))
+            self._spawn(self._execute_query_workflow(task_id, initial_state))
             
             logger.info(f"查询任务已提交，任务ID: {task_id}")
             
-            return {
+            result = {
                 "task_id": task_id,
                 "status": TaskStatusEnum.PENDING.value,
-                "message": "查询任务已提交，正在处理中..."
+                "message": "查询任务已提交，正在处理中...",
+                "cache_hit": cached_sql is not None
             }
+            if cached_sql is not None:
+                result["final_sql"] = cached_sql
+            return result
             
         except Exception as e:
             logger.error(f"提交查询失败: {e}")
@@ -212,11 +249,15 @@ class QueryProcessor:
             task_info["state"]["current_step"] = "任务已取消"
             task_info["state"]["error_message"] = "用户取消了任务"
             
-            logger.info(f"任务已取消: {task_id}")
+            # 中断引擎中正在执行的语句，释放CPU和连接
+            interrupted = await query_registry.cancel(task_id)
+            
+            logger.info(f"任务已取消: {task_id}，中断语句数: {interrupted}")
             
             return {
                 "task_id": task_id,
                 "status": TaskStatusEnum.CANCELLED.value,
+                "interrupted_statements": interrupted,
                 "message": "任务已取消"
             }
             
@@ -293,31 +334,178 @@ class QueryProcessor:
             # 集成Vanna服务到工作流状态
             initial_state["vanna_service"] = self.vanna_service
             
-            # 执行工作流
-            final_state = await self.workflow_engine.execute_workflow(initial_state)
+            # 执行工作流，引擎通过任务范围登记运行中的语句以支持取消，按用户在交互通道排队
+            with query_registry.task_scope(task_id), scheduling_scope(initial_state["user_id"], QueryLane.INTERACTIVE):
+                final_state = await self.workflow_engine.execute_workflow(initial_state)
             
             # 判断执行结果
-            if final_state.get("error_message"):
+            if self.active_tasks[task_id]["status"] == TaskStatusEnum.CANCELLED.value:
+                logger.info(f"查询工作流已取消: {task_id}")
+            elif final_state.get("error_message"):
                 self.active_tasks[task_id]["status"] = TaskStatusEnum.FAILED.value
                 logger.error(f"查询工作流执行失败: {task_id}, 错误: {final_state['error_message']}")
+                self._forget_cached_question(task_id)
+                # 复用的语义缓存SQL执行失败时同时删除该条目
+                if final_state.get("semantic_cache_hit"):
+                    self.vanna_service.invalidate_cached_sql(sql=final_state.get("final_sql"))
             else:
                 self.active_tasks[task_id]["status"] = TaskStatusEnum.SUCCESS.value
                 logger.info(f"查询工作流执行成功: {task_id}")
+                
+                # 执行成功的问题和SQL写入语义缓存，相似问题可跳过LLM
+                await self.vanna_service.record_validated_sql(
+                    final_state["user_question"],
+                    final_state.get("final_sql"),
+                    final_state["user_id"],
+                    final_state.get("selected_theme_id"),
+                    final_state.get("selected_table_ids")
+                )
+                self._remember_question_sql(task_id, final_state.get("final_sql"))
             
             # 更新最终状态
             self.active_tasks[task_id]["state"] = final_state
             
+            # 返回的是预览结果时，在后台计算精确结果和总行数
+            execution_result = final_state.get("execution_result") or {}
+            if (self.active_tasks[task_id]["status"] == TaskStatusEnum.SUCCESS.value
+                    and execution_result.get("metadata", {}).get("preview_exact") is False):
+                self._spawn(self._complete_exact_result(task_id, WorkflowEngine.execution_sql(final_state)))
+            
             # TODO: 将结果保存到数据库
             await self._save_task_result(task_id, final_state)
             
         except Exception as e:
             logger.error(f"查询工作流执行异常: {task_id}, 错误: {e}")
             
-            # 更新错误状态
-            self.active_tasks[task_id]["status"] = TaskStatusEnum.FAILED.value
+            # 更新错误状态（已取消的任务保持取消状态）
+            if self.active_tasks[task_id]["status"] != TaskStatusEnum.CANCELLED.value:
+                self.active_tasks[task_id]["status"] = TaskStatusEnum.FAILED.value
+                self._forget_cached_question(task_id)
             self.active_tasks[task_id]["state"]["error_message"] = str(e)
             self.active_tasks[task_id]["state"]["current_step"] = "执行失败"
             
+    def _spawn(self, coro: Coroutine) -> asyncio.Task:
+        """创建后台任务并保留引用，完成后自动移除"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+    
+    def _lookup_question_cache(
+        self,
+        user_question: str,
+        selected_theme_id: Optional[int],
+        selected_table_ids: Optional[List[int]],
+        user_roles: Optional[List[str]]
+    ) -> tuple:
+        """
+        查找问题缓存
+        
+        Returns:
+            (缓存键, 命中的SQL, 节点执行记录)，未启用缓存时均为None
+        """
+        if self.question_cache is None:
+            return None, None, None
+        
+        started_at = datetime.now()
+        start = time.perf_counter()
+        cache_key = make_question_key(user_question, selected_theme_id, selected_table_ids, user_roles)
+        entry = self.question_cache.get(cache_key)
+        lookup_us = round((time.perf_counter() - start) * 1e6, 1)
+        
+        cache_log = {
+            "node_name": "问题缓存",
+            "node_type": NodeTypeEnum.SQL_GENERATION.value,
+            "status": NodeStatusEnum.SUCCESS.value,
+            "start_time": started_at.isoformat(),
+            "end_time": datetime.now().isoformat(),
+            "input_data": {"canonical_question": cache_key[0]},
+            "output_message": f"命中问题缓存（来源任务: {entry.task_id}）" if entry else "未命中问题缓存",
+            "cache_hit": entry is not None,
+            "lookup_us": lookup_us,
+            "hit_rate": self.question_cache.hit_rate
+        }
+        if entry is not None:
+            logger.info(f"问题缓存命中，复用SQL，耗时 {lookup_us}us: {user_question}")
+        return cache_key, entry.sql if entry else None, cache_log
+    
+    def _remember_question_sql(self, task_id: str, final_sql: Optional[str]):
+        """执行成功的最终SQL写入问题缓存；复用缓存SQL成功时保持原条目"""
+        task_info = self.active_tasks[task_id]
+        cache_key = task_info.get("question_cache_key")
+        if self.question_cache is None or cache_key is None or not final_sql:
+            return
+        if final_sql != task_info.get("cached_sql"):
+            self.question_cache.put(cache_key, final_sql, task_id)
+    
+    def _forget_cached_question(self, task_id: str):
+        """复用的缓存SQL执行失败时删除该条目，下次重新生成"""
+        task_info = self.active_tasks[task_id]
+        if self.question_cache is not None and task_info.get("cached_sql"):
+            self.question_cache.invalidate(key=task_info.get("question_cache_key"))
+    
+    def invalidate_cached_sql(self, question: Optional[str] = None, sql: Optional[str] = None) -> int:
+        """删除问题缓存和语义缓存中的问题或SQL（用户负面反馈时调用）"""
+        count = 0
+        if self.question_cache is not None:
+            count += self.question_cache.invalidate(question=question, sql=sql)
+        return count + self.vanna_service.invalidate_cached_sql(question=question, sql=sql)
+    
+    def invalidate_task_sql(self, task_id: str) -> int:
+        """删除任务的问题和最终SQL在问题缓存及语义缓存中的条目（用户对该任务负面反馈时调用）"""
+        if task_id not in self.active_tasks:
+            raise NLQueryException(f"任务 {task_id} 不存在")
+        
+        task_info = self.active_tasks[task_id]
+        return self.invalidate_cached_sql(
+            question=task_info["user_question"],
+            sql=task_info["state"].get("final_sql")
+        )
+    
+    def get_question_cache_stats(self) -> Dict[str, Any]:
+        """获取问题缓存统计信息"""
+        if self.question_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.question_cache.get_stats()}
+    
+    async def _complete_exact_result(self, task_id: str, sql: str):
+        """后台执行完整查询，替换任务的预览结果，并通过WebSocket推送精确结果已就绪"""
+        task_info = self.active_tasks[task_id]
+        try:
+            engine = await get_connected_engine()
+            
+            # 完整查询在批量通道排队，不挤占交互查询；仍登记在任务下，取消任务时一并中断
+            with query_registry.task_scope(task_id), scheduling_scope(task_info["user_id"], QueryLane.BATCH):
+                query_result = await engine.execute_query(sql)
+            
+            if task_info["status"] == TaskStatusEnum.CANCELLED.value:
+                return
+            
+            result = await self.workflow_engine.store_execution_result(task_id, query_result)
+            task_info["state"].update({
+                "execution_result": result,
+                "result_row_count": query_result.row_count,
+                "result_columns": query_result.columns,
+                "result_data": query_result.get_rows(0, 100)
+            })
+            
+            await connection_manager.notify_task_update(task_id, {
+                "type": "exact_result_ready",
+                "row_count": query_result.row_count,
+                "columns": query_result.columns,
+                "execution_time_ms": query_result.execution_time_ms
+            })
+            logger.info(f"精确结果已就绪: {task_id}，共 {query_result.row_count} 行")
+            
+        except QueryCancelledException:
+            logger.info(f"精确结果计算已取消: {task_id}")
+        except Exception as e:
+            logger.error(f"精确结果计算失败: {task_id}, 错误: {e}")
+            await connection_manager.notify_task_update(task_id, {
+                "type": "exact_result_error",
+                "error_message": str(e)
+            })
+    
     async def _save_task_result(self, task_id: str, final_state: WorkflowState):
         """保存任务结果到数据库"""
         try:
@@ -351,11 +539,16 @@ class QueryProcessor:
                 ] and task_age.total_seconds() > max_age_hours * 3600):
                     tasks_to_remove.append(task_id)
             
-            # 删除过期任务
+            # 删除过期任务及其落盘结果
+            result_store = get_result_store()
             for task_id in tasks_to_remove:
                 del self.active_tasks[task_id]
+                result_store.delete(task_id)
                 logger.info(f"清理过期任务: {task_id}")
             
+            # 清理进程重启等原因遗留的结果文件
+            result_store.cleanup(max_age_hours)
+            
             if tasks_to_remove:
                 logger.info(f"清理了 {len(tasks_to_remove)} 个过期任务")
                 
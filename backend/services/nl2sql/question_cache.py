@@ -0,0 +1,199 @@
+"""
+问题精确缓存
+查询提交时的第一级缓存：问题经繁简转换、全半角和空白规范化后，连同用户范围
+（数据主题、选择的表、角色）作为键，完全一致时直接复用上次执行成功的最终SQL
+"""
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, Iterable
+
+try:
+    from opencc import OpenCC
+except ImportError:  # 未安装OpenCC时使用内置常用字对照表
+    OpenCC = None
+
+from services.query_engine.result_cache import normalize_sql
+from utils.logger import get_logger
+from .sql_cache import normalize_question
+
+logger = get_logger(__name__)
+
+# 内置繁体→简体常用字对照表，覆盖业务查询中的常见用字，两行字符一一对应
+_TRADITIONAL_CHARS = (
+    "統計訂單數據額銷個區們這過與時間麼佔總產類戶員門價錢貨庫廠場東開關務業績報會資來"
+    "對為當後還從進運輸發變動長點幾條筆張歲齡週號碼擇選顯實際預測較環傳網絡頁萬億貴買"
+    "賣費種參並嗎裡裏應該沒於將讓給請問題詢記錄狀態倉帳賬圖書學師醫藥電話郵縣鎮鄉國級"
+    "層歷曆隨機構組織權標準確認證異錯誤舊現況淨潤損虧餘紀專項負責結續團隊獎勵優積漲趨"
+    "勢匯細節達滿調覽瀏訪轉換擊廣採購車輛線鐵飛樓廳診療險銀貸賠償稅錶鐘內兩舉體義邊處"
+    "創聯戰擁則質頭誰讀寫說語詞氣馬魚鳥龍風雲陽陰聽寶貿賺貼財賴順須頻顧領導獲營寬紅綠"
+    "藍黃齊齒鮮雞鴨豬飯飲館衛視規觀覺親離難雙雜雖響頂頓願驗驅髮鬆麵倆偉側備傢傭債傷僅"
+    "兒凍劃劇劑勞勝協卻厲吳啟嚴圍園圓塊壓壞壯壽夢奪奮婦孫寧屆屬島幣廢彈徑徵慶憂憶懷戲"
+    "執掃掛搖擋擔擬擴攝敗敵斷昇暫曉朧棄棟楊樂樣橋檔檢櫃歐殘殺毀決沖溝滅滬漢濟濃灣災無"
+    "煙熱爭爺牆犧獨獵瑣畢畫盡監盤礎禮禍稱穩競範築簡簽糧紛終絕綜維緊編緣縮繼纖罰罷羅聖"
+    "聲職腦膠臨莊華葉蘇蘭蟲術衝補製複襲觸訓設許評試誌誠課論諮講謝識議護讚貝貢販貯賀賃"
+    "賓賞賦贈贏趕跡踐軌軍軟載輕輔輩辦農迴連遊遠適遲遷遺鄰醜釋針鈔銳鍵鎖鏈鑰閉閒閱闆陣"
+    "陳陸隱靈靜韓頒頗顏飄鬧麗"
+)
+_SIMPLIFIED_CHARS = (
+    "统计订单数据额销个区们这过与时间么占总产类户员门价钱货库厂场东开关务业绩报会资来"
+    "对为当后还从进运输发变动长点几条笔张岁龄周号码择选显实际预测较环传网络页万亿贵买"
+    "卖费种参并吗里里应该没于将让给请问题询记录状态仓账账图书学师医药电话邮县镇乡国级"
+    "层历历随机构组织权标准确认证异错误旧现况净润损亏余纪专项负责结续团队奖励优积涨趋"
+    "势汇细节达满调览浏访转换击广采购车辆线铁飞楼厅诊疗险银贷赔偿税表钟内两举体义边处"
+    "创联战拥则质头谁读写说语词气马鱼鸟龙风云阳阴听宝贸赚贴财赖顺须频顾领导获营宽红绿"
+    "蓝黄齐齿鲜鸡鸭猪饭饮馆卫视规观觉亲离难双杂虽响顶顿愿验驱发松面俩伟侧备家佣债伤仅"
+    "儿冻划剧剂劳胜协却厉吴启严围园圆块压坏壮寿梦夺奋妇孙宁届属岛币废弹径征庆忧忆怀戏"
+    "执扫挂摇挡担拟扩摄败敌断升暂晓胧弃栋杨乐样桥档检柜欧残杀毁决冲沟灭沪汉济浓湾灾无"
+    "烟热争爷墙牺独猎琐毕画尽监盘础礼祸称稳竞范筑简签粮纷终绝综维紧编缘缩继纤罚罢罗圣"
+    "声职脑胶临庄华叶苏兰虫术冲补制复袭触训设许评试志诚课论咨讲谢识议护赞贝贡贩贮贺赁"
+    "宾赏赋赠赢赶迹践轨军软载轻辅辈办农回连游远适迟迁遗邻丑释针钞锐键锁链钥闭闲阅板阵"
+    "陈陆隐灵静韩颁颇颜飘闹丽"
+)
+_T2S_TABLE = str.maketrans(_TRADITIONAL_CHARS, _SIMPLIFIED_CHARS)
+
+# NFKC不处理的中文标点统一为半角形式，书名号直接去掉
+_CJK_PUNCTUATION_TABLE = str.maketrans({
+    "。": ".", "、": ",", "·": " ", "—": "-", "…": ".",
+    "「": '"', "」": '"', "『": '"', "』": '"', "“": '"', "”": '"', "‘": "'", "’": "'",
+    "《": None, "》": None
+})
+
+# 中文字符两侧的空白不影响语义（"统计 订单" 与 "统计订单" 视为同一问题）
+_CJK_SPACE_PATTERN = re.compile(r"\s*([㐀-鿿])\s*")
+
+_converter = None
+
+
+def _to_simplified(text: str) -> str:
+    """繁体转简体，安装了OpenCC时使用其完整词典"""
+    global _converter
+    if OpenCC is not None:
+        if _converter is None:
+            try:
+                _converter = OpenCC("t2s")
+            except Exception as e:
+                logger.warning(f"OpenCC初始化失败，使用内置繁简对照表: {e}")
+                _converter = False
+        if _converter:
+            return _converter.convert(text)
+    return text.translate(_T2S_TABLE)
+
+
+def canonicalize_question(question: str) -> str:
+    """规范化问题文本：繁体转简体、统一全半角标点、去掉中文两侧空白、去掉末尾标点"""
+    text = _to_simplified(question or "").translate(_CJK_PUNCTUATION_TABLE)
+    text = normalize_question(text)
+    return _CJK_SPACE_PATTERN.sub(r"\1", text)
+
+
+def make_question_key(
+    question: str,
+    theme_id: Optional[int],
+    table_ids: Optional[Iterable[int]],
+    roles: Optional[Iterable[str]]
+) -> Tuple[str, Optional[int], Tuple[int, ...], Tuple[str, ...]]:
+    """缓存键：规范化问题 + 数据主题 + 选择的表 + 用户角色"""
+    return (
+        canonicalize_question(question),
+        theme_id,
+        tuple(sorted(set(table_ids or []))),
+        tuple(sorted(set(roles or [])))
+    )
+
+
+class QuestionCacheEntry:
+    """缓存条目"""
+    
+    def __init__(self, sql: str, task_id: Optional[str]):
+        self.sql = sql
+        self.task_id = task_id
+        self.created_at = time.time()
+        self.hits = 0
+
+
+class QuestionCache:
+    """
+    问题精确缓存
+    
+    只做字典查找，不计算向量也不访问元数据，命中开销在微秒级；
+    条目按LRU淘汰并有过期时间，复用的SQL仍会经过验证节点
+    """
+    
+    def __init__(self, max_entries: int = 10000, ttl: int = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, QuestionCacheEntry]" = OrderedDict()
+        
+        # 统计信息
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+    
+    def get(self, key: tuple) -> Optional[QuestionCacheEntry]:
+        """按缓存键查找，过期条目直接删除"""
+        entry = self._entries.get(key)
+        if entry is not None and self.ttl and time.time() - entry.created_at > self.ttl:
+            self._remove(key)
+            entry = None
+        
+        if entry is None:
+            self._misses += 1
+            return None
+        
+        entry.hits += 1
+        self._hits += 1
+        self._entries.move_to_end(key)
+        return entry
+    
+    def put(self, key: tuple, sql: str, task_id: Optional[str] = None):
+        """写入执行成功的最终SQL"""
+        if not sql:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = QuestionCacheEntry(sql, task_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def invalidate(
+        self,
+        key: Optional[tuple] = None,
+        question: Optional[str] = None,
+        sql: Optional[str] = None
+    ) -> int:
+        """删除指定键、指定问题（任意用户范围）或指定SQL的条目（复用失败或收到负面反馈时调用）"""
+        canonical = canonicalize_question(question) if question is not None else None
+        normalized_sql = normalize_sql(sql).lower() if sql else None
+        keys = [
+            cache_key for cache_key, entry in self._entries.items()
+            if (key is not None and cache_key == key)
+            or (canonical is not None and cache_key[0] == canonical)
+            or (normalized_sql is not None and normalize_sql(entry.sql).lower() == normalized_sql)
+        ]
+        for cache_key in keys:
+            self._remove(cache_key)
+        return len(keys)
+    
+    def clear(self):
+        """清空缓存"""
+        self._invalidations += len(self._entries)
+        self._entries.clear()
+    
+    def _remove(self, key: tuple):
+        if self._entries.pop(key, None) is not None:
+            self._invalidations += 1
+    
+    @property
+    def hit_rate(self) -> float:
+        lookups = self._hits + self._misses
+        return round(self._hits / lookups, 4) if lookups else 0.0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            "entries": len(self._entries),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self.hit_rate,
+            "invalidations": self._invalidations
+        }
@@ -0,0 +1,265 @@
+"""
+语义SQL缓存
+问题规范化后计算向量，与已验证的（问题, SQL, 涉及表）条目比较余弦相似度，
+超过阈值、问题中的数字和日期一致且涉及的表均可访问、表结构未变化时直接返回缓存的SQL，跳过LLM调用
+"""
+import hashlib
+import json
+import math
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple, Iterable, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # 未安装numpy时逐条计算相似度
+    np = None
+
+from services.query_engine.result_cache import extract_tables, normalize_sql
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 问题末尾不影响语义的标点（已经过全角转半角）
+_TRAILING_PUNCTUATION = "?？!！.。~～ "
+
+# 问题中的字面量：数字和日期（2023、2024-01-05、3.5）、中文数字、相对日期（去年、上个月、本周）。
+# 只有字面量不同的两个问题向量几乎相同，语义命中时要求字面量完全一致
+_LITERAL_PATTERN = re.compile(
+    r"\d+(?:[.:/-]\d+)*"
+    r"|[零〇一二两三四五六七八九十百千万亿]+"
+    r"|[今昨去前明本上下]个?(?:年|季度|月|周|天|日)"
+)
+
+
+def normalize_question(question: str) -> str:
+    """规范化问题文本：全角转半角、小写、合并空白、去掉末尾标点"""
+    text = unicodedata.normalize("NFKC", question or "").lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+
+def extract_question_literals(normalized_question: str) -> Tuple[str, ...]:
+    """提取规范化问题中的数字和日期字面量（排序后的元组，保留重复）"""
+    return tuple(sorted(_LITERAL_PATTERN.findall(normalized_question)))
+
+
+def table_fingerprint(table: Dict[str, Any]) -> str:
+    """表结构指纹：表名、字段名和字段类型变化时随之变化"""
+    fields = sorted(
+        (field.get("field_name_en", ""), field.get("field_type", ""))
+        for field in table.get("fields", [])
+    )
+    payload = json.dumps([table.get("table_name_en", ""), fields], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _unit_vector(embedding: Sequence[float]) -> List[float]:
+    """归一化为单位向量，相似度计算只需点积"""
+    norm = math.sqrt(sum(value * value for value in embedding)) or 1.0
+    return [value / norm for value in embedding]
+
+
+class SQLCacheEntry:
+    """缓存条目"""
+    
+    def __init__(
+        self,
+        question: str,
+        normalized_question: str,
+        sql: str,
+        table_fingerprints: Dict[str, str],
+        embedding: List[float]
+    ):
+        self.question = question
+        self.normalized_question = normalized_question
+        self.literals = extract_question_literals(normalized_question)
+        self.sql = sql
+        # {表名（小写）: 写入时的表结构指纹}
+        self.table_fingerprints = table_fingerprints
+        self.embedding = embedding
+        self.created_at = time.time()
+        self.hits = 0
+
+
+class SemanticSQLCache:
+    """
+    语义SQL缓存
+    
+    条目按LRU淘汰；查找时先按规范化问题精确匹配，再按向量相似度匹配，
+    相似度匹配还要求问题中的数字和日期完全一致。条目只在SQL涉及的表都在当前可访问范围内时可用，表结构指纹不一致的条目直接删除
+    """
+    
+    def __init__(self, similarity_threshold: float = 0.92, max_entries: int = 5000, ttl: int = 7 * 86400):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # {规范化问题: 条目}
+        self._entries: "OrderedDict[str, SQLCacheEntry]" = OrderedDict()
+        # numpy可用时缓存条目向量矩阵，条目变化后重建
+        self._matrix = None
+        self._matrix_keys: List[str] = []
+        
+        # 统计信息
+        self._exact_hits = 0
+        self._semantic_hits = 0
+        self._misses = 0
+        self._invalidations = 0
+    
+    def get_exact(self, normalized_question: str, accessible: Dict[str, str]) -> Optional[SQLCacheEntry]:
+        """按规范化问题精确查找"""
+        entry = self._entries.get(normalized_question)
+        if entry is None or not self._is_usable(entry, accessible):
+            return None
+        self._record_hit(entry)
+        self._exact_hits += 1
+        return entry
+    
+    def search(
+        self,
+        embedding: Sequence[float],
+        accessible: Dict[str, str],
+        normalized_question: str
+    ) -> Optional[Tuple[SQLCacheEntry, float]]:
+        """
+        按向量相似度查找
+        
+        Args:
+            embedding: 问题向量
+            accessible: 当前可访问表 {表名（小写）: 表结构指纹}
+            normalized_question: 规范化问题，用于比较数字和日期字面量
+        
+        Returns:
+            (条目, 相似度)，没有超过阈值且字面量一致的可用条目时返回None
+        """
+        query = _unit_vector(embedding)
+        literals = extract_question_literals(normalized_question)
+        for key, similarity in self._rank(query):
+            if similarity < self.similarity_threshold:
+                break
+            entry = self._entries.get(key)
+            if entry is None or entry.literals != literals:
+                continue
+            if self._is_usable(entry, accessible):
+                self._record_hit(entry)
+                self._semantic_hits += 1
+                return entry, similarity
+        
+        self._misses += 1
+        return None
+    
+    def _rank(self, query: List[float]) -> List[Tuple[str, float]]:
+        """按相似度从高到低排列全部条目"""
+        if not self._entries:
+            return []
+        
+        if np is not None:
+            if self._matrix is None:
+                self._matrix_keys = list(self._entries)
+                self._matrix = np.array([self._entries[key].embedding for key in self._matrix_keys])
+            scores = self._matrix @ np.array(query)
+            order = np.argsort(-scores)
+            return [(self._matrix_keys[index], float(scores[index])) for index in order]
+        
+        scored = [
+            (key, sum(a * b for a, b in zip(entry.embedding, query)))
+            for key, entry in self._entries.items()
+        ]
+        return sorted(scored, key=lambda item: -item[1])
+    
+    def _is_usable(self, entry: SQLCacheEntry, accessible: Dict[str, str]) -> bool:
+        """条目涉及的表均可访问且结构未变化；过期或结构已变化的条目删除"""
+        if self.ttl and time.time() - entry.created_at > self.ttl:
+            self._remove(entry.normalized_question)
+            return False
+        
+        for table, fingerprint in entry.table_fingerprints.items():
+            if table not in accessible:
+                return False
+            if accessible[table] != fingerprint:
+                logger.info(f"表 {table} 结构已变化，SQL缓存条目失效: {entry.question}")
+                self._remove(entry.normalized_question)
+                return False
+        return True
+    
+    def _record_hit(self, entry: SQLCacheEntry):
+        entry.hits += 1
+        self._entries.move_to_end(entry.normalized_question)
+    
+    def put(
+        self,
+        question: str,
+        normalized_question: str,
+        sql: str,
+        accessible: Dict[str, str],
+        embedding: Sequence[float]
+    ) -> bool:
+        """
+        写入已验证的SQL
+        
+        Returns:
+            是否写入；SQL引用了不可访问的表或无法识别涉及的表时不写入
+        """
+        tables = {table.split(".")[-1] for table in extract_tables(sql)}
+        if not tables or not tables <= set(accessible):
+            return False
+        
+        self._remove(normalized_question)
+        self._entries[normalized_question] = SQLCacheEntry(
+            question,
+            normalized_question,
+            sql,
+            {table: accessible[table] for table in tables},
+            _unit_vector(embedding)
+        )
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._matrix = None
+        return True
+    
+    def invalidate(self, question: Optional[str] = None, sql: Optional[str] = None) -> int:
+        """删除指定问题或指定SQL的条目（如收到负面反馈）"""
+        normalized_sql = normalize_sql(sql).lower() if sql else None
+        keys = [
+            key for key, entry in self._entries.items()
+            if (question is not None and key == normalize_question(question))
+            or (normalized_sql is not None and normalize_sql(entry.sql).lower() == normalized_sql)
+        ]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+    
+    def invalidate_tables(self, tables: Iterable[str]) -> int:
+        """删除涉及指定表的条目（表元数据变更时调用）"""
+        names = {table.lower() for table in tables}
+        keys = [key for key, entry in self._entries.items() if names & set(entry.table_fingerprints)]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+    
+    def clear(self):
+        """清空缓存"""
+        self._invalidations += len(self._entries)
+        self._entries.clear()
+        self._matrix = None
+    
+    def _remove(self, key: str):
+        if self._entries.pop(key, None) is not None:
+            self._invalidations += 1
+            self._matrix = None
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        hits = self._exact_hits + self._semantic_hits
+        lookups = hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self._exact_hits,
+            "semantic_hits": self._semantic_hits,
+            "misses": self._misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self._invalidations,
+            "similarity_threshold": self.similarity_threshold
+        }
@@ -0,0 +1,100 @@
+"""
+流式SQL拼装
+逐段接收LLM流式输出，提取当前已生成的SQL片段，并在语句完整时立即给出完整SQL，
+使语法预检不必等待整个回复结束
+"""
+import re
+from typing import Optional
+
+_FENCE = "```"
+
+# 没有代码块时，SQL从第一个以 SELECT / WITH 开头的行开始
+_SQL_START_PATTERN = re.compile(r"^[ \t]*(?:SELECT|WITH)\b", re.IGNORECASE | re.MULTILINE)
+
+
+def _find_statement_end(text: str) -> int:
+    """返回第一个不在引号内的分号位置，没有时返回-1"""
+    quote = None
+    for index, char in enumerate(text):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"', "`"):
+            quote = char
+        elif char == ";":
+            return index
+    return -1
+
+
+class SQLStreamAssembler:
+    """
+    流式SQL拼装器
+    
+    LLM回复可能是纯SQL，也可能是 ```sql 代码块加说明文字；
+    SQL从代码块或第一个 SELECT / WITH 行开始，之前的说明文字不计入，
+    代码块闭合或出现语句结束分号时视为语句完整
+    """
+    
+    def __init__(self):
+        self.text = ""
+        self.complete_sql: Optional[str] = None
+    
+    def feed(self, fragment: str) -> bool:
+        """
+        追加一段输出
+        
+        Returns:
+            本次追加后语句是否首次变为完整
+        """
+        self.text += fragment
+        if self.complete_sql is not None:
+            return False
+        
+        body, closed = self._sql_body()
+        end = _find_statement_end(body)
+        if end >= 0:
+            self.complete_sql = body[:end + 1].strip()
+        elif closed and body.strip():
+            self.complete_sql = body.strip()
+        return self.complete_sql is not None
+    
+    @property
+    def partial_sql(self) -> str:
+        """当前已生成的SQL（去掉代码块标记）"""
+        if self.complete_sql is not None:
+            return self.complete_sql
+        return self._sql_body()[0].strip()
+    
+    def finish(self) -> str:
+        """
+        输出结束，按完整回复重新提取最终SQL
+        
+        提前给出的完整SQL可能来自代码块出现之前的 SELECT 行，以完整回复为准；
+        语句未以分号或代码块闭合时取全部SQL内容
+        """
+        body = self._sql_body()[0]
+        end = _find_statement_end(body)
+        self.complete_sql = (body[:end + 1] if end >= 0 else body).strip()
+        return self.complete_sql
+    
+    def _sql_body(self) -> tuple:
+        """返回 (SQL内容, 代码块是否已闭合)"""
+        start = self.text.find(_FENCE)
+        if start < 0:
+            # 代码块之前的说明文字不是SQL；末尾可能是尚未输出完整的代码块标记
+            match = _SQL_START_PATTERN.search(self.text)
+            if match is None:
+                return "", False
+            return self.text[match.start():].rstrip("`"), False
+        
+        # 跳过代码块语言标记所在行；标记行尚未输出完整时还没有SQL内容
+        newline = self.text.find("\n", start)
+        if newline < 0:
+            return "", False
+        body = self.text[newline + 1:]
+        
+        end = body.find(_FENCE)
+        if end < 0:
+            # 末尾可能是尚未输出完整的闭合标记
+            return body.rstrip("`"), False
+        return body[:end], True
@@ -4,13 +4,20 @@ Vanna框架服务实现
 """
 import os
 import json
-from typing import List, Dict, Any, Optional
+import asyncio
+import threading
+from typing import List, Dict, Any, Optional, Callable
 from pathlib import Path
 
 import vanna
 from vanna.chromadb import ChromaDB_VectorStore
 from vanna.openai import OpenAI_Chat
 
+from .sql_cache import SemanticSQLCache, normalize_question, table_fingerprint
+from .llm_executor import get_llm_executor
+from .sql_stream import SQLStreamAssembler
+from services.query_engine.engine_factory import get_connected_engine
+from services.websocket.manager import connection_manager
 from utils.logger import get_logger
 from utils.exceptions import VectorDBException, LLMException, AuthorizationException
 from config.settings import get_settings
@@ -36,6 +43,16 @@ class VannaService:
     def __init__(self):
         self.settings = get_settings()
         self.vanna_client = None
+        # Vanna的LLM和向量库接口都是同步调用，统一在有界线程池中执行
+        self.executor = get_llm_executor()
+        # 语义SQL缓存：相似问题直接复用已验证的SQL
+        self.sql_cache: Optional[SemanticSQLCache] = None
+        if self.settings.NL2SQL_CACHE_ENABLED:
+            self.sql_cache = SemanticSQLCache(
+                similarity_threshold=self.settings.NL2SQL_CACHE_SIMILARITY_THRESHOLD,
+                max_entries=self.settings.NL2SQL_CACHE_MAX_ENTRIES,
+                ttl=self.settings.NL2SQL_CACHE_TTL
+            )
         self._initialize_vanna()
     
     def _initialize_vanna(self):
@@ -68,7 +85,9 @@ class VannaService:
         question: str, 
         user_id: int,
         theme_id: Optional[int] = None,
-        table_ids: Optional[List[int]] = None
+        table_ids: Optional[List[int]] = None,
+        task_id: Optional[str] = None,
+        use_cache: bool = True
     ) -> Dict[str, Any]:
         """
         生成SQL查询
@@ -78,6 +97,8 @@ class VannaService:
             user_id: 用户ID
             theme_id: 数据主题ID（可选）
             table_ids: 指定的表ID列表（可选）
+            task_id: 查询任务ID（可选），提供时通过WebSocket流式推送生成中的SQL
+            use_cache: 是否查找语义缓存，缓存SQL未通过验证而重新生成时为False
             
         Returns:
             包含SQL和相关信息的字典
@@ -96,10 +117,17 @@ class VannaService:
             # 构建上下文信息
             context_info = await self._build_context_info(accessible_tables)
             
-            # 调用Vanna生成SQL
-            sql_result = await self._call_vanna_generate_sql(
-                question, context_info
-            )
+            # 语义缓存命中时直接使用已验证的SQL，否则调用Vanna生成SQL
+            sql_result = await self._lookup_cached_sql(question, accessible_tables) if use_cache else None
+            if sql_result is None:
+                if task_id and self.settings.LLM_STREAMING_ENABLED:
+                    sql_result = await self._call_vanna_generate_sql_stream(
+                        question, context_info, task_id
+                    )
+                else:
+                    sql_result = await self._call_vanna_generate_sql(
+                        question, context_info
+                    )
             
             # 后处理和验证
             processed_result = await self._post_process_sql(
@@ -125,7 +153,7 @@ class VannaService:
             logger.info(f"开始训练文档，类型: {doc_type}")
             
             # 训练文档
-            self.vanna_client.train(documentation=doc_content)
+            await self.executor.run("train", self.vanna_client.train, documentation=doc_content)
             
             logger.info(f"文档训练完成，类型: {doc_type}")
             
@@ -144,7 +172,7 @@ class VannaService:
             logger.info(f"开始训练DDL，数量: {len(ddl_statements)}")
             
             for ddl in ddl_statements:
-                self.vanna_client.train(ddl=ddl)
+                await self.executor.run("train", self.vanna_client.train, ddl=ddl)
             
             logger.info(f"DDL训练完成，数量: {len(ddl_statements)}")
             
@@ -163,7 +191,9 @@ class VannaService:
             logger.info(f"开始训练SQL对，数量: {len(sql_pairs)}")
             
             for pair in sql_pairs:
-                self.vanna_client.train(
+                await self.executor.run(
+                    "train",
+                    self.vanna_client.train,
                     question=pair['question'],
                     sql=pair['sql']
                 )
@@ -206,6 +236,10 @@ class VannaService:
             if force_update:
                 await self._clear_knowledge_base()
             
+            # 表元数据变化后，涉及这些表的缓存SQL不再可信
+            if self.sql_cache is not None:
+                self.sql_cache.invalidate_tables(table['table_name_en'] for table in tables)
+            
             # 训练DDL
             await self.train_on_ddl(ddl_statements)
             
@@ -236,7 +270,9 @@ class VannaService:
         """
         try:
             # 使用Vanna的相似性搜索
-            similar = self.vanna_client.get_similar_question_sql(question)
+            similar = await self.executor.run(
+                "similar_questions", self.vanna_client.get_similar_question_sql, question
+            )
             
             # 格式化结果
             results = []
@@ -344,11 +380,11 @@ class VannaService:
                 question, context_info
             )
             
-            # 调用Vanna生成SQL
-            sql = self.vanna_client.generate_sql(enhanced_question)
-            
-            # 获取相关的训练数据
-            related_training_data = self.vanna_client.get_related_training_data(question)
+            # 调用Vanna生成SQL，同时获取相关的训练数据
+            sql, related_training_data = await asyncio.gather(
+                self.executor.run("generate_sql", self.vanna_client.generate_sql, enhanced_question),
+                self.executor.run("related_training_data", self.vanna_client.get_related_training_data, question)
+            )
             
             return {
                 'sql': sql,
@@ -362,6 +398,255 @@ class VannaService:
             logger.error(f"Vanna SQL生成调用失败: {e}")
             raise LLMException(f"Vanna调用失败: {e}")
     
+    async def _call_vanna_generate_sql_stream(
+        self,
+        question: str,
+        context_info: Dict[str, Any],
+        task_id: str
+    ) -> Dict[str, Any]:
+        """
+        流式调用LLM生成SQL
+        
+        边生成边通过WebSocket推送SQL片段；语句一完整就开始语法预检，
+        不等待LLM输出剩余的说明文字
+        """
+        loop = asyncio.get_running_loop()
+        fragments: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        assembler = SQLStreamAssembler()
+        related_task = None
+        stream_task = None
+        precheck_task = None
+        prechecked_sql = None
+        
+        try:
+            await self._notify_stream_progress(task_id, {
+                "current_step": "SQL生成中",
+                "streaming": True,
+                "partial_sql": ""
+            })
+            
+            enhanced_question = await self._enhance_question_with_context(
+                question, context_info
+            )
+            related_task = asyncio.ensure_future(
+                self.executor.run("related_training_data", self.vanna_client.get_related_training_data, question)
+            )
+            prompt = await self.executor.run("sql_prompt", self._build_sql_prompt, enhanced_question)
+            
+            # 工作线程逐段回调输出，经事件循环放入队列；流结束后放入None
+            def push(fragment: str):
+                loop.call_soon_threadsafe(fragments.put_nowait, fragment)
+            
+            stream_task = asyncio.ensure_future(
+                self.executor.run("generate_sql_stream", self._stream_completion, prompt, push, stop)
+            )
+            stream_task.add_done_callback(lambda _: fragments.put_nowait(None))
+            
+            # 首个片段立即推送，之后按间隔合并推送
+            interval = self.settings.LLM_STREAM_NOTIFY_INTERVAL_MS / 1000
+            pending = ""
+            last_notified = None
+            while True:
+                fragment = await fragments.get()
+                if fragment is None:
+                    break
+                
+                pending += fragment
+                if assembler.feed(fragment):
+                    prechecked_sql = assembler.complete_sql
+                    precheck_task = asyncio.create_task(self._precheck_sql(task_id, prechecked_sql))
+                
+                now = loop.time()
+                if last_notified is None or now - last_notified >= interval:
+                    await self._notify_sql_fragment(task_id, pending, assembler)
+                    pending = ""
+                    last_notified = now
+            
+            # 流式调用失败时在这里抛出
+            await stream_task
+            if pending:
+                await self._notify_sql_fragment(task_id, pending, assembler)
+            
+            # 与非流式路径一致，最终SQL经Vanna的 extract_sql 提取；与提前预检的语句不同时重新预检
+            sql = self.vanna_client.extract_sql(assembler.finish())
+            if sql and sql != prechecked_sql:
+                if precheck_task is not None:
+                    precheck_task.cancel()
+                precheck_task = asyncio.create_task(self._precheck_sql(task_id, sql))
+            
+            return {
+                'sql': sql,
+                'original_question': question,
+                'enhanced_question': enhanced_question,
+                'related_data': await related_task,
+                'precheck': await precheck_task if precheck_task else None,
+                'confidence': 0.85  # 模拟置信度
+            }
+            
+        except Exception as e:
+            logger.error(f"Vanna流式SQL生成调用失败: {e}")
+            raise LLMException(f"Vanna调用失败: {e}")
+        finally:
+            # 异常或取消时通知工作线程停止读取剩余输出
+            stop.set()
+            for task in (related_task, precheck_task):
+                if task is not None and not task.done():
+                    task.cancel()
+    
+    def _build_sql_prompt(self, question: str) -> List[Dict[str, str]]:
+        """按Vanna的方式检索相似问题、DDL和文档并构建提示词（同步调用）"""
+        client = self.vanna_client
+        return client.get_sql_prompt(
+            initial_prompt=client.config.get("initial_prompt"),
+            question=question,
+            question_sql_list=client.get_similar_question_sql(question),
+            ddl_list=client.get_related_ddl(question),
+            doc_list=client.get_related_documentation(question)
+        )
+    
+    def _stream_completion(
+        self,
+        prompt: List[Dict[str, str]],
+        push: Callable[[str], None],
+        stop: threading.Event
+    ):
+        """流式请求LLM，逐段回调输出（同步调用）"""
+        stream = self.vanna_client.client.chat.completions.create(
+            model=self.settings.LLM_MODEL,
+            messages=prompt,
+            temperature=self.settings.LLM_TEMPERATURE,
+            max_tokens=self.settings.LLM_MAX_TOKENS,
+            stream=True
+        )
+        try:
+            for chunk in stream:
+                if stop.is_set():
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    push(chunk.choices[0].delta.content)
+        finally:
+            stream.close()
+    
+    async def _precheck_sql(self, task_id: str, sql: str) -> Dict[str, Any]:
+        """生成的语句完整后立即用查询引擎预检语法，结果推送给前端"""
+        try:
+            engine = await get_connected_engine()
+            result = await engine.validate_sql(sql)
+        except Exception as e:
+            logger.warning(f"SQL语法预检失败: {e}")
+            result = {"valid": None, "errors": [str(e)], "warnings": []}
+        
+        await self._notify_stream_progress(task_id, {
+            "current_step": "SQL语法预检完成",
+            "streaming": True,
+            "sql_precheck": result
+        })
+        return result
+    
+    async def _notify_sql_fragment(self, task_id: str, fragment: str, assembler: SQLStreamAssembler):
+        """推送新生成的SQL片段和当前已生成的SQL"""
+        await self._notify_stream_progress(task_id, {
+            "current_step": "SQL生成中",
+            "streaming": True,
+            "sql_fragment": fragment,
+            "partial_sql": assembler.partial_sql,
+            "sql_complete": assembler.complete_sql is not None
+        })
+    
+    async def _notify_stream_progress(self, task_id: str, data: Dict[str, Any]):
+        """发送流式生成进度，通知失败不影响SQL生成"""
+        try:
+            await connection_manager.notify_query_progress(task_id, data)
+        except Exception as e:
+            logger.warning(f"发送SQL生成进度失败: {e}")
+    
+    def _accessible_fingerprints(self, tables: List[Dict]) -> Dict[str, str]:
+        """可访问表的结构指纹 {表名（小写）: 指纹}"""
+        return {table['table_name_en'].lower(): table_fingerprint(table) for table in tables}
+    
+    async def _lookup_cached_sql(
+        self,
+        question: str,
+        accessible_tables: List[Dict]
+    ) -> Optional[Dict[str, Any]]:
+        """在语义缓存中查找相似问题的已验证SQL，未命中返回None"""
+        if self.sql_cache is None:
+            return None
+        
+        try:
+            normalized = normalize_question(question)
+            accessible = self._accessible_fingerprints(accessible_tables)
+            
+            entry = self.sql_cache.get_exact(normalized, accessible)
+            similarity = 1.0
+            if entry is None:
+                embedding = await self.executor.run("embedding", self.vanna_client.generate_embedding, normalized)
+                match = self.sql_cache.search(embedding, accessible, normalized)
+                if match is None:
+                    return None
+                entry, similarity = match
+            
+            logger.info(f"SQL语义缓存命中（相似度 {similarity:.3f}）: {question} -> {entry.question}")
+            return {
+                'sql': entry.sql,
+                'original_question': question,
+                'cached_question': entry.question,
+                'similarity': round(similarity, 4),
+                'confidence': round(similarity, 4),
+                'cache_hit': True
+            }
+            
+        except Exception as e:
+            # 缓存异常不影响SQL生成
+            logger.warning(f"SQL语义缓存查找失败: {e}")
+            return None
+    
+    async def record_validated_sql(
+        self,
+        question: str,
+        sql: str,
+        user_id: int,
+        theme_id: Optional[int] = None,
+        table_ids: Optional[List[int]] = None
+    ) -> bool:
+        """
+        将执行成功的问题和SQL写入语义缓存
+        
+        Returns:
+            是否写入缓存
+        """
+        if self.sql_cache is None or not sql:
+            return False
+        
+        try:
+            accessible_tables = await self._get_user_accessible_tables(user_id, theme_id, table_ids)
+            normalized = normalize_question(question)
+            embedding = await self.executor.run("embedding", self.vanna_client.generate_embedding, normalized)
+            return self.sql_cache.put(
+                question,
+                normalized,
+                sql,
+                self._accessible_fingerprints(accessible_tables),
+                embedding
+            )
+        except Exception as e:
+            logger.warning(f"写入SQL语义缓存失败: {e}")
+            return False
+    
+    def get_executor_metrics(self) -> Dict[str, Any]:
+        """获取LLM调用线程池的并发和排队指标"""
+        return self.executor.get_metrics()
+    
+    def invalidate_cached_sql(self, question: Optional[str] = None, sql: Optional[str] = None) -> int:
+        """删除缓存的问题或SQL（用户负面反馈时调用）"""
+        if self.sql_cache is None:
+            return 0
+        count = self.sql_cache.invalidate(question=question, sql=sql)
+        if count:
+            logger.info(f"已删除 {count} 条SQL语义缓存")
+        return count
+    
     async def _enhance_question_with_context(
         self, 
         question: str, 
@@ -438,8 +723,12 @@ class VannaService:
                 'question': sql_result.get('original_question', ''),
                 'confidence': sql_result.get('confidence', 0.0),
                 'accessible_tables': accessible_table_names,
-                'user_id': user_id
+                'user_id': user_id,
+                'cache_hit': sql_result.get('cache_hit', False)
             }
+            if sql_result.get('cache_hit'):
+                result['cached_question'] = sql_result.get('cached_question')
+                result['similarity'] = sql_result.get('similarity')
             
             return result
             
@@ -494,6 +783,8 @@ class VannaService:
         """清除知识库"""
         try:
             # TODO: 实现清除ChromaDB集合的逻辑
+            if self.sql_cache is not None:
+                self.sql_cache.clear()
             logger.info("知识库清除完成")
         except Exception as e:
             logger.error(f"清除知识库失败: {e}")
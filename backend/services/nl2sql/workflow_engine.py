@@ -3,8 +3,9 @@ LangGraph工作流引擎实现
 基于LangGraph的NL2SQL查询处理工作流
 """
 import asyncio
+import time
 import uuid
-from typing import Dict, Any, List, Optional, TypedDict, Annotated
+from typing import Dict, Any, List, Optional, TypedDict, Annotated, Coroutine
 from datetime import datetime
 from enum import Enum
 
@@ -13,14 +14,38 @@ from langgraph.prebuilt import ToolExecutor
 from langchain_core.messages import HumanMessage, AIMessage
 
 from utils.logger import get_logger
-from utils.exceptions import NLQueryException, LLMException
+from utils.exceptions import NLQueryException, LLMException, QueryEngineException, QueryTimeoutException
 from config.settings import get_settings
 from models.nlquery_models import TaskStatusEnum, NodeStatusEnum, NodeTypeEnum
 from services.websocket.manager import connection_manager
+from services.query_engine.admission import AdmissionDecision, get_admission_controller
+from services.query_engine.engine_factory import get_connected_engine
+from services.query_engine.result_store import get_result_store
+from services.query_engine.preview import limit_sql
+from .vanna_service import get_vanna_service
 
 logger = get_logger(__name__)
 
 
+def merge_node_logs(left: List[Dict[str, Any]], right: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    合并节点执行记录
+    
+    串行节点返回完整状态（包含已有记录），并行分支只返回各自新增的记录；
+    按（节点名, 开始时间）去重，同一条记录以新值为准
+    """
+    merged = list(left or [])
+    positions = {(entry.get("node_name"), entry.get("start_time")): index for index, entry in enumerate(merged)}
+    for entry in right or []:
+        key = (entry.get("node_name"), entry.get("start_time"))
+        if key in positions:
+            merged[positions[key]] = entry
+        else:
+            positions[key] = len(merged)
+            merged.append(entry)
+    return merged
+
+
 class WorkflowState(TypedDict):
     """工作流状态定义"""
     # 基础信息
@@ -39,9 +64,19 @@ class WorkflowState(TypedDict):
     # SQL相关
     generated_sql: Optional[str]
     final_sql: Optional[str]
+    cached_sql: Optional[str]
+    semantic_cache_hit: bool
+    # 准入控制降级时执行阶段限制的结果行数，final_sql 保持原样
+    execution_row_limit: Optional[int]
     sql_validation_result: Optional[Dict[str, Any]]
     
+    # 并行验证分支的结果
+    syntax_check: Optional[Dict[str, Any]]
+    security_check: Optional[Dict[str, Any]]
+    permission_check: Optional[Dict[str, Any]]
+    
     # 执行结果
+    preview_mode: bool
     execution_result: Optional[Dict[str, Any]]
     result_row_count: Optional[int]
     result_columns: Optional[List[str]]
@@ -51,8 +86,9 @@ class WorkflowState(TypedDict):
     llm_messages: List[Dict[str, str]]
     llm_tokens_used: int
     
-    # 节点执行记录
-    node_execution_log: List[Dict[str, Any]]
+    # 节点执行记录和各节点累计耗时（毫秒）
+    node_execution_log: Annotated[List[Dict[str, Any]], merge_node_logs]
+    node_timings: Dict[str, float]
     
     # 重试控制
     retry_count: int
@@ -75,6 +111,10 @@ class WorkflowEngine:
         workflow.add_node("validate_input", self._validate_input_node)
         workflow.add_node("generate_sql", self._generate_sql_node)
         workflow.add_node("validate_sql", self._validate_sql_node)
+        workflow.add_node("check_sql_syntax", self._check_sql_syntax_node)
+        workflow.add_node("check_sql_security", self._check_sql_security_node)
+        workflow.add_node("check_sql_permission", self._check_sql_permission_node)
+        workflow.add_node("merge_sql_validation", self._merge_sql_validation_node)
         workflow.add_node("execute_sql", self._execute_sql_node)
         workflow.add_node("process_result", self._process_result_node)
         workflow.add_node("handle_error", self._handle_error_node)
@@ -96,9 +136,15 @@ class WorkflowEngine:
             }
         )
         
+        # 语法、安全、权限三项检查互不依赖，作为并行分支执行，全部完成后汇总
+        validation_branches = ["check_sql_syntax", "check_sql_security", "check_sql_permission"]
+        for branch in validation_branches:
+            workflow.add_edge("validate_sql", branch)
+        workflow.add_edge(validation_branches, "merge_sql_validation")
+        
         # SQL验证后的条件分支
         workflow.add_conditional_edges(
-            "validate_sql",
+            "merge_sql_validation",
             self._should_execute_sql,
             {
                 "execute": "execute_sql",
@@ -137,7 +183,9 @@ class WorkflowEngine:
                 "progress_percentage": 0,
                 "llm_messages": [],
                 "llm_tokens_used": 0,
-                "node_execution_log": [],
+                # 保留提交阶段写入的记录（如问题缓存查找）
+                "node_execution_log": initial_state.get("node_execution_log") or [],
+                "node_timings": {},
                 "retry_count": 0,
                 "max_retries": self.settings.MAX_RETRY_COUNT
             })
@@ -147,6 +195,8 @@ class WorkflowEngine:
             
             # 执行工作流
             final_state = await self._run_workflow(initial_state)
+            final_state["node_timings"] = self._summarize_node_timings(final_state)
+            logger.info(f"工作流节点耗时（毫秒），任务ID: {final_state['task_id']}, {final_state['node_timings']}")
             
             # 发送完成通知
             await self._notify_completion(final_state)
@@ -169,12 +219,10 @@ class WorkflowEngine:
             return initial_state
     
     async def _run_workflow(self, state: WorkflowState) -> WorkflowState:
-        """运行工作流（异步适配）"""
-        # 由于LangGraph可能不完全支持异步，这里做适配处理
+        """运行工作流"""
         try:
-            # 同步执行图
-            result = self.graph.invoke(state)
-            return result
+            # 节点都是协程，在当前事件循环中异步执行，并行分支并发运行
+            return await self.graph.ainvoke(state)
         except Exception as e:
             logger.error(f"工作流图执行失败: {e}")
             raise NLQueryException(f"工作流执行失败: {e}")
@@ -208,7 +256,9 @@ class WorkflowEngine:
                         "columns": state.get("result_columns", []),
                         "rows": state.get("result_data", []),
                         "total_count": state.get("result_row_count"),
-                        "execution_time_ms": state.get("execution_result", {}).get("execution_time_ms")
+                        "execution_time_ms": state.get("execution_result", {}).get("execution_time_ms"),
+                        # 预览结果：精确结果就绪后另行推送 exact_result_ready
+                        "is_preview": state.get("execution_result", {}).get("metadata", {}).get("preview_exact") is False
                     },
                     "final_step": state.get("current_step"),
                     "total_tokens": state.get("llm_tokens_used", 0)
@@ -282,64 +332,161 @@ class WorkflowEngine:
         try:
             self._log_node_start(state, NodeTypeEnum.SQL_GENERATION, "SQL生成")
             
-            # 构建提示词
-            prompt = await self._build_sql_prompt(state)
+            # 问题缓存命中时直接复用上次的最终SQL，只复用一次，验证失败重新生成时调用LLM
+            cached_sql = state.get("cached_sql")
+            if cached_sql:
+                state.update({
+                    "generated_sql": cached_sql,
+                    "final_sql": cached_sql,
+                    "cached_sql": None,
+                    "current_step": "SQL生成完成",
+                    "progress_percentage": 40
+                })
+                self._log_node_success(state, "SQL生成", f"复用缓存SQL: {cached_sql[:100]}...")
+                return state
             
-            # 调用LLM生成SQL
-            generated_sql = await self._call_llm_for_sql(prompt, state)
+            # 通过Vanna生成SQL：语义缓存查找、流式推送和语法预检都在该调用中完成
+            sql_result = await self._call_llm_for_sql(state)
+            generated_sql = sql_result.get("original_sql") or sql_result.get("sql", "")
             
             # 清理和格式化SQL
-            final_sql = self._clean_sql(generated_sql)
+            final_sql = self._clean_sql(sql_result.get("sql", ""))
             
             state.update({
                 "generated_sql": generated_sql,
                 "final_sql": final_sql,
+                "semantic_cache_hit": bool(sql_result.get("cache_hit")),
                 "current_step": "SQL生成完成",
                 "progress_percentage": 40
             })
             
-            self._log_node_success(state, "SQL生成", f"生成SQL: {final_sql[:100]}...")
+            source = "复用语义缓存SQL" if sql_result.get("cache_hit") else "生成SQL"
+            self._log_node_success(state, "SQL生成", f"{source}: {final_sql[:100]}...")
             return state
             
         except Exception as e:
             return self._log_node_error(state, "SQL生成", str(e))
     
     async def _validate_sql_node(self, state: WorkflowState) -> WorkflowState:
-        """SQL验证节点"""
+        """SQL验证节点：记录开始，检查由随后的并行分支完成"""
+        self._log_node_start(state, NodeTypeEnum.SQL_VALIDATION, "SQL验证")
+        state.update({
+            "syntax_check": None,
+            "security_check": None,
+            "permission_check": None,
+            "current_step": "SQL验证中"
+        })
+        return state
+    
+    async def _check_sql_syntax_node(self, state: WorkflowState) -> Dict[str, Any]:
+        """语法检查分支"""
+        return await self._run_validation_branch(
+            state, "syntax_check", "语法检查", self._validate_sql_syntax(state.get("final_sql"))
+        )
+    
+    async def _check_sql_security_node(self, state: WorkflowState) -> Dict[str, Any]:
+        """安全检查分支"""
+        return await self._run_validation_branch(
+            state, "security_check", "安全检查", self._validate_sql_security(state.get("final_sql") or "")
+        )
+    
+    async def _check_sql_permission_node(self, state: WorkflowState) -> Dict[str, Any]:
+        """权限检查分支"""
+        return await self._run_validation_branch(
+            state, "permission_check", "权限检查", self._validate_sql_permissions(state.get("final_sql"), state)
+        )
+    
+    async def _run_validation_branch(
+        self,
+        state: WorkflowState,
+        result_key: str,
+        node_name: str,
+        check: Coroutine[Any, Any, Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        执行一个并行验证分支
+        
+        并行分支不能修改共享状态，只返回本分支的结果和执行记录，由LangGraph合并
+        """
+        started_at = datetime.now()
+        start = time.perf_counter()
+        if state.get("error_message") or not state.get("final_sql"):
+            check.close()
+            result = {"valid": False, "errors": []}
+        else:
+            try:
+                result = await check
+            except Exception as e:
+                result = {"valid": False, "errors": [f"{node_name}失败: {e}"]}
+        duration_ms = round((time.perf_counter() - start) * 1000, 2)
+        
+        log_entry = {
+            "node_name": node_name,
+            "node_type": NodeTypeEnum.SQL_VALIDATION.value,
+            "status": NodeStatusEnum.SUCCESS.value if result["valid"] else NodeStatusEnum.FAILED.value,
+            "start_time": started_at.isoformat(),
+            "end_time": datetime.now().isoformat(),
+            "duration_ms": duration_ms,
+            "input_data": {}
+        }
+        if result["valid"]:
+            log_entry["output_message"] = f"{node_name}通过"
+        else:
+            log_entry["error_message"] = "; ".join(result.get("errors", []))
+        
+        return {result_key: result, "node_execution_log": [log_entry]}
+    
+    async def _merge_sql_validation_node(self, state: WorkflowState) -> WorkflowState:
+        """汇总并行验证结果，通过后进行准入检查"""
         try:
-            self._log_node_start(state, NodeTypeEnum.SQL_VALIDATION, "SQL验证")
+            if state.get("error_message"):
+                return state
             
             sql = state.get("final_sql")
             if not sql:
                 raise NLQueryException("没有SQL需要验证")
             
-            # 基础SQL语法检查
-            validation_result = await self._validate_sql_syntax(sql)
-            
-            # 安全性检查
-            security_result = await self._validate_sql_security(sql)
-            
-            # 权限检查
-            permission_result = await self._validate_sql_permissions(sql, state)
+            validation_result = state.get("syntax_check") or {"valid": False, "errors": ["语法检查未执行"]}
+            security_result = state.get("security_check") or {"valid": False, "errors": ["安全检查未执行"]}
+            permission_result = state.get("permission_check") or {"valid": False, "errors": ["权限检查未执行"]}
             
             # 合并验证结果
             combined_result = {
                 "syntax_valid": validation_result["valid"],
                 "security_valid": security_result["valid"],
                 "permission_valid": permission_result["valid"],
+                "admission_valid": True,
                 "errors": validation_result.get("errors", []) + 
                          security_result.get("errors", []) + 
                          permission_result.get("errors", [])
             }
             
+            # 准入控制：其余检查都通过后，根据查询计划估算的成本拒绝或降级查询
+            row_limit = None
+            if combined_result["syntax_valid"] and combined_result["security_valid"] and combined_result["permission_valid"]:
+                admission_result = await self._check_sql_admission(sql)
+                combined_result["admission"] = admission_result
+                
+                if admission_result["decision"] == AdmissionDecision.REJECT.value:
+                    combined_result["admission_valid"] = False
+                    combined_result["errors"].append(admission_result["reason"])
+                elif admission_result["decision"] == AdmissionDecision.DOWNGRADE.value:
+                    row_limit = admission_result["row_limit"]
+            
             state.update({
                 "sql_validation_result": combined_result,
+                "execution_row_limit": row_limit,
                 "current_step": "SQL验证完成",
                 "progress_percentage": 60
             })
             
-            if combined_result["syntax_valid"] and combined_result["security_valid"] and combined_result["permission_valid"]:
+            if (combined_result["syntax_valid"] and combined_result["security_valid"] and
+                    combined_result["permission_valid"] and combined_result["admission_valid"]):
                 self._log_node_success(state, "SQL验证", "SQL验证通过")
+            elif not combined_result["admission_valid"]:
+                # 超出准入阈值的查询重新生成同样会被拒绝，直接报错；条件边函数中的状态修改不会保留，错误码在节点中设置
+                self._log_node_error(state, "SQL验证", "; ".join(combined_result["errors"]))
+                state["error_code"] = "QUERY_REJECTED"
             else:
                 self._log_node_error(state, "SQL验证", f"SQL验证失败: {combined_result['errors']}")
             
@@ -353,20 +500,30 @@ class WorkflowEngine:
         try:
             self._log_node_start(state, NodeTypeEnum.SQL_EXECUTION, "SQL执行")
             
-            sql = state.get("final_sql")
+            sql = self.execution_sql(state)
             if not sql:
                 raise NLQueryException("没有SQL需要执行")
             
-            # 执行SQL查询
-            from utils.database import query_engine_manager
-            result = await query_engine_manager.execute_query(sql)
+            # 执行SQL查询（与API共用常驻连接池的引擎，经过SQL清理、超时、缓存和调度）
+            engine = await get_connected_engine()
+            query_result = None
+            if state.get("preview_mode"):
+                # 预览模式：先返回前N行或抽样近似，精确结果由查询处理器在后台补齐
+                try:
+                    query_result = await engine.execute_preview(sql)
+                except (QueryTimeoutException, QueryEngineException) as e:
+                    logger.info(f"预览查询未能在延迟目标内完成，执行完整查询: {e}")
+            if query_result is None:
+                query_result = await engine.execute_query(sql)
+            
+            result = await self.store_execution_result(state["task_id"], query_result)
             
             # 处理结果
             state.update({
                 "execution_result": result,
                 "result_row_count": result.get("row_count", 0),
                 "result_columns": result.get("columns", []),
-                "result_data": result.get("rows", [])[:100],  # 只保存前100行
+                "result_data": query_result.get_rows(0, 100),  # 只保存前100行
                 "current_step": "SQL执行完成",
                 "progress_percentage": 80
             })
@@ -377,6 +534,26 @@ class WorkflowEngine:
         except Exception as e:
             return self._log_node_error(state, "SQL执行", str(e))
     
+    @staticmethod
+    def execution_sql(state: WorkflowState) -> Optional[str]:
+        """实际执行的SQL：准入控制降级时在最终SQL上施加结果行数限制"""
+        sql = state.get("final_sql")
+        row_limit = state.get("execution_row_limit")
+        if sql and row_limit:
+            return limit_sql(sql, row_limit)
+        return sql
+    
+    async def store_execution_result(self, task_id: str, query_result: Any) -> Dict[str, Any]:
+        """
+        转换查询结果为任务状态中的执行结果
+        
+        超过阈值的大结果落盘，任务状态中不再保留完整行数据
+        """
+        spilled_result = await get_result_store().spill(task_id, query_result)
+        if spilled_result is not None:
+            return {**query_result.to_dict(0), "spilled": True}
+        return query_result.to_dict()
+    
     async def _process_result_node(self, state: WorkflowState) -> WorkflowState:
         """结果处理节点"""
         try:
@@ -448,7 +625,8 @@ class WorkflowEngine:
         
         if (validation_result.get("syntax_valid") and 
             validation_result.get("security_valid") and 
-            validation_result.get("permission_valid")):
+            validation_result.get("permission_valid") and
+            validation_result.get("admission_valid", True)):
             return "execute"
         
         # 如果验证失败且重试次数未超限，重新生成SQL
@@ -490,29 +668,34 @@ class WorkflowEngine:
         
         logger.info(f"节点开始执行: {node_name}")
     
+    def _finish_node_log(self, state: WorkflowState, node_name: str, fields: Dict[str, Any]):
+        """更新节点最近一条执行中的记录，并记录墙钟耗时"""
+        for log_entry in reversed(state.get("node_execution_log") or []):
+            if log_entry["node_name"] == node_name and log_entry["status"] == NodeStatusEnum.RUNNING.value:
+                end_time = datetime.now()
+                start_time = datetime.fromisoformat(log_entry["start_time"])
+                log_entry.update(fields)
+                log_entry.update({
+                    "end_time": end_time.isoformat(),
+                    "duration_ms": round((end_time - start_time).total_seconds() * 1000, 2)
+                })
+                return
+    
     def _log_node_success(self, state: WorkflowState, node_name: str, message: str):
         """记录节点执行成功"""
-        if state.get("node_execution_log"):
-            last_log = state["node_execution_log"][-1]
-            if last_log["node_name"] == node_name:
-                last_log.update({
-                    "status": NodeStatusEnum.SUCCESS.value,
-                    "end_time": datetime.now().isoformat(),
-                    "output_message": message
-                })
+        self._finish_node_log(state, node_name, {
+            "status": NodeStatusEnum.SUCCESS.value,
+            "output_message": message
+        })
         
         logger.info(f"节点执行成功: {node_name} - {message}")
     
     def _log_node_error(self, state: WorkflowState, node_name: str, error_message: str) -> WorkflowState:
         """记录节点执行错误"""
-        if state.get("node_execution_log"):
-            last_log = state["node_execution_log"][-1]
-            if last_log["node_name"] == node_name:
-                last_log.update({
-                    "status": NodeStatusEnum.FAILED.value,
-                    "end_time": datetime.now().isoformat(),
-                    "error_message": error_message
-                })
+        self._finish_node_log(state, node_name, {
+            "status": NodeStatusEnum.FAILED.value,
+            "error_message": error_message
+        })
         
         state.update({
             "error_message": error_message,
@@ -522,48 +705,26 @@ class WorkflowEngine:
         logger.error(f"节点执行失败: {node_name} - {error_message}")
         return state
     
-    async def _build_sql_prompt(self, state: WorkflowState) -> str:
-        """构建SQL生成提示词"""
-        # TODO: 实现完整的提示词构建逻辑
-        user_question = state["user_question"]
-        
-        prompt = f"""
-请根据用户问题生成相应的SQL查询语句。
-
-用户问题: {user_question}
-
-要求:
-1. 生成的SQL必须是标准的SQL语法
-2. 只返回SQL语句，不要其他解释
-3. 确保SQL的安全性，避免注入攻击
-4. 优化查询性能
-
-SQL:
-"""
-        return prompt
-    
-    async def _call_llm_for_sql(self, prompt: str, state: WorkflowState) -> str:
-        """调用LLM生成SQL"""
-        try:
-            # TODO: 实现实际的LLM调用逻辑
-            # 这里先返回模拟的SQL
-            await asyncio.sleep(1)  # 模拟LLM调用延迟
-            
-            # 模拟SQL生成
-            if "用户" in state["user_question"]:
-                mock_sql = "SELECT * FROM users LIMIT 10;"
-            elif "订单" in state["user_question"]:
-                mock_sql = "SELECT * FROM orders WHERE created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY) LIMIT 10;"
-            else:
-                mock_sql = "SELECT 1 as result;"
-            
-            # 更新token使用量
-            state["llm_tokens_used"] = state.get("llm_tokens_used", 0) + 150
-            
-            return mock_sql
-            
-        except Exception as e:
-            raise LLMException(f"LLM调用失败: {e}")
+    def _summarize_node_timings(self, state: WorkflowState) -> Dict[str, float]:
+        """按节点汇总墙钟耗时（毫秒），重试时同一节点累加"""
+        timings: Dict[str, float] = {}
+        for log_entry in state.get("node_execution_log") or []:
+            if log_entry.get("duration_ms") is not None:
+                name = log_entry["node_name"]
+                timings[name] = round(timings.get(name, 0.0) + log_entry["duration_ms"], 2)
+        return timings
+    
+    async def _call_llm_for_sql(self, state: WorkflowState) -> Dict[str, Any]:
+        """调用Vanna服务生成SQL，提供任务ID以便通过WebSocket推送生成中的SQL"""
+        return await get_vanna_service().generate_sql(
+            state["user_question"],
+            state["user_id"],
+            theme_id=state.get("selected_theme_id"),
+            table_ids=state.get("selected_table_ids"),
+            task_id=state["task_id"],
+            # 已生成过SQL说明上一条未通过验证或执行失败，重新生成时跳过语义缓存
+            use_cache=not state.get("generated_sql")
+        )
     
     def _clean_sql(self, sql: str) -> str:
         """清理和格式化SQL"""
@@ -629,6 +790,17 @@ SQL:
         except Exception as e:
             return {"valid": False, "errors": [f"权限验证失败: {e}"]}
     
+    async def _check_sql_admission(self, sql: str) -> Dict[str, Any]:
+        """根据查询计划的成本估算检查SQL是否允许执行"""
+        try:
+            engine = await get_connected_engine()
+            return await get_admission_controller().evaluate(engine, sql)
+            
+        except Exception as e:
+            # 准入检查本身失败时放行，由执行阶段的超时兜底
+            logger.warning(f"SQL准入检查失败: {e}")
+            return {"decision": AdmissionDecision.ACCEPT.value, "sql": sql, "row_limit": None, "reason": None, "estimate": {}}
+    
     async def _post_process_data(self, data: List[List[Any]], columns: List[str], state: WorkflowState) -> List[List[Any]]:
         """数据后处理"""
         try:
@@ -4,7 +4,7 @@
 from .base_engine import BaseQueryEngine
 from .duckdb_engine import DuckDBQueryEngine
 from .mysql_engine import MySQLQueryEngine
-from .engine_factory import QueryEngineFactory, get_query_engine
+from .engine_factory import QueryEngineFactory, get_query_engine, get_connected_engine, get_pool_metrics
 
 __all__ = [
     "BaseQueryEngine",
@@ -12,4 +12,6 @@ __all__ = [
     "MySQLQueryEngine", 
     "QueryEngineFactory",
     "get_query_engine",
+    "get_connected_engine",
+    "get_pool_metrics",
 ]
\ No newline at end of file
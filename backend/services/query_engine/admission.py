@@ -0,0 +1,127 @@
+"""
+查询准入控制
+执行前根据查询计划的成本估算拒绝或降级开销过大的查询
+"""
+from enum import Enum
+from typing import Dict, Any, Optional
+
+from .base_engine import BaseQueryEngine
+from utils.logger import get_logger
+from config.settings import get_settings
+
+logger = get_logger(__name__)
+
+
+class AdmissionDecision(str, Enum):
+    """准入决策枚举"""
+    ACCEPT = "accept"        # 直接执行
+    DOWNGRADE = "downgrade"  # 限制结果行数后执行
+    REJECT = "reject"        # 拒绝执行
+
+
+class AdmissionController:
+    """
+    查询准入控制器
+    
+    扫描行数或扫描数据量超过阈值的查询直接拒绝；
+    只是结果行数过多的查询降级为限制结果行数执行，SQL本身不改写，由执行方施加行数限制
+    """
+    
+    def __init__(
+        self,
+        enabled: bool = True,
+        max_scan_rows: int = 100_000_000,
+        max_scan_bytes: int = 10 * 1024 ** 3,
+        downgrade_rows: int = 100_000
+    ):
+        self.enabled = enabled
+        self.max_scan_rows = max_scan_rows
+        self.max_scan_bytes = max_scan_bytes
+        self.downgrade_rows = downgrade_rows
+    
+    async def evaluate(self, engine: BaseQueryEngine, sql: str) -> Dict[str, Any]:
+        """
+        评估查询是否允许执行
+        
+        Args:
+            engine: 执行查询的引擎
+            sql: 待执行的SQL
+        
+        Returns:
+            准入结果，包含 decision、sql、row_limit（降级时执行限制的结果行数）、reason 和成本估算
+        """
+        result = {
+            "decision": AdmissionDecision.ACCEPT.value,
+            "sql": sql,
+            "row_limit": None,
+            "reason": None,
+            "estimate": {}
+        }
+        
+        if not self.enabled:
+            return result
+        
+        try:
+            estimate = await engine.estimate_query_cost(sql)
+        except Exception as e:
+            # 估算失败不影响查询执行
+            logger.warning(f"查询成本估算失败，跳过准入控制: {e}")
+            return result
+        
+        estimate = {k: v for k, v in estimate.items() if k != "query_plan"}
+        result["estimate"] = estimate
+        
+        scan_rows = estimate.get("scan_rows", 0)
+        scan_bytes = estimate.get("scan_bytes", 0)
+        estimated_rows = estimate.get("estimated_rows", 0)
+        
+        if self.max_scan_rows and scan_rows > self.max_scan_rows:
+            result.update({
+                "decision": AdmissionDecision.REJECT.value,
+                "reason": f"预计扫描 {scan_rows} 行，超过上限 {self.max_scan_rows} 行"
+            })
+        elif self.max_scan_bytes and scan_bytes > self.max_scan_bytes:
+            result.update({
+                "decision": AdmissionDecision.REJECT.value,
+                "reason": f"预计扫描 {self._format_bytes(scan_bytes)}，超过上限 {self._format_bytes(self.max_scan_bytes)}"
+            })
+        elif self.downgrade_rows and estimated_rows > self.downgrade_rows:
+            result.update({
+                "decision": AdmissionDecision.DOWNGRADE.value,
+                "row_limit": self.downgrade_rows,
+                "reason": f"预计返回 {estimated_rows} 行，已限制为前 {self.downgrade_rows} 行"
+            })
+        
+        if result["decision"] != AdmissionDecision.ACCEPT.value:
+            logger.info(f"查询准入控制: {result['decision']}，{result['reason']}")
+        
+        return result
+    
+    @staticmethod
+    def _format_bytes(size: int) -> str:
+        """格式化字节数"""
+        for unit in ("B", "KB", "MB", "GB"):
+            if size < 1024:
+                return f"{size:.1f}{unit}"
+            size /= 1024
+        return f"{size:.1f}TB"
+
+
+# 全局准入控制器实例
+_admission_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """获取准入控制器实例"""
+    global _admission_controller
+    
+    if _admission_controller is None:
+        settings = get_settings()
+        _admission_controller = AdmissionController(
+            enabled=settings.QUERY_ADMISSION_ENABLED,
+            max_scan_rows=settings.QUERY_ADMISSION_MAX_SCAN_ROWS,
+            max_scan_bytes=settings.QUERY_ADMISSION_MAX_SCAN_BYTES,
+            downgrade_rows=settings.QUERY_ADMISSION_DOWNGRADE_ROWS
+        )
+    
+    return _admission_controller
@@ -3,41 +3,134 @@
 定义查询引擎的统一接口
 """
 from abc import ABC, abstractmethod
-from typing import Dict, List, Any, Optional, Tuple
+from contextlib import asynccontextmanager
+from typing import Dict, List, Any, Optional, Tuple, AsyncIterator, Sequence
 from datetime import datetime
 import asyncio
+import copy
+import time
 
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow为可选依赖，未安装时只支持行式结果
+    pa = None
+
+from .result_cache import (
+    QueryResultCache, CacheWrite, current_cache_write, extract_tables, make_query_key, normalize_sql
+)
+from .coalescer import QueryCoalescer
+from .schema_catalog import SchemaCatalog
+from .scheduler import FairShareScheduler
+from .result_encoder import ResultEncoder, encode_json
+from .preview import is_aggregate_query, limit_sql, sample_sql, additive_columns, scale_rows
 from utils.logger import get_logger
-from utils.exceptions import QueryEngineException
+from utils.exceptions import QueryEngineException, QueryCancelledException, QueryTimeoutException
 
 logger = get_logger(__name__)
 
 
+def arrow_table_to_rows(table: Any, offset: int = 0, limit: Optional[int] = None) -> List[List[Any]]:
+    """
+    将Arrow表的指定区间转换为行数据
+    
+    先零拷贝切片再逐列转换，转换器按列类型只选择一次，
+    只有实际返回的行才会生成Python对象
+    """
+    if limit is None:
+        limit = table.num_rows - offset
+    sliced = table.slice(offset, max(limit, 0))
+    
+    column_values = []
+    for field, column in zip(sliced.schema, sliced.columns):
+        values = column.to_pylist()
+        # 与行式结果保持一致：时间戳转换为ISO格式字符串
+        if pa.types.is_timestamp(field.type):
+            values = [value.isoformat() if value is not None else None for value in values]
+        column_values.append(values)
+    
+    return [list(row) for row in zip(*column_values)]
+
+
 class QueryResult:
     """查询结果封装类"""
     
     def __init__(
         self,
         columns: List[str],
-        rows: List[List[Any]],
+        rows: Optional[List[List[Any]]],
         row_count: int,
         execution_time_ms: int,
         sql: str,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        arrow_table: Optional[Any] = None,
+        encoder: Optional[ResultEncoder] = None
     ):
         self.columns = columns
-        self.rows = rows
+        self._rows = rows
+        self.arrow_table = arrow_table
         self.row_count = row_count
         self.execution_time_ms = execution_time_ms
         self.sql = sql
         self.metadata = metadata or {}
         self.created_at = datetime.now()
+        # 落盘结果的文件路径和读取文件的结果存储
+        self.spill_path: Optional[str] = None
+        self._store = None
+        # 按列类型确定的结果编码器
+        self.encoder = encoder
     
-    def to_dict(self) -> Dict[str, Any]:
-        """转换为字典格式"""
+    @property
+    def is_columnar(self) -> bool:
+        """是否为Arrow列式结果"""
+        return self.arrow_table is not None
+    
+    @property
+    def is_spilled(self) -> bool:
+        """行数据是否已落盘"""
+        return self.spill_path is not None
+    
+    def attach_spill(self, path: str, store: Any):
+        """切换为从落盘文件读取行数据，释放内存中的行数据"""
+        self.spill_path = path
+        self._store = store
+        self._rows = None
+        self.arrow_table = None
+        self.metadata["spilled"] = True
+    
+    @property
+    def rows(self) -> List[List[Any]]:
+        """全部行数据（列式结果在首次访问时整体转换并缓存，落盘结果每次从文件读取）"""
+        if self.is_spilled:
+            return self._store.read_rows(self.spill_path)
+        if self._rows is None and self.arrow_table is not None:
+            self._rows = arrow_table_to_rows(self.arrow_table)
+        return self._rows if self._rows is not None else []
+    
+    @rows.setter
+    def rows(self, value: List[List[Any]]):
+        self._rows = value
+    
+    def get_rows(self, offset: int = 0, limit: Optional[int] = None) -> List[List[Any]]:
+        """获取指定区间的行数据，列式结果只转换返回的行，落盘结果只读取覆盖该区间的行组"""
+        if self.is_spilled:
+            return self._store.read_rows(self.spill_path, offset, limit)
+        if self._rows is not None:
+            end = offset + limit if limit is not None else None
+            return self._rows[offset:end]
+        if self.arrow_table is not None:
+            return arrow_table_to_rows(self.arrow_table, offset, limit)
+        return []
+    
+    def to_dict(self, max_rows: Optional[int] = None) -> Dict[str, Any]:
+        """
+        转换为字典格式
+        
+        Args:
+            max_rows: 最多输出的行数，为空时输出全部行
+        """
         return {
             "columns": self.columns,
-            "rows": self.rows,
+            "rows": self.get_rows(0, max_rows),
             "row_count": self.row_count,
             "execution_time_ms": self.execution_time_ms,
             "sql": self.sql,
@@ -45,14 +138,27 @@ class QueryResult:
             "created_at": self.created_at.isoformat()
         }
     
+    def to_json(self, max_rows: Optional[int] = None) -> bytes:
+        """
+        序列化为JSON字节串，按列类型检查后优先使用orjson
+        
+        输出与 JSONResponse(jsonable_encoder(self.to_dict(max_rows))) 逐字节一致
+        """
+        content = self.to_dict(max_rows)
+        encoder = self.encoder
+        if encoder is None and self.arrow_table is not None:
+            encoder = ResultEncoder.from_arrow_schema(self.arrow_table.schema)
+        if encoder is None:
+            return encode_json(content)
+        return encoder.encode_json(content)
+    
     def get_page(self, page: int, size: int) -> Dict[str, Any]:
         """获取分页数据"""
         start = (page - 1) * size
-        end = start + size
         
         return {
             "columns": self.columns,
-            "rows": self.rows[start:end],
+            "rows": self.get_rows(start, size),
             "page": page,
             "size": size,
             "total": self.row_count,
@@ -60,14 +166,112 @@ class QueryResult:
         }
 
 
+class ResultBatch:
+    """流式查询结果批次"""
+    
+    def __init__(
+        self,
+        columns: List[str],
+        rows: List[List[Any]],
+        batch_index: int,
+        offset: int
+    ):
+        self.columns = columns
+        self.rows = rows
+        self.batch_index = batch_index
+        self.offset = offset
+        self.row_count = len(rows)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典格式"""
+        return {
+            "columns": self.columns,
+            "rows": self.rows,
+            "batch_index": self.batch_index,
+            "offset": self.offset,
+            "row_count": self.row_count
+        }
+
+
+class StatementResult:
+    """批量执行中单条语句的结果"""
+    
+    def __init__(
+        self,
+        index: int,
+        sql: str,
+        result: Optional[QueryResult] = None,
+        error: Optional[Exception] = None,
+        elapsed_ms: int = 0
+    ):
+        self.index = index
+        self.sql = sql
+        self.result = result
+        self.error = error
+        self.elapsed_ms = elapsed_ms
+    
+    @property
+    def success(self) -> bool:
+        return self.error is None
+    
+    def to_dict(self, max_rows: Optional[int] = None) -> Dict[str, Any]:
+        """转换为字典格式"""
+        return {
+            "index": self.index,
+            "sql": self.sql,
+            "success": self.success,
+            "result": self.result.to_dict(max_rows) if self.result is not None else None,
+            "error": str(self.error) if self.error is not None else None,
+            "error_type": type(self.error).__name__ if self.error is not None else None,
+            "elapsed_ms": self.elapsed_ms
+        }
+
+
 class BaseQueryEngine(ABC):
     """查询引擎抽象基类"""
     
+    # cursor.description 中类型信息的格式，用于按列选择结果转换器
+    result_type_system = "generic"
+    
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.connection = None
         self.connection_pool = None
         self.is_connected = False
+        self.stream_batch_size = config.get('stream_batch_size', 1000)
+        # 默认单次查询时限（秒），为空时不限制
+        self.query_timeout = config.get('query_timeout')
+        # 查询结果缓存
+        self.result_cache: Optional[QueryResultCache] = None
+        if config.get('result_cache_enabled', False):
+            self.result_cache = QueryResultCache(
+                max_bytes=config.get('result_cache_max_bytes', 256 * 1024 * 1024),
+                default_ttl=config.get('result_cache_ttl', 300)
+            )
+        # 相同查询并发执行时合并为一次
+        self.coalescer: Optional[QueryCoalescer] = None
+        if config.get('query_coalescing_enabled', False):
+            self.coalescer = QueryCoalescer()
+        # 模式目录缓存
+        self.schema_catalog = SchemaCatalog(refresh_interval=config.get('schema_refresh_interval', 30))
+        # 查询调度：限制并发并按通道和用户公平排队，未配置并发数时与执行线程池或连接池大小一致
+        self.scheduler: Optional[FairShareScheduler] = None
+        if config.get('scheduler_enabled', False):
+            self.scheduler = FairShareScheduler(
+                max_concurrency=(
+                    config.get('scheduler_max_concurrency')
+                    or config.get('executor_workers')
+                    or config.get('pool_size')
+                    or 8
+                ),
+                max_queue_size=config.get('scheduler_max_queue_size', 1000)
+            )
+        # 预览查询：返回行数、延迟目标（毫秒）和抽样比例下限（百分比）
+        self.preview_rows = config.get('preview_rows', 200)
+        self.preview_latency_ms = config.get('preview_latency_ms', 1500)
+        self.preview_min_sample_percent = config.get('preview_min_sample_percent', 1.0)
+        # 批量执行的默认并行度
+        self.batch_max_parallel = config.get('batch_max_parallel', 4)
     
     @abstractmethod
     async def connect(self) -> bool:
@@ -79,19 +283,336 @@ class BaseQueryEngine(ABC):
         """断开数据库连接"""
         pass
     
-    @abstractmethod
     async def execute_query(
+        self,
+        sql: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[int] = None,
+        use_cache: bool = True
+    ) -> QueryResult:
+        """
+        执行查询
+        
+        启用结果缓存时，先按规范化SQL和参数查找缓存，
+        缓存条目对应的表数据版本变化后自动失效；
+        启用查询合并时，并发的相同只读查询共享同一次执行；
+        启用调度时，实际执行前按通道和用户排队获取执行名额
+        
+        Args:
+            sql: SQL语句
+            params: 查询参数
+            timeout: 查询时限（秒）
+            use_cache: 是否使用结果缓存
+        """
+        query_key = make_query_key(sql, params)
+        cache_write = None
+        
+        if use_cache and self.result_cache is not None and self.result_cache.is_cacheable(sql):
+            if not self.is_connected:
+                await self.connect()
+            
+            candidate = CacheWrite(extract_tables(sql))
+            token = current_cache_write.set(candidate)
+            try:
+                # 执行前读取数据版本，执行期间发生的变更会使该条目在下次读取时失效；
+                # 有对象没有版本（视图、未记录更新时间的表）时不使用缓存
+                candidate.table_versions = (
+                    await self._get_table_versions(candidate.tables) if candidate.tables else {}
+                )
+                if candidate.table_versions is not None:
+                    cache_write = candidate
+            except Exception as e:
+                logger.warning(f"读取表数据版本失败，跳过结果缓存: {e}")
+            finally:
+                current_cache_write.reset(token)
+            
+            if cache_write is not None:
+                cached_result = self.result_cache.get(query_key, cache_write.table_versions)
+                if cached_result is not None:
+                    logger.info(f"查询结果缓存命中，返回 {cached_result.row_count} 行")
+                    return cached_result
+        
+        if self.coalescer is None or not normalize_sql(sql).upper().startswith(("SELECT", "WITH")):
+            return await self._execute_and_cache(query_key, sql, params, timeout, cache_write)
+        
+        # 合并键包含缓存状态，避免不使用缓存的调用方加入会写缓存的执行
+        result, joined = await self.coalescer.run(
+            f"{query_key}:{cache_write is not None}",
+            lambda: self._execute_and_cache(query_key, sql, params, timeout, cache_write)
+        )
+        
+        # 各调用方拿到独立的元数据，行数据和Arrow表共享
+        result = copy.copy(result)
+        result.metadata = dict(result.metadata)
+        if joined:
+            result.metadata["coalesced"] = True
+            logger.info(f"查询已合并到执行中的相同查询，返回 {result.row_count} 行")
+        return result
+    
+    async def execute_preview(
+        self,
+        sql: str,
+        params: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None
+    ) -> QueryResult:
+        """
+        预览执行：在延迟目标内返回前 limit 行
+        
+        估计耗时超过延迟目标的单表聚合查询，在支持抽样的引擎上改写为 TABLESAMPLE 近似，
+        COUNT/SUM 列按抽样比例放大；结果 metadata 中 preview_exact 为 False 时，
+        调用方需另行执行完整查询获得精确结果和总行数
+        
+        Raises:
+            QueryTimeoutException: 预览查询超过延迟目标
+        """
+        limit = limit or self.preview_rows
+        timeout = self.preview_latency_ms / 1000
+        
+        if is_aggregate_query(sql):
+            estimate = await self.estimate_query_cost(sql)
+            estimated_ms = estimate.get("estimated_time_ms", 0)
+            if estimated_ms > self.preview_latency_ms:
+                percent = max(self.preview_min_sample_percent, 100.0 * self.preview_latency_ms / estimated_ms)
+                sampled_sql = sample_sql(sql, lambda table: self._sample_table_sql(table, percent))
+                if sampled_sql is not None:
+                    result = await self.execute_query(sampled_sql, params, timeout=timeout, use_cache=False)
+                    rows = scale_rows(result.get_rows(0, limit), additive_columns(sql), 100.0 / percent)
+                    return self._make_preview_result(
+                        sql, result, rows, False, {"preview_mode": "sample", "sample_percent": round(percent, 2)}
+                    )
+        
+        # 多取一行判断结果是否已完整
+        result = await self.execute_query(limit_sql(sql, limit + 1), params, timeout=timeout)
+        rows = result.get_rows(0, limit)
+        return self._make_preview_result(sql, result, rows, result.row_count <= limit, {"preview_mode": "limit"})
+    
+    def _make_preview_result(
+        self,
+        sql: str,
+        result: QueryResult,
+        rows: List[List[Any]],
+        exact: bool,
+        preview_info: Dict[str, Any]
+    ) -> QueryResult:
+        """封装预览结果，SQL保持为原始查询，实际执行的SQL记录在元数据中"""
+        return QueryResult(
+            columns=result.columns,
+            rows=rows,
+            row_count=len(rows),
+            execution_time_ms=result.execution_time_ms,
+            sql=sql,
+            metadata={
+                **result.metadata,
+                **preview_info,
+                "preview": True,
+                "preview_exact": exact,
+                "preview_sql": result.sql
+            },
+            encoder=result.encoder
+        )
+    
+    def _sample_table_sql(self, table: str, percent: float) -> Optional[str]:
+        """返回对表抽样的子查询，引擎不支持抽样时返回None"""
+        return None
+    
+    async def execute_many(
+        self,
+        statements: Sequence[str],
+        params: Optional[Sequence[Optional[Dict[str, Any]]]] = None,
+        max_parallel: Optional[int] = None,
+        timeout: Optional[int] = None,
+        use_cache: bool = True
+    ) -> AsyncIterator[StatementResult]:
+        """
+        并行执行多条语句，按完成顺序逐条返回结果
+        
+        最多 max_parallel 个工作协程，每个工作协程在整个批次中只签出一次连接，
+        依次领取语句执行；单条语句失败只记录在其结果中，不影响其他语句。
+        每条语句仍经过结果缓存、查询合并和调度
+        
+        Args:
+            statements: SQL语句列表
+            params: 与语句一一对应的参数
+            max_parallel: 最大并行数，为空时使用引擎配置
+            timeout: 单条语句的时限（秒）
+            use_cache: 是否使用结果缓存
+        """
+        if params is not None and len(params) != len(statements):
+            raise ValueError("参数列表与语句数量不一致")
+        if not statements:
+            return
+        
+        if not self.is_connected:
+            await self.connect()
+        
+        pending = iter(enumerate(statements))
+        results: asyncio.Queue = asyncio.Queue()
+        
+        async def drain():
+            # 工作协程共享同一个语句迭代器，空闲的协程领取下一条
+            for index, sql in pending:
+                start_time = time.perf_counter()
+                try:
+                    result = await self.execute_query(
+                        sql, params[index] if params is not None else None, timeout, use_cache
+                    )
+                    statement_result = StatementResult(index, sql, result=result)
+                except Exception as e:
+                    logger.warning(f"批量执行第 {index + 1} 条语句失败: {e}")
+                    statement_result = StatementResult(index, sql, error=e)
+                statement_result.elapsed_ms = int((time.perf_counter() - start_time) * 1000)
+                results.put_nowait(statement_result)
+        
+        async def worker():
+            try:
+                async with self._worker_session():
+                    await drain()
+            except Exception as e:
+                # 签出或归还连接失败时，剩余语句按单条签出连接继续执行
+                logger.warning(f"批量执行工作协程会话失败: {e}")
+                await drain()
+        
+        worker_count = max(1, min(max_parallel or self.batch_max_parallel, len(statements)))
+        workers = [asyncio.create_task(worker()) for _ in range(worker_count)]
+        try:
+            for _ in range(len(statements)):
+                yield await results.get()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+    
+    @asynccontextmanager
+    async def _worker_session(self) -> AsyncIterator[None]:
+        """批量执行工作协程的会话，引擎可在其中签出并固定一个连接"""
+        yield
+    
+    async def _execute_and_cache(
+        self,
+        query_key: str,
+        sql: str,
+        params: Optional[Dict[str, Any]],
+        timeout: Optional[int],
+        cache_write: Optional[CacheWrite]
+    ) -> QueryResult:
+        """执行查询，并在可缓存且执行方未放弃写入时写入结果缓存"""
+        token = current_cache_write.set(cache_write)
+        try:
+            if self.scheduler is None:
+                result = await self._execute_query(sql, params, timeout)
+                schedule_info = None
+            else:
+                result, schedule_info = await self._execute_scheduled(sql, params, timeout)
+        finally:
+            current_cache_write.reset(token)
+        
+        if cache_write is not None and not cache_write.rejected:
+            self.result_cache.put(query_key, result, cache_write.tables, cache_write.table_versions)
+        
+        if schedule_info is not None:
+            # 调度信息只属于本次执行，不写入缓存的结果
+            result = copy.copy(result)
+            result.metadata = {**result.metadata, **schedule_info}
+        return result
+    
+    async def _execute_scheduled(
+        self,
+        sql: str,
+        params: Optional[Dict[str, Any]],
+        timeout: Optional[float]
+    ) -> Tuple[QueryResult, Dict[str, Any]]:
+        """
+        获取调度名额后执行查询，排队时间计入查询时限
+        
+        Returns:
+            (查询结果, 调度信息 {"lane", "user", "queue_wait_ms", "execution_ms"})
+        """
+        timeout = timeout or self.query_timeout
+        deadline = time.monotonic() + timeout if timeout else None
+        
+        async with self.scheduler.slot(timeout) as schedule_info:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise QueryTimeoutException("查询在排队期间已超时")
+            
+            start_time = time.perf_counter()
+            result = await self._execute_query(sql, params, remaining)
+            schedule_info["execution_ms"] = int((time.perf_counter() - start_time) * 1000)
+        
+        return result, schedule_info
+    
+    @abstractmethod
+    async def _execute_query(
         self, 
         sql: str, 
         params: Optional[Dict[str, Any]] = None,
         timeout: Optional[int] = None
     ) -> QueryResult:
-        """执行查询"""
+        """在数据库中执行查询"""
         pass
     
-    @abstractmethod
+    async def _get_table_versions(self, tables: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        获取各表的数据版本，表数据变更后版本随之变化
+        
+        有引用的对象无法确定版本时返回None，本次查询不使用结果缓存；
+        默认不提供版本，缓存条目只按有效期过期
+        """
+        return {}
+    
+    def invalidate_result_cache(self, tables: Optional[List[str]] = None) -> int:
+        """
+        使结果缓存失效
+        
+        Args:
+            tables: 发生变更的表，为空时清空全部缓存
+            
+        Returns:
+            失效的条目数
+        """
+        if self.result_cache is None:
+            return 0
+        
+        if tables is None:
+            count = self.result_cache.get_stats()["entries"]
+            self.result_cache.clear()
+            return count
+        
+        return self.result_cache.invalidate_tables(tables)
+    
     async def get_schema_info(self, table_name: Optional[str] = None) -> Dict[str, Any]:
-        """获取数据库模式信息"""
+        """
+        获取数据库模式信息
+        
+        从进程内的模式目录读取，目录按刷新间隔检查表版本并增量更新
+        
+        Args:
+            table_name: 表名，为空时返回表列表，否则返回该表的列信息
+        """
+        try:
+            if not self.is_connected:
+                await self.connect()
+            
+            await self.schema_catalog.refresh(self)
+            
+            if table_name:
+                return {"tables": [], "columns": self.schema_catalog.get_columns(table_name)}
+            return {"tables": self.schema_catalog.get_tables(), "columns": []}
+            
+        except Exception as e:
+            logger.error(f"获取模式信息失败: {e}")
+            return {"tables": [], "columns": []}
+    
+    @abstractmethod
+    async def _load_catalog_tables(self) -> Dict[str, Tuple[Dict[str, Any], Any]]:
+        """加载表列表，返回 {表名: (表信息, 版本)}，版本在表结构或数据变更后应发生变化"""
+        pass
+    
+    @abstractmethod
+    async def _load_catalog_columns(self, table_names: Optional[List[str]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """加载列信息，返回 {表名: 列信息列表}，table_names为空时加载全部表"""
         pass
     
     @abstractmethod
@@ -99,11 +620,41 @@ class BaseQueryEngine(ABC):
         """验证SQL语法"""
         pass
     
+    async def execute_query_stream(
+        self,
+        sql: str,
+        params: Optional[Dict[str, Any]] = None,
+        batch_size: Optional[int] = None
+    ) -> AsyncIterator[ResultBatch]:
+        """
+        流式执行查询，按固定大小的批次返回结果
+        
+        默认实现先执行完整查询再切分批次，具体引擎应覆盖为真正的流式读取
+        
+        Args:
+            sql: SQL语句
+            params: 查询参数
+            batch_size: 每批行数，为空时使用引擎配置
+        """
+        batch_size = batch_size or self.stream_batch_size
+        result = await self.execute_query(sql, params)
+        
+        for batch_index, offset in enumerate(range(0, result.row_count, batch_size)):
+            yield ResultBatch(
+                columns=result.columns,
+                rows=result.get_rows(offset, batch_size),
+                batch_index=batch_index,
+                offset=offset
+            )
+    
     async def test_connection(self) -> bool:
         """测试数据库连接"""
         try:
             test_sql = "SELECT 1 as test_connection"
-            result = await self.execute_query(test_sql)
+            # 绕过结果缓存和调度排队，直接在连接池上执行
+            if not self.is_connected:
+                await self.connect()
+            result = await self._execute_query(test_sql)
             return result.row_count > 0
         except Exception as e:
             logger.error(f"连接测试失败: {e}")
@@ -114,20 +665,42 @@ class BaseQueryEngine(ABC):
         sql: str,
         params: Optional[Dict[str, Any]] = None,
         max_retries: int = 3,
-        retry_delay: float = 1.0
+        retry_delay: float = 1.0,
+        timeout: Optional[float] = None
     ) -> QueryResult:
-        """带重试的查询执行"""
+        """
+        带重试的查询执行
+        
+        所有重试共享同一个截止时间，每次尝试只能使用剩余的时间预算
+        
+        Args:
+            timeout: 总时间预算（秒），为空时使用引擎默认时限
+        """
         last_exception = None
+        timeout = timeout or self.query_timeout
+        deadline = time.monotonic() + timeout if timeout else None
         
         for attempt in range(max_retries):
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise QueryTimeoutException(f"查询超过 {timeout:.1f}s 时间预算，已尝试 {attempt} 次")
+            
             try:
-                return await self.execute_query(sql, params)
+                return await self.execute_query(sql, params, timeout=remaining)
+            except (QueryCancelledException, QueryTimeoutException):
+                # 已取消或耗尽时间预算的查询不再重试
+                raise
             except Exception as e:
                 last_exception = e
                 logger.warning(f"查询执行失败 (尝试 {attempt + 1}/{max_retries}): {e}")
                 
                 if attempt < max_retries - 1:
-                    await asyncio.sleep(retry_delay * (2 ** attempt))  # 指数退避
+                    backoff = retry_delay * (2 ** attempt)  # 指数退避
+                    if deadline is not None and time.monotonic() + backoff >= deadline:
+                        raise QueryTimeoutException(f"查询超过 {timeout:.1f}s 时间预算，最后一次错误: {e}")
+                    await asyncio.sleep(backoff)
                 else:
                     break
         
@@ -195,30 +768,54 @@ class BaseQueryEngine(ABC):
         columns: List[str],
         rows: List[List[Any]],
         execution_time_ms: int,
-        sql: str
+        sql: str,
+        description: Optional[Any] = None
     ) -> QueryResult:
-        """格式化查询结果"""
-        # 数据类型转换和格式化
-        formatted_rows = []
-        
-        for row in rows:
-            formatted_row = []
-            for value in row:
-                # 处理特殊数据类型
-                if isinstance(value, datetime):
-                    formatted_row.append(value.isoformat())
-                elif value is None:
-                    formatted_row.append(None)
-                else:
-                    formatted_row.append(value)
-            formatted_rows.append(formatted_row)
+        """
+        格式化查询结果
+        
+        Args:
+            description: 游标的 description，提供时按列类型选择转换器，只转换需要转换的列
+        """
+        encoder = self._get_result_encoder(description, len(columns))
+        formatted_rows = encoder.format_rows(rows)
         
         return QueryResult(
             columns=columns,
             rows=formatted_rows,
             row_count=len(formatted_rows),
             execution_time_ms=execution_time_ms,
-            sql=sql
+            sql=sql,
+            encoder=encoder
+        )
+    
+    def _get_result_encoder(self, description: Optional[Any], column_count: int) -> ResultEncoder:
+        """根据游标 description 创建结果编码器，没有类型信息时逐列检查值类型"""
+        if description:
+            return ResultEncoder.from_description(description, self.result_type_system)
+        return ResultEncoder.generic(column_count)
+    
+    def _format_rows(self, rows: List[List[Any]], encoder: Optional[ResultEncoder] = None) -> List[List[Any]]:
+        """格式化行数据（按列转换日期时间等特殊类型）"""
+        if encoder is None:
+            encoder = ResultEncoder.generic(len(rows[0]) if rows else 0)
+        return encoder.format_rows(rows)
+    
+    def _format_arrow_result(
+        self,
+        table: Any,
+        execution_time_ms: int,
+        sql: str
+    ) -> QueryResult:
+        """封装Arrow列式查询结果，行数据在分页或序列化时按需转换"""
+        return QueryResult(
+            columns=list(table.column_names),
+            rows=None,
+            row_count=table.num_rows,
+            execution_time_ms=execution_time_ms,
+            sql=sql,
+            arrow_table=table,
+            encoder=ResultEncoder.from_arrow_schema(table.schema)
         )
     
     async def get_table_list(self) -> List[Dict[str, str]]:
@@ -240,11 +837,26 @@ class BaseQueryEngine(ABC):
             return []
     
     async def estimate_query_cost(self, sql: str) -> Dict[str, Any]:
-        """估算查询成本（可选实现）"""
+        """
+        估算查询成本（可选实现）
+        
+        实现只能读取查询计划而不能执行查询，返回的关键字段:
+            estimated_rows: 估计结果行数
+            scan_rows: 估计扫描行数
+            scan_bytes: 估计扫描数据量（字节）
+        """
+        return self._empty_cost_estimate()
+    
+    @staticmethod
+    def _empty_cost_estimate() -> Dict[str, Any]:
+        """无法估算时的默认成本"""
         return {
             "estimated_rows": 0,
             "estimated_cost": 0.0,
-            "estimated_time_ms": 0
+            "estimated_time_ms": 0,
+            "scan_rows": 0,
+            "scan_bytes": 0,
+            "scanned_tables": []
         }
     
     def get_engine_info(self) -> Dict[str, Any]:
@@ -254,14 +866,26 @@ class BaseQueryEngine(ABC):
             "version": "1.0.0",
             "config": {k: v for k, v in self.config.items() if 'password' not in k.lower()},
             "is_connected": self.is_connected,
-            "features": self._get_supported_features()
+            "features": self._get_supported_features(),
+            "result_cache": self.result_cache.get_stats() if self.result_cache else None,
+            "coalescing": self.coalescer.get_stats() if self.coalescer else None,
+            "schema_catalog": self.schema_catalog.get_stats(),
+            "scheduler": self.scheduler.get_stats() if self.scheduler else None
         }
     
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """获取连接池指标（由子类提供）"""
+        return {}
+    
     def _get_supported_features(self) -> List[str]:
         """获取支持的功能列表"""
         return [
             "basic_query",
             "schema_inspection",
             "sql_validation",
-            "connection_test"
+            "connection_test",
+            "streaming_query",
+            "result_cache",
+            "query_coalescing",
+            "preview_query"
         ]
\ No newline at end of file
@@ -0,0 +1,129 @@
+"""
+查询合并（single-flight）
+相同的查询并发到达时只执行一次，所有调用方共享同一个执行结果
+"""
+import asyncio
+import uuid
+from typing import Dict, Any, Optional, Callable, Awaitable, Tuple
+
+from .query_registry import query_registry, current_task_id
+from utils.logger import get_logger
+from utils.exceptions import QueryCancelledException
+
+logger = get_logger(__name__)
+
+
+def _cancel_future(future: asyncio.Future):
+    """取消尚未完成的Future"""
+    if not future.done():
+        future.cancel()
+
+
+class InFlightQuery:
+    """执行中的共享查询"""
+    
+    def __init__(self, key: str):
+        self.key = key
+        # 共享执行使用独立的任务ID，单个调用方取消任务时不会中断该语句
+        self.task_id = f"coalesced-{uuid.uuid4().hex[:12]}"
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+
+
+class QueryCoalescer:
+    """
+    查询合并器
+    
+    调用方按引用计数共享执行：某个调用方被取消时只退出等待，
+    最后一个调用方离开时才中断仍在执行的语句
+    """
+    
+    def __init__(self):
+        self._flights: Dict[str, InFlightQuery] = {}
+        
+        # 统计信息
+        self._executions = 0
+        self._coalesced = 0
+        self._aborted = 0
+    
+    async def run(self, key: str, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        执行或加入相同键的查询
+        
+        Args:
+            key: 查询键
+            func: 实际执行查询的协程函数
+        
+        Returns:
+            (查询结果, 是否加入了已在执行的查询)
+        """
+        flight = self._flights.get(key)
+        joined = flight is not None
+        
+        if flight is None:
+            flight = InFlightQuery(key)
+            flight.task = asyncio.ensure_future(self._run_flight(flight, func))
+            flight.task.add_done_callback(lambda task: self._on_flight_done(flight))
+            self._flights[key] = flight
+            self._executions += 1
+        else:
+            self._coalesced += 1
+        
+        return await self._wait(flight), joined
+    
+    async def _run_flight(self, flight: InFlightQuery, func: Callable[[], Awaitable[Any]]) -> Any:
+        """在共享任务ID下执行查询"""
+        with query_registry.task_scope(flight.task_id):
+            return await func()
+    
+    async def _wait(self, flight: InFlightQuery) -> Any:
+        """等待共享执行完成，当前任务被取消时只退出等待"""
+        loop = asyncio.get_running_loop()
+        cancelled = loop.create_future()
+        flight.waiters += 1
+        
+        try:
+            with query_registry.track(
+                current_task_id.get(),
+                lambda: loop.call_soon_threadsafe(_cancel_future, cancelled)
+            ):
+                await asyncio.wait({flight.task, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+                if not flight.task.done():
+                    raise QueryCancelledException("查询已取消")
+                return flight.task.result()
+        finally:
+            flight.waiters -= 1
+            _cancel_future(cancelled)
+            if flight.waiters == 0 and not flight.task.done():
+                self._abort(flight)
+    
+    def _abort(self, flight: InFlightQuery):
+        """所有调用方都已离开，中断共享执行"""
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+        self._aborted += 1
+        asyncio.ensure_future(self._cancel_flight(flight))
+    
+    async def _cancel_flight(self, flight: InFlightQuery):
+        """中断共享执行中的语句并取消任务"""
+        try:
+            await query_registry.cancel(flight.task_id)
+        finally:
+            flight.task.cancel()
+        logger.info(f"合并查询的所有调用方均已取消，已中断执行: {flight.task_id}")
+    
+    def _on_flight_done(self, flight: InFlightQuery):
+        """共享执行结束后移除登记，并取回异常避免未处理异常告警"""
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+        if not flight.task.cancelled():
+            flight.task.exception()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并统计信息"""
+        return {
+            "in_flight": len(self._flights),
+            "executions": self._executions,
+            "coalesced": self._coalesced,
+            "aborted": self._aborted
+        }
@@ -3,26 +3,78 @@ DuckDB查询引擎实现
 用于开发和测试环境的轻量级查询引擎
 """
 import asyncio
+import json
+import re
+import threading
 import time
-from typing import Dict, List, Any, Optional
+import weakref
+from typing import Dict, List, Any, Optional, AsyncIterator, Tuple
 from pathlib import Path
 
 import duckdb
 
-from .base_engine import BaseQueryEngine, QueryResult
+from .base_engine import BaseQueryEngine, QueryResult, ResultBatch, pa
+from .duckdb_executor import DuckDBExecutor
+from .duckdb_governor import DuckDBResourceGovernor
+from .statement_cache import PreparedStatementCache, summarize_statement_caches
+from .query_registry import query_registry, current_task_id
+from .rollup import RollupManager
 from utils.logger import get_logger
-from utils.exceptions import QueryEngineException
+from utils.exceptions import QueryEngineException, QueryCancelledException, QueryTimeoutException
 
 logger = get_logger(__name__)
 
+# 文本执行计划中的基数估计（新版本为 "~1,000 rows"，旧版本为 "EC: 1000"）和扫描表名
+_PLAN_CARDINALITY_PATTERN = re.compile(r"~([\d,]+) [Rr]ows|EC: ?([\d,]+)")
+_PLAN_TABLE_PATTERN = re.compile(r"Table: ?([\w.\"]+)")
+
+# 各数据类型的估算宽度（字节），变长类型按平均长度估算
+_DEFAULT_COLUMN_WIDTH = 16
+_DUCKDB_TYPE_WIDTHS = {
+    "BOOLEAN": 1, "TINYINT": 1, "UTINYINT": 1,
+    "SMALLINT": 2, "USMALLINT": 2,
+    "INTEGER": 4, "UINTEGER": 4, "FLOAT": 4, "DATE": 4,
+    "BIGINT": 8, "UBIGINT": 8, "DOUBLE": 8, "DECIMAL": 8, "TIME": 8,
+    "TIMESTAMP": 8, "TIMESTAMP WITH TIME ZONE": 8,
+    "HUGEINT": 16, "UHUGEINT": 16, "UUID": 16, "INTERVAL": 16,
+    "VARCHAR": 32, "BLOB": 64
+}
+
 
 class DuckDBQueryEngine(BaseQueryEngine):
     """DuckDB查询引擎"""
     
+    result_type_system = "duckdb"
+    
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         self.db_path = config.get('path', ':memory:')
         self.connection = None
+        # 结果格式: arrow（列式，按需转换）或 rows（行式）
+        self.result_format = config.get('result_format', 'arrow')
+        self.arrow_batch_size = config.get('arrow_batch_size', 100000)
+        # 执行线程池配置
+        self.executor_workers = config.get('executor_workers', 4)
+        self.executor_queue_size = config.get('executor_queue_size', 100)
+        self.executor: Optional[DuckDBExecutor] = None
+        # 资源管控：内存、线程、临时目录
+        self.governor = DuckDBResourceGovernor(
+            memory_limit=config.get('memory_limit'),
+            memory_fraction=config.get('memory_fraction', 0.75),
+            threads=config.get('threads', 0),
+            temp_directory=config.get('temp_directory'),
+            max_temp_directory_size=config.get('max_temp_directory_size'),
+            enable_progress_bar=config.get('enable_progress_bar', False)
+        )
+        # 预处理语句缓存：每个工作线程游标一个，0表示不使用
+        self.statement_cache_size = config.get('prepared_statement_cache_size', 128)
+        self._statement_caches: "weakref.WeakKeyDictionary[Any, PreparedStatementCache]" = weakref.WeakKeyDictionary()
+        self._statement_caches_lock = threading.Lock()
+        # 预聚合表：高频聚合查询改写为读取预聚合结果
+        self.rollup_enabled = config.get('rollup_enabled', False)
+        self.rollups: Optional[RollupManager] = None
+        # 写入代数：每次 invalidate_result_cache 加一，作为结果缓存数据版本的一部分
+        self._write_generation = 0
     
     async def connect(self) -> bool:
         """建立DuckDB连接"""
@@ -43,8 +95,20 @@ class DuckDBQueryEngine(BaseQueryEngine):
             if test_result[0] != 1:
                 raise QueryEngineException("DuckDB连接测试失败")
             
+            # 创建执行线程池，查询不在事件循环线程中执行
+            with self._statement_caches_lock:
+                self._statement_caches.clear()
+            self.executor = DuckDBExecutor(
+                self.connection,
+                max_workers=self.executor_workers,
+                max_queue_size=self.executor_queue_size
+            )
+            
             self.is_connected = True
             logger.info(f"DuckDB连接成功: {self.db_path}")
+            
+            if self.rollup_enabled:
+                await self._start_rollups()
             return True
             
         except Exception as e:
@@ -54,6 +118,14 @@ class DuckDBQueryEngine(BaseQueryEngine):
     async def disconnect(self) -> bool:
         """断开DuckDB连接"""
         try:
+            if self.rollups:
+                await self.rollups.close()
+                self.rollups = None
+            
+            if self.executor:
+                self.executor.shutdown()
+                self.executor = None
+            
             if self.connection:
                 self.connection.close()
                 self.connection = None
@@ -65,87 +137,285 @@ class DuckDBQueryEngine(BaseQueryEngine):
             logger.error(f"DuckDB断开连接失败: {e}")
             return False
     
-    async def execute_query(
+    async def _start_rollups(self):
+        """启动预聚合表管理，失败时不影响查询"""
+        rollups = RollupManager(
+            self,
+            min_frequency=self.config.get('rollup_min_frequency', 5),
+            max_rollups=self.config.get('rollup_max_rollups', 20),
+            max_dimensions=self.config.get('rollup_max_dimensions', 6),
+            min_base_rows=self.config.get('rollup_min_base_rows', 100000),
+            history_days=self.config.get('rollup_history_days', 30),
+            mine_interval=self.config.get('rollup_mine_interval', 3600),
+            refresh_interval=self.config.get('rollup_refresh_interval', 60),
+            full_rebuild_interval=self.config.get('rollup_full_rebuild_interval', 86400),
+            verify_interval=self.config.get('rollup_verify_interval', 0)
+        )
+        try:
+            await rollups.start()
+            self.rollups = rollups
+        except Exception as e:
+            logger.warning(f"预聚合表管理启动失败，查询不做改写: {e}")
+    
+    async def _execute_query(
         self,
         sql: str,
         params: Optional[Dict[str, Any]] = None,
         timeout: Optional[int] = None
     ) -> QueryResult:
-        """执行DuckDB查询"""
+        """
+        执行DuckDB查询
+        
+        Args:
+            timeout: 查询时限（秒），包含排队等待时间，为空时使用引擎默认时限
+        """
         if not self.is_connected:
             await self.connect()
         
         # 清理SQL
         sql = self._sanitize_sql(sql)
         
+        # 截止时间从提交时开始计算，超时后中断语句
+        timeout = timeout or self.query_timeout
+        deadline = time.monotonic() + timeout if timeout else None
+        
         try:
             start_time = time.time()
             
-            # 执行查询
-            if params:
-                cursor = self.connection.execute(sql, params)
-            else:
-                cursor = self.connection.execute(sql)
+            # 命中预聚合表时执行改写后的SQL，结果中保留原SQL
+            executed_sql, rollup_name = sql, None
+            if self.rollups and not params:
+                executed_sql, rollup_name = await self.rollups.rewrite(sql)
             
-            # 获取结果
-            columns = [desc[0] for desc in cursor.description] if cursor.description else []
-            rows = cursor.fetchall()
+            # 在执行线程池中使用线程独立的游标执行查询
+            description, rows, table = await self.executor.run_with_cursor(
+                self._run_query, executed_sql, params, current_task_id.get(), deadline
+            )
             
             execution_time_ms = int((time.time() - start_time) * 1000)
             
-            logger.info(f"DuckDB查询执行成功，返回 {len(rows)} 行，耗时 {execution_time_ms}ms")
-            
-            return self._format_query_result(columns, rows, execution_time_ms, sql)
-            
+            if table is not None:
+                logger.info(f"DuckDB查询执行成功，返回 {table.num_rows} 行（Arrow），耗时 {execution_time_ms}ms")
+                result = self._format_arrow_result(table, execution_time_ms, sql)
+            else:
+                logger.info(f"DuckDB查询执行成功，返回 {len(rows)} 行，耗时 {execution_time_ms}ms")
+                columns = [desc[0] for desc in description] if description else []
+                result = self._format_query_result(columns, rows, execution_time_ms, sql, description)
+            
+            if rollup_name:
+                result.metadata["rollup"] = rollup_name
+            return result
+            
+        except QueryCancelledException:
+            logger.info("DuckDB查询已取消")
+            raise
+        except QueryTimeoutException:
+            logger.warning(f"DuckDB查询超时（{timeout:.1f}s）: {sql[:100]}")
+            raise
         except Exception as e:
             logger.error(f"DuckDB查询执行失败: {e}")
             raise QueryEngineException(f"查询执行失败: {e}")
     
-    async def get_schema_info(self, table_name: Optional[str] = None) -> Dict[str, Any]:
-        """获取DuckDB模式信息"""
+    async def execute_query_stream(
+        self,
+        sql: str,
+        params: Optional[Dict[str, Any]] = None,
+        batch_size: Optional[int] = None
+    ) -> AsyncIterator[ResultBatch]:
+        """流式执行DuckDB查询，使用独立游标按批次fetchmany"""
+        if not self.is_connected:
+            await self.connect()
+        
+        # 清理SQL
+        sql = self._sanitize_sql(sql)
+        batch_size = batch_size or self.stream_batch_size
+        
+        # 独立游标避免与其他查询共享结果集，每次读取都在执行线程池中完成
+        cursor = await self.executor.run(self.connection.cursor)
+        task_id = current_task_id.get()
         try:
-            schema_info = {"tables": [], "columns": []}
-            
-            if table_name:
-                # 获取指定表的列信息
-                columns_sql = """
-                    SELECT column_name, data_type, is_nullable, column_default
-                    FROM information_schema.columns 
-                    WHERE table_name = ?
-                    ORDER BY ordinal_position
-                """
-                cursor = self.connection.execute(columns_sql, [table_name])
-                columns = cursor.fetchall()
+            start_time = time.time()
+            
+            with query_registry.track(task_id, cursor.interrupt):
+                await self.executor.run(self._execute_statement, cursor, sql, params)
                 
-                for col in columns:
-                    schema_info["columns"].append({
-                        "column_name": col[0],
-                        "data_type": col[1],
-                        "is_nullable": col[2] == 'YES',
-                        "default_value": col[3]
-                    })
-            else:
-                # 获取所有表信息
-                tables_sql = """
-                    SELECT table_name, table_type
-                    FROM information_schema.tables 
-                    WHERE table_schema = 'main'
-                    ORDER BY table_name
-                """
-                cursor = self.connection.execute(tables_sql)
-                tables = cursor.fetchall()
+                columns = [desc[0] for desc in cursor.description] if cursor.description else []
+                encoder = self._get_result_encoder(cursor.description, len(columns))
                 
-                for table in tables:
-                    schema_info["tables"].append({
-                        "table_name": table[0],
-                        "table_type": table[1]
-                    })
+                batch_index = 0
+                offset = 0
+                while True:
+                    query_registry.check(task_id)
+                    
+                    rows = await self.executor.run(cursor.fetchmany, batch_size)
+                    if not rows:
+                        break
+                    
+                    yield ResultBatch(
+                        columns=columns,
+                        rows=self._format_rows(rows, encoder),
+                        batch_index=batch_index,
+                        offset=offset
+                    )
+                    
+                    batch_index += 1
+                    offset += len(rows)
             
-            return schema_info
+            execution_time_ms = int((time.time() - start_time) * 1000)
+            logger.info(f"DuckDB流式查询完成，共 {batch_index} 批 {offset} 行，耗时 {execution_time_ms}ms")
             
+        except QueryCancelledException:
+            logger.info("DuckDB流式查询已取消")
+            raise
+        except Exception as e:
+            logger.error(f"DuckDB流式查询失败: {e}")
+            raise QueryEngineException(f"流式查询执行失败: {e}")
+        finally:
+            cursor.close()
+    
+    def _arrow_reader(self, cursor: Any) -> Any:
+        """按批读取结果的Arrow记录批次读取器；to_arrow_reader 之前的版本使用 fetch_record_batch"""
+        to_arrow_reader = getattr(cursor, "to_arrow_reader", None)
+        if to_arrow_reader is None:
+            return cursor.fetch_record_batch(self.arrow_batch_size)
+        return to_arrow_reader(self.arrow_batch_size)
+    
+    def _execute_statement(self, cursor: Any, sql: str, params: Optional[Any] = None):
+        """在游标上执行SQL（工作线程中调用）"""
+        if params:
+            cursor.execute(sql, params)
+        else:
+            cursor.execute(sql)
+    
+    def _run_query(
+        self,
+        cursor: Any,
+        sql: str,
+        params: Optional[Any] = None,
+        task_id: Optional[str] = None,
+        deadline: Optional[float] = None
+    ):
+        """执行查询并读取完整结果（工作线程中调用），返回 (游标描述, 行数据, Arrow表)"""
+        timer = None
+        timed_out = threading.Event()
+        
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise QueryTimeoutException("DuckDB查询在排队期间已超时")
+            
+            def interrupt_on_deadline():
+                timed_out.set()
+                cursor.interrupt()
+            
+            timer = threading.Timer(remaining, interrupt_on_deadline)
+            timer.daemon = True
+            timer.start()
+        
+        try:
+            # 登记当前游标，取消任务时通过 interrupt() 中断语句；按并发数调整线程数
+            with query_registry.track(task_id, cursor.interrupt), self.governor.query_slot(cursor):
+                self._execute_prepared(cursor, sql, params)
+                
+                # 列式结果：按批读取Arrow记录批次，避免逐行构造Python对象
+                if self._use_arrow() and cursor.description:
+                    return None, None, self._arrow_reader(cursor).read_all()
+                
+                return cursor.description, cursor.fetchall(), None
         except Exception as e:
-            logger.error(f"获取DuckDB模式信息失败: {e}")
-            return {"tables": [], "columns": []}
+            if timed_out.is_set():
+                raise QueryTimeoutException("DuckDB查询超过执行时限，已中断") from e
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+    
+    def _execute_prepared(self, cursor: Any, sql: str, params: Optional[Any] = None):
+        """
+        参数化查询使用游标上缓存的已解析语句执行（工作线程中调用）
+        
+        DuckDB的Python接口不提供预处理语句句柄，SQL级的 EXECUTE 也不接受绑定参数，
+        这里缓存 extract_statements 解析出的语句对象，参数始终由驱动原生绑定，
+        重复执行时跳过SQL解析；语句对象与游标的会话无关，按游标缓存只为统计和淘汰
+        """
+        if not params or self.statement_cache_size <= 0:
+            self._execute_statement(cursor, sql, params)
+            return
+        
+        statement = sql.rstrip().rstrip(";")
+        cache = self._get_statement_cache(cursor)
+        name = cache.lookup(statement)
+        if name is None:
+            parsed = cursor.extract_statements(statement)
+            # 多条语句直接执行
+            if len(parsed) != 1:
+                self._execute_statement(cursor, sql, params)
+                return
+            name, _ = cache.add(statement, parsed[0])
+        
+        cursor.execute(cache.get_handle(name), params)
+    
+    def _get_statement_cache(self, cursor: Any) -> PreparedStatementCache:
+        """获取游标的预处理语句缓存（首次使用时创建）"""
+        with self._statement_caches_lock:
+            cache = self._statement_caches.get(cursor)
+            if cache is None:
+                cache = PreparedStatementCache(self.statement_cache_size)
+                self._statement_caches[cursor] = cache
+            return cache
+    
+    def _fetch_all(self, cursor: Any, sql: str, params: Optional[Any] = None) -> List[Any]:
+        """执行SQL并返回全部结果行（工作线程中调用）"""
+        self._execute_statement(cursor, sql, params)
+        return cursor.fetchall()
+    
+    def _use_arrow(self) -> bool:
+        """是否使用Arrow列式结果"""
+        return self.result_format == 'arrow' and pa is not None
+    
+    async def _load_catalog_tables(self) -> Dict[str, Tuple[Dict[str, Any], Any]]:
+        """加载DuckDB表列表，以表的定义语句作为版本（DDL变更后随之变化）"""
+        tables_sql = """
+            SELECT t.table_name, t.table_type, COALESCE(d.sql, v.sql)
+            FROM information_schema.tables t
+            LEFT JOIN duckdb_tables() d
+                ON d.database_name = t.table_catalog AND d.schema_name = t.table_schema AND d.table_name = t.table_name
+            LEFT JOIN duckdb_views() v
+                ON v.database_name = t.table_catalog AND v.schema_name = t.table_schema AND v.view_name = t.table_name
+            WHERE t.table_schema = 'main'
+            ORDER BY t.table_name
+        """
+        tables = await self.executor.run_with_cursor(self._fetch_all, tables_sql)
+        
+        return {
+            table[0]: ({"table_name": table[0], "table_type": table[1]}, table[2])
+            for table in tables
+        }
+    
+    async def _load_catalog_columns(self, table_names: Optional[List[str]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """加载DuckDB列信息，table_names为空时加载全部表"""
+        columns_sql = """
+            SELECT table_name, column_name, data_type, is_nullable, column_default
+            FROM information_schema.columns 
+            WHERE table_schema = 'main'
+        """
+        params = []
+        if table_names is not None:
+            columns_sql += f" AND table_name IN ({', '.join(['?'] * len(table_names))})"
+            params = list(table_names)
+        columns_sql += " ORDER BY table_name, ordinal_position"
+        
+        columns = await self.executor.run_with_cursor(self._fetch_all, columns_sql, params or None)
+        
+        table_columns: Dict[str, List[Dict[str, Any]]] = {}
+        for col in columns:
+            table_columns.setdefault(col[0], []).append({
+                "column_name": col[1],
+                "data_type": col[2],
+                "is_nullable": col[3] == 'YES',
+                "default_value": col[4]
+            })
+        return table_columns
     
     async def validate_sql(self, sql: str) -> Dict[str, Any]:
         """验证DuckDB SQL语法"""
@@ -154,8 +424,7 @@ class DuckDBQueryEngine(BaseQueryEngine):
             
             # 使用EXPLAIN来验证SQL语法
             explain_sql = f"EXPLAIN {sql}"
-            cursor = self.connection.execute(explain_sql)
-            cursor.fetchall()  # 消费结果
+            await self.executor.run_with_cursor(self._fetch_all, explain_sql)
             
             return {
                 "valid": True,
@@ -173,14 +442,8 @@ class DuckDBQueryEngine(BaseQueryEngine):
     async def _configure_duckdb(self):
         """配置DuckDB设置"""
         try:
-            # 设置内存限制
-            self.connection.execute("SET memory_limit='1GB'")
-            
-            # 设置线程数
-            self.connection.execute("SET threads=4")
-            
-            # 启用进度条（开发环境）
-            self.connection.execute("SET enable_progress_bar=true")
+            # 内存、线程、临时目录和进度条按配置及容器限制设置
+            self.governor.apply(self.connection)
             
             logger.info("DuckDB配置完成")
             
@@ -258,49 +521,173 @@ class DuckDBQueryEngine(BaseQueryEngine):
             """
             self.connection.execute(insert_products_sql)
             
+            # 示例数据重建后已缓存的结果全部失效，模式目录重新检查
+            self.invalidate_result_cache()
+            self.schema_catalog.invalidate()
+            
             logger.info("DuckDB示例数据创建完成")
             
         except Exception as e:
             logger.error(f"创建DuckDB示例数据失败: {e}")
     
     async def estimate_query_cost(self, sql: str) -> Dict[str, Any]:
-        """估算DuckDB查询成本"""
+        """
+        估算DuckDB查询成本
+        
+        只获取查询计划（EXPLAIN），不执行查询；从计划中读取各算子的基数估计和扫描的表，
+        再结合表的估计行数与列宽估算扫描数据量
+        """
         try:
             sql = self._sanitize_sql(sql)
-            
-            # 使用EXPLAIN ANALYZE来获取查询计划
-            explain_sql = f"EXPLAIN ANALYZE {sql}"
-            cursor = self.connection.execute(explain_sql)
-            plan = cursor.fetchall()
-            
-            # 简单解析执行计划（实际实现会更复杂）
-            estimated_rows = 0
-            for row in plan:
-                plan_line = str(row[0]) if row else ""
-                if "rows=" in plan_line:
-                    # 提取行数估计
-                    try:
-                        parts = plan_line.split("rows=")
-                        if len(parts) > 1:
-                            rows_part = parts[1].split()[0]
-                            estimated_rows = max(estimated_rows, int(float(rows_part)))
-                    except:
-                        pass
-            
-            return {
-                "estimated_rows": estimated_rows,
-                "estimated_cost": estimated_rows * 0.1,  # 简单的成本估算
-                "estimated_time_ms": estimated_rows // 100,  # 估算时间
-                "query_plan": [str(row[0]) for row in plan]
-            }
+            return await self.executor.run_with_cursor(self._estimate_plan_cost, sql)
             
         except Exception as e:
             logger.warning(f"DuckDB查询成本估算失败: {e}")
-            return {
-                "estimated_rows": 0,
-                "estimated_cost": 0.0,
-                "estimated_time_ms": 0
-            }
+            return self._empty_cost_estimate()
+    
+    def _estimate_plan_cost(self, cursor: Any, sql: str) -> Dict[str, Any]:
+        """读取查询计划并估算成本（工作线程中调用）"""
+        cardinalities: List[int] = []
+        scanned_tables: List[str] = []
+        
+        try:
+            # JSON格式的计划不受表名折行影响，优先使用
+            plan_rows = self._fetch_all(cursor, f"EXPLAIN (FORMAT JSON) {sql}")
+            query_plan = json.loads(plan_rows[0][1])
+            self._collect_plan_nodes(query_plan, cardinalities, scanned_tables)
+        except Exception:
+            # 旧版本DuckDB不支持FORMAT JSON，解析文本计划
+            plan_rows = self._fetch_all(cursor, f"EXPLAIN {sql}")
+            query_plan = "\n".join(str(row[1]) for row in plan_rows)
+            cardinalities = [
+                int((approx or ec).replace(",", ""))
+                for approx, ec in _PLAN_CARDINALITY_PATTERN.findall(query_plan)
+            ]
+            scanned_tables = _PLAN_TABLE_PATTERN.findall(query_plan)
+        
+        scan_rows, scan_bytes = self._estimate_scan_size(cursor, scanned_tables)
+        
+        return {
+            # 计划根节点的基数即结果行数估计
+            "estimated_rows": cardinalities[0] if cardinalities else 0,
+            "max_intermediate_rows": max(cardinalities) if cardinalities else 0,
+            "estimated_cost": float(sum(cardinalities)),
+            "estimated_time_ms": scan_rows // 50000,  # 粗略按每毫秒扫描5万行估算
+            "scan_rows": scan_rows,
+            "scan_bytes": scan_bytes,
+            "scanned_tables": scanned_tables,
+            "query_plan": query_plan
+        }
+    
+    def _collect_plan_nodes(
+        self,
+        nodes: List[Dict[str, Any]],
+        cardinalities: List[int],
+        scanned_tables: List[str]
+    ):
+        """递归收集JSON计划中的基数估计和被扫描的表"""
+        for node in nodes:
+            extra_info = node.get("extra_info") or {}
+            
+            cardinality = extra_info.get("Estimated Cardinality")
+            if cardinality is not None:
+                try:
+                    cardinalities.append(int(str(cardinality).lstrip("~").replace(",", "")))
+                except ValueError:
+                    pass
+            
+            table = extra_info.get("Table")
+            if table and "SCAN" in node.get("name", ""):
+                scanned_tables.append(table)
+            
+            self._collect_plan_nodes(node.get("children", []), cardinalities, scanned_tables)
+    
+    def _estimate_scan_size(self, cursor: Any, scanned_tables: List[str]) -> Tuple[int, int]:
+        """根据表的估计行数和列类型估算扫描行数与字节数（按整行宽度保守估算）"""
+        if not scanned_tables:
+            return 0, 0
+        
+        table_rows = {}
+        for database, schema, table, estimated_size in self._fetch_all(
+            cursor, "SELECT database_name, schema_name, table_name, estimated_size FROM duckdb_tables()"
+        ):
+            table_rows[f"{database}.{schema}.{table}"] = estimated_size or 0
+            table_rows.setdefault(table, estimated_size or 0)
+        
+        row_widths: Dict[str, int] = {}
+        for database, schema, table, data_type in self._fetch_all(
+            cursor, "SELECT database_name, schema_name, table_name, data_type FROM duckdb_columns()"
+        ):
+            width = _DUCKDB_TYPE_WIDTHS.get(data_type.split("(")[0].upper(), _DEFAULT_COLUMN_WIDTH)
+            for key in (f"{database}.{schema}.{table}", table):
+                row_widths[key] = row_widths.get(key, 0) + width
+        
+        scan_rows = 0
+        scan_bytes = 0
+        for table in scanned_tables:
+            name = table.replace('"', '')
+            key = name if name in table_rows else name.split(".")[-1]
+            rows = table_rows.get(key, 0)
+            scan_rows += rows
+            scan_bytes += rows * row_widths.get(key, _DEFAULT_COLUMN_WIDTH)
+        
+        return scan_rows, scan_bytes
+    
+    async def _get_table_versions(self, tables: List[str]) -> Optional[Dict[str, Any]]:
+        """获取DuckDB表的数据版本"""
+        return await self.executor.run_with_cursor(self._read_table_versions, tables)
+    
+    def _read_table_versions(self, cursor: Any, tables: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        读取表的数据版本（工作线程中调用）
+        
+        DuckDB没有表级修改时间，以估计行数、列数和写入代数作为版本；
+        行数不变的原地更新（UPDATE、等量的DELETE+INSERT）不改变前两项，
+        写入方必须调用 invalidate_result_cache 推进写入代数，
+        因此DuckDB的结果缓存默认关闭（DUCKDB_RESULT_CACHE_ENABLED）。
+        视图等不在 duckdb_tables() 中的对象没有版本，返回None
+        """
+        generation = self._write_generation
+        versions = {}
+        for database, schema, table, estimated_size, column_count in self._fetch_all(
+            cursor,
+            "SELECT database_name, schema_name, table_name, estimated_size, column_count FROM duckdb_tables()"
+        ):
+            for name in (table, f"{schema}.{table}", f"{database}.{schema}.{table}"):
+                if name.lower() in tables:
+                    versions[name.lower()] = (estimated_size, column_count, generation)
+        if any(table not in versions for table in tables):
+            return None
+        return versions
+    
+    def _sample_table_sql(self, table: str, percent: float) -> Optional[str]:
+        """DuckDB按数据块抽样（system），跳过未抽中块的扫描"""
+        if percent >= 100:
+            return None
+        return f"(SELECT * FROM {table} TABLESAMPLE {percent:.4g}%)"
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """获取执行线程池指标（DuckDB单连接，每个工作线程持有独立游标）"""
+        return self.executor.get_metrics() if self.executor else {}
+    
+    def get_engine_info(self) -> Dict[str, Any]:
+        """获取DuckDB引擎信息（含执行线程池和资源管控指标）"""
+        engine_info = super().get_engine_info()
+        engine_info["executor"] = self.executor.get_metrics() if self.executor else None
+        engine_info["resources"] = self.governor.get_metrics()
+        with self._statement_caches_lock:
+            caches = list(self._statement_caches.values())
+        engine_info["prepared_statements"] = summarize_statement_caches(caches, self.statement_cache_size)
+        engine_info["rollups"] = self.rollups.get_stats() if self.rollups else None
+        return engine_info
+    
+    def invalidate_result_cache(self, tables: Optional[List[str]] = None) -> int:
+        """使结果缓存失效，相关预聚合表同时标记为待重建"""
+        # 推进写入代数，失效前已开始执行的查询写入的条目在下次读取时版本不符
+        self._write_generation += 1
+        if self.rollups:
+            self.rollups.invalidate(tables)
+        return super().invalidate_result_cache(tables)
     
     def _get_supported_features(self) -> List[str]:
         """获取DuckDB支持的功能"""
@@ -314,5 +701,15 @@ class DuckDBQueryEngine(BaseQueryEngine):
             "sample_data_creation",
             "analytical_functions",
             "json_support",
-            "parquet_support"
+            "parquet_support",
+            "arrow_results",
+            "streaming_query",
+            "query_cancellation",
+            "query_timeout",
+            "result_cache",
+            "query_coalescing",
+            "schema_catalog",
+            "prepared_statements",
+            "rollup_tables",
+            "batch_execution"
         ]
\ No newline at end of file
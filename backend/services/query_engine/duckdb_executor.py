@@ -0,0 +1,142 @@
+"""
+DuckDB查询执行器
+在独立的有界线程池中执行DuckDB操作，避免阻塞事件循环
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Callable
+
+from utils.logger import get_logger
+from utils.exceptions import QueryEngineException
+
+logger = get_logger(__name__)
+
+
+class DuckDBExecutor:
+    """
+    DuckDB线程池执行器
+    
+    每个工作线程通过 connection.cursor() 持有独立的游标，
+    多个查询可以在不同线程上真正并行执行
+    """
+    
+    def __init__(
+        self,
+        connection: Any,
+        max_workers: int = 4,
+        max_queue_size: int = 100,
+        thread_name_prefix: str = "duckdb"
+    ):
+        self.connection = connection
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=thread_name_prefix
+        )
+        self._local = threading.local()
+        self._cursors: List[Any] = []
+        self._lock = threading.Lock()
+        
+        # 运行指标
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._total_wait_ms = 0.0
+        self._total_run_ms = 0.0
+    
+    async def run_with_cursor(self, func: Callable[..., Any], *args) -> Any:
+        """在工作线程中以该线程的游标执行 func(cursor, *args)"""
+        return await self._submit(lambda: func(self._get_thread_cursor(), *args))
+    
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        """在工作线程中执行 func(*args)"""
+        return await self._submit(lambda: func(*args))
+    
+    async def _submit(self, call: Callable[[], Any]) -> Any:
+        """提交任务到线程池，队列已满时直接拒绝"""
+        with self._lock:
+            if self._queued >= self.max_queue_size:
+                self._rejected += 1
+                raise QueryEngineException(f"DuckDB执行队列已满（{self.max_queue_size}），请稍后重试")
+            self._queued += 1
+        
+        submitted_at = time.perf_counter()
+        
+        def task():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._total_wait_ms += (started_at - submitted_at) * 1000
+            
+            succeeded = False
+            try:
+                result = call()
+                succeeded = True
+                return result
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._total_run_ms += (time.perf_counter() - started_at) * 1000
+                    if succeeded:
+                        self._completed += 1
+                    else:
+                        self._failed += 1
+        
+        future = self._executor.submit(task)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # 尚未开始执行的任务随协程一起取消，并归还队列名额
+            if future.cancel():
+                with self._lock:
+                    self._queued -= 1
+            raise
+    
+    def _get_thread_cursor(self) -> Any:
+        """获取当前工作线程的游标（首次使用时创建）"""
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self.connection.cursor()
+            self._local.cursor = cursor
+            with self._lock:
+                self._cursors.append(cursor)
+        return cursor
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取线程池运行指标"""
+        with self._lock:
+            finished = self._completed + self._failed
+            started = finished + self._running
+            return {
+                "pool_size": self.max_workers,
+                "max_queue_size": self.max_queue_size,
+                "active_workers": self._running,
+                "queue_depth": self._queued,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "thread_cursors": len(self._cursors),
+                "avg_wait_ms": round(self._total_wait_ms / started, 2) if started else 0.0,
+                "avg_run_ms": round(self._total_run_ms / finished, 2) if finished else 0.0
+            }
+    
+    def shutdown(self):
+        """关闭线程池并释放各线程的游标"""
+        self._executor.shutdown(wait=True)
+        
+        with self._lock:
+            cursors, self._cursors = self._cursors, []
+        
+        for cursor in cursors:
+            try:
+                cursor.close()
+            except Exception as e:
+                logger.warning(f"关闭DuckDB线程游标失败: {e}")
+        
+        logger.info("DuckDB执行线程池已关闭")
@@ -0,0 +1,207 @@
+"""
+DuckDB资源管控
+根据配置和容器（cgroup）限制设置内存、线程和临时目录，并随并发查询数调整线程数
+"""
+import math
+import os
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Optional, Iterator
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_SIZE_UNITS = {
+    "B": 1, "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4,
+    "KIB": 1024, "MIB": 1024 ** 2, "GIB": 1024 ** 3, "TIB": 1024 ** 4
+}
+# cgroup v1 未设置内存限制时返回接近 2^63 的值
+_CGROUP_UNLIMITED = 1 << 60
+
+
+def parse_size(value: str) -> int:
+    """解析大小字符串（如 "8GB", "512MiB", "1073741824"）为字节数"""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([A-Za-z]*)\s*", str(value))
+    if not match:
+        raise ValueError(f"无法解析的大小: {value}")
+    number, unit = match.groups()
+    unit = unit.upper() or "B"
+    if unit not in _SIZE_UNITS:
+        raise ValueError(f"未知的大小单位: {value}")
+    return int(float(number) * _SIZE_UNITS[unit])
+
+
+def _read_cgroup_file(path: str) -> Optional[str]:
+    """读取cgroup文件，不存在时返回None"""
+    try:
+        return Path(path).read_text().strip()
+    except (OSError, ValueError):
+        return None
+
+
+def detect_memory_limit() -> Optional[int]:
+    """检测可用内存上限（字节）：取cgroup限制和物理内存中较小者"""
+    limits = []
+    
+    # cgroup v2
+    value = _read_cgroup_file("/sys/fs/cgroup/memory.max")
+    if value and value != "max":
+        limits.append(int(value))
+    
+    # cgroup v1
+    value = _read_cgroup_file("/sys/fs/cgroup/memory/memory.limit_in_bytes")
+    if value and value.isdigit() and int(value) < _CGROUP_UNLIMITED:
+        limits.append(int(value))
+    
+    try:
+        limits.append(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES"))
+    except (ValueError, OSError, AttributeError):
+        pass
+    
+    return min(limits) if limits else None
+
+
+def detect_cpu_limit() -> int:
+    """检测可用CPU数：取cgroup配额和进程可用核数中较小者"""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    
+    quota = None
+    
+    # cgroup v2: "<quota> <period>" 或 "max <period>"
+    value = _read_cgroup_file("/sys/fs/cgroup/cpu.max")
+    if value:
+        parts = value.split()
+        if len(parts) == 2 and parts[0] != "max":
+            quota = int(parts[0]) / int(parts[1])
+    
+    # cgroup v1
+    if quota is None:
+        quota_us = _read_cgroup_file("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+        period_us = _read_cgroup_file("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if quota_us and period_us and int(quota_us) > 0:
+            quota = int(quota_us) / int(period_us)
+    
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    
+    return max(1, cpus)
+
+
+class DuckDBResourceGovernor:
+    """
+    DuckDB资源管控器
+    
+    DuckDB的线程数是数据库级设置，每条查询除共享的后台线程外，
+    还会在发起查询的执行线程上处理自己的任务。管控器随并发查询数收缩后台线程，
+    使总线程数保持在CPU预算内，同时每条查询始终拥有自己的执行线程，大查询不会饿死交互查询
+    """
+    
+    def __init__(
+        self,
+        memory_limit: Optional[str] = None,
+        memory_fraction: float = 0.75,
+        threads: int = 0,
+        temp_directory: Optional[str] = None,
+        max_temp_directory_size: Optional[str] = None,
+        enable_progress_bar: bool = False
+    ):
+        # 内存上限：显式配置优先，否则按检测到的可用内存比例计算
+        if memory_limit:
+            self.memory_limit = parse_size(memory_limit)
+        else:
+            available_memory = detect_memory_limit()
+            self.memory_limit = int(available_memory * memory_fraction) if available_memory else None
+        
+        # CPU预算：显式配置优先，否则使用检测到的可用CPU数
+        self.total_threads = threads if threads and threads > 0 else detect_cpu_limit()
+        # 线程数变化小于该步长时不重新设置，避免频繁重建线程
+        self.thread_step = max(1, self.total_threads // 8)
+        
+        self.temp_directory = temp_directory
+        self.max_temp_directory_size = max_temp_directory_size
+        self.enable_progress_bar = enable_progress_bar
+        
+        self._running = 0
+        self._current_threads = self.total_threads
+        self._thread_adjustments = 0
+        self._peak_running = 0
+        self._lock = threading.Lock()
+    
+    def apply(self, connection: Any):
+        """在连接上应用资源配置"""
+        if self.memory_limit:
+            connection.execute(f"SET memory_limit='{self.memory_limit}B'")
+        
+        connection.execute(f"SET threads={self.total_threads}")
+        
+        if self.temp_directory:
+            Path(self.temp_directory).mkdir(parents=True, exist_ok=True)
+            temp_directory = self.temp_directory.replace("'", "''")
+            connection.execute(f"SET temp_directory='{temp_directory}'")
+            if self.max_temp_directory_size:
+                connection.execute(f"SET max_temp_directory_size='{self.max_temp_directory_size}'")
+        
+        connection.execute(f"SET enable_progress_bar={'true' if self.enable_progress_bar else 'false'}")
+        
+        logger.info(
+            f"DuckDB资源配置: memory_limit={self.memory_limit}B, threads={self.total_threads}, "
+            f"temp_directory={self.temp_directory}, progress_bar={self.enable_progress_bar}"
+        )
+    
+    @contextmanager
+    def query_slot(self, cursor: Any) -> Iterator[None]:
+        """
+        登记一条运行中的查询，并按当前并发数调整线程数（工作线程中调用）
+        
+        Args:
+            cursor: 执行查询的游标，用于设置线程数
+        """
+        # 在锁内设置线程数，保证设置顺序与并发数变化顺序一致
+        with self._lock:
+            self._running += 1
+            self._peak_running = max(self._peak_running, self._running)
+            self._adjust_threads(cursor)
+        
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._adjust_threads(cursor)
+    
+    def _adjust_threads(self, cursor: Any):
+        """按当前并发数调整线程数（调用方持有锁）"""
+        # 每条运行中的查询各自占用一个执行线程，后台线程数随之减少
+        target = max(1, self.total_threads - max(self._running, 1) + 1)
+        
+        if target == self._current_threads:
+            return
+        if abs(target - self._current_threads) < self.thread_step and target != self.total_threads:
+            return
+        
+        try:
+            cursor.execute(f"SET threads={target}")
+            self._current_threads = target
+            self._thread_adjustments += 1
+        except Exception as e:
+            logger.warning(f"调整DuckDB线程数失败: {e}")
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取资源管控指标"""
+        with self._lock:
+            return {
+                "memory_limit_bytes": self.memory_limit,
+                "total_threads": self.total_threads,
+                "current_threads": self._current_threads,
+                "running_queries": self._running,
+                "peak_running_queries": self._peak_running,
+                "thread_adjustments": self._thread_adjustments,
+                "temp_directory": self.temp_directory,
+                "enable_progress_bar": self.enable_progress_bar
+            }
@@ -1,7 +1,8 @@
 """
 查询引擎工厂
-根据配置创建和管理查询引擎实例
+根据配置创建和管理查询引擎实例，每个数据源一个常驻连接池的引擎，工作流、API、健康检查共用
 """
+import asyncio
 from typing import Dict, Any, Optional
 from enum import Enum
 
@@ -25,6 +26,33 @@ class QueryEngineFactory:
     """查询引擎工厂类"""
     
     _instances: Dict[str, BaseQueryEngine] = {}
+    # {数据源名称: 引擎配置}，default 数据源使用全局配置
+    _configs: Dict[str, Dict[str, Any]] = {}
+    # 每个数据源一个连接锁，避免并发首次访问时重复创建连接池
+    _connect_locks: Dict[str, asyncio.Lock] = {}
+    
+    @classmethod
+    def register_data_source(self, instance_name: str, config: Dict[str, Any]):
+        """
+        登记数据源的引擎配置，首次访问时创建引擎
+        
+        Args:
+            instance_name: 数据源名称
+            config: 引擎配置，格式同 Settings.get_query_engine_config()
+        """
+        if instance_name in self._instances:
+            raise QueryEngineException(f"数据源已创建引擎，不能重复登记: {instance_name}")
+        self._configs[instance_name] = config
+    
+    @classmethod
+    def get_config(self, instance_name: str = "default") -> Dict[str, Any]:
+        """获取数据源的引擎配置"""
+        config = self._configs.get(instance_name)
+        if config is None:
+            if instance_name != "default":
+                raise ConfigurationException(f"数据源未配置: {instance_name}")
+            config = get_settings().get_query_engine_config()
+        return config
     
     @classmethod
     def create_engine(
@@ -97,6 +125,7 @@ class QueryEngineFactory:
                 engine = self._instances[instance_name]
                 # 异步断开连接需要在异步上下文中处理
                 del self._instances[instance_name]
+                self._connect_locks.pop(instance_name, None)
                 logger.info(f"移除查询引擎实例: {instance_name}")
                 return True
             return False
@@ -117,6 +146,7 @@ class QueryEngineFactory:
                     logger.error(f"关闭查询引擎失败 {instance_name}: {e}")
             
             self._instances.clear()
+            self._connect_locks.clear()
             logger.info("所有查询引擎已关闭")
             
         except Exception as e:
@@ -136,7 +166,8 @@ class QueryEngineFactory:
             engines_info[instance_name] = {
                 "engine_type": engine.__class__.__name__,
                 "is_connected": engine.is_connected,
-                "config": {k: v for k, v in engine.config.items() if 'password' not in k.lower()}
+                "config": {k: v for k, v in engine.config.items() if 'password' not in k.lower()},
+                "pool": engine.get_pool_stats()
             }
         
         return engines_info
@@ -191,12 +222,9 @@ def get_query_engine(instance_name: str = "default") -> BaseQueryEngine:
     engine = QueryEngineFactory.get_engine(instance_name)
     
     if engine is None:
-        # 创建默认实例
-        settings = get_settings()
-        
         try:
             # 获取查询引擎配置
-            engine_config = settings.get_query_engine_config()
+            engine_config = QueryEngineFactory.get_config(instance_name)
             engine_type = engine_config.get("type")
             
             if not engine_type:
@@ -209,12 +237,35 @@ def get_query_engine(instance_name: str = "default") -> BaseQueryEngine:
                 instance_name=instance_name
             )
             
-            logger.info(f"创建默认查询引擎实例: {engine_type}")
+            logger.info(f"创建查询引擎实例: {engine_type} ({instance_name})")
             
         except Exception as e:
-            logger.error(f"创建默认查询引擎失败: {e}")
-            raise QueryEngineException(f"创建默认查询引擎失败: {e}")
+            logger.error(f"创建查询引擎失败 {instance_name}: {e}")
+            raise QueryEngineException(f"创建查询引擎失败: {e}")
+    
+    return engine
+
+
+async def get_connected_engine(instance_name: str = "default") -> BaseQueryEngine:
+    """
+    获取已建立连接的查询引擎
+    
+    连接池在首次访问时建立并常驻，所有执行路径共用同一实例的连接池、结果缓存和调度器
+    
+    Args:
+        instance_name: 数据源名称
+        
+    Returns:
+        已连接的查询引擎实例
+    """
+    engine = get_query_engine(instance_name)
+    if engine.is_connected:
+        return engine
     
+    lock = QueryEngineFactory._connect_locks.setdefault(instance_name, asyncio.Lock())
+    async with lock:
+        if not engine.is_connected:
+            await engine.connect()
     return engine
 
 
@@ -226,11 +277,7 @@ async def initialize_default_engine() -> BaseQueryEngine:
         初始化后的查询引擎实例
     """
     try:
-        engine = get_query_engine()
-        
-        # 建立连接
-        if not engine.is_connected:
-            await engine.connect()
+        engine = await get_connected_engine()
         
         # 如果是DuckDB，创建示例数据
         if isinstance(engine, DuckDBQueryEngine):
@@ -253,7 +300,7 @@ async def health_check_engines() -> Dict[str, Dict[str, Any]]:
     """
     health_status = {}
     
-    for instance_name, engine in QueryEngineFactory._instances.items():
+    for instance_name, engine in list(QueryEngineFactory._instances.items()):
         try:
             # 测试连接
             is_healthy = await engine.test_connection()
@@ -262,6 +309,7 @@ async def health_check_engines() -> Dict[str, Dict[str, Any]]:
                 "status": "healthy" if is_healthy else "unhealthy",
                 "engine_type": engine.__class__.__name__,
                 "is_connected": engine.is_connected,
+                "pool": engine.get_pool_stats(),
                 "last_check": "now"
             }
             
@@ -274,4 +322,21 @@ async def health_check_engines() -> Dict[str, Dict[str, Any]]:
                 "last_check": "now"
             }
     
-    return health_status
\ No newline at end of file
+    return health_status
+
+
+def get_pool_metrics() -> Dict[str, Dict[str, Any]]:
+    """
+    汇总所有数据源引擎的连接池指标
+    
+    Returns:
+        {数据源名称: 连接池指标}
+    """
+    return {
+        instance_name: {
+            "engine_type": engine.__class__.__name__,
+            "is_connected": engine.is_connected,
+            **engine.get_pool_stats()
+        }
+        for instance_name, engine in QueryEngineFactory._instances.items()
+    }
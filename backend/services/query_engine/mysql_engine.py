@@ -3,21 +3,118 @@ MySQL查询引擎实现
 用于生产环境的MySQL数据库查询引擎
 """
 import asyncio
+import json
+import re
 import time
-from typing import Dict, List, Any, Optional
+import weakref
+from contextlib import asynccontextmanager, AsyncExitStack
+from contextvars import ContextVar
+from typing import Dict, List, Any, Optional, AsyncIterator, Tuple
 
 import aiomysql
 
-from .base_engine import BaseQueryEngine, QueryResult
+from .base_engine import BaseQueryEngine, QueryResult, ResultBatch
+from .query_registry import query_registry, current_task_id
+from .result_cache import CacheWrite, current_cache_write
+from .statement_cache import PreparedStatementCache, summarize_statement_caches
+from .mysql_replicas import ReplicaRouter, ReplicaEndpoint, parse_replicas
 from utils.logger import get_logger
-from utils.exceptions import QueryEngineException
+from utils.exceptions import QueryEngineException, QueryCancelledException
 
 logger = get_logger(__name__)
 
+# 字符串、反引号标识符，以及pymysql风格的占位符（%s、%(name)s）和转义的百分号
+_PLACEHOLDER_PATTERN = re.compile(
+    r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"|`[^`]*`|%%|%\((\w+)\)s|%s|\?"
+)
+# 会话中的预处理语句已失效（Unknown prepared statement handler）
+_ER_UNKNOWN_STMT_HANDLER = 1243
+
+
+class _WorkerConnection:
+    """
+    批量执行工作协程固定的只读连接
+    
+    首次查询（已获得调度名额）时才签出；只有发起会话的协程本身使用，
+    查询合并创建的共享执行在独立的任务中运行，另行签出连接
+    """
+    
+    def __init__(self, owner: Optional[asyncio.Task]):
+        self.owner = owner
+        self.conn = None
+        self.endpoint: Optional[ReplicaEndpoint] = None
+        self._stack: Optional[AsyncExitStack] = None
+    
+    async def attach(self, acquire: Any):
+        """签出连接并固定，acquire 为返回 (连接, 副本) 的异步上下文管理器"""
+        stack = AsyncExitStack()
+        self.conn, self.endpoint = await stack.enter_async_context(acquire)
+        self._stack = stack
+    
+    async def release(self):
+        """归还固定的连接"""
+        stack, self._stack = self._stack, None
+        self.conn = None
+        self.endpoint = None
+        if stack is not None:
+            await stack.aclose()
+
+
+# 批量执行工作协程的固定连接
+_worker_connection: ContextVar[Optional[_WorkerConnection]] = ContextVar(
+    "mysql_worker_connection", default=None
+)
+
+
+def _to_server_placeholders(sql: str, params: Any) -> Optional[Tuple[str, List[Any]]]:
+    """
+    将pymysql风格的参数化SQL转换为服务端预处理语句使用的 ? 占位符
+    
+    Returns:
+        (转换后的SQL, 按占位符顺序排列的参数值)，无法转换时返回None
+    """
+    values: List[Any] = []
+    positional = list(params) if isinstance(params, (list, tuple)) else None
+    if positional is None and not isinstance(params, dict):
+        return None
+    
+    def replace(match: "re.Match") -> str:
+        token = match.group(0)
+        if token[0] in "'\"`":
+            # pymysql格式化时不区分引号，引号内的占位符无法转换为服务端参数
+            if re.search(r"%(\(\w+\))?s", token.replace("%%", "")):
+                raise ValueError("placeholder in literal")
+            return token.replace("%%", "%")
+        if token == "%%":
+            return "%"
+        if token == "?":
+            # 原SQL中的问号会与服务端占位符混淆
+            raise ValueError("literal placeholder")
+        if token == "%s":
+            if positional is None or len(values) >= len(positional):
+                raise ValueError("placeholder mismatch")
+            values.append(positional[len(values)])
+        else:
+            if positional is not None or match.group(1) not in params:
+                raise ValueError("placeholder mismatch")
+            values.append(params[match.group(1)])
+        return "?"
+    
+    try:
+        statement = _PLACEHOLDER_PATTERN.sub(replace, sql)
+    except ValueError:
+        return None
+    
+    if positional is not None and len(values) != len(positional):
+        return None
+    return statement, values
+
 
 class MySQLQueryEngine(BaseQueryEngine):
     """MySQL查询引擎"""
     
+    result_type_system = "mysql"
+    
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         self.host = config.get('host', 'localhost')
@@ -29,24 +126,30 @@ class MySQLQueryEngine(BaseQueryEngine):
         self.connection_pool = None
         self.pool_size = config.get('pool_size', 10)
         self.pool_timeout = config.get('pool_timeout', 30)
+        # 服务端预处理语句缓存：每个池化连接一个，0表示不使用
+        self.statement_cache_size = config.get('prepared_statement_cache_size', 0)
+        self._statement_caches: "weakref.WeakKeyDictionary[Any, PreparedStatementCache]" = weakref.WeakKeyDictionary()
+        # 只读副本：查询按路由分发到副本，元数据和维护操作仍在主库执行
+        self.replicas = config.get('replicas') or []
+        if isinstance(self.replicas, str):
+            self.replicas = parse_replicas(self.replicas)
+        self.replica_router: Optional[ReplicaRouter] = None
+        if self.replicas:
+            self.replica_router = ReplicaRouter(
+                self.replicas,
+                pool_factory=self._create_pool,
+                primary_pool=lambda: self.connection_pool,
+                fallback_to_primary=config.get('replica_fallback_to_primary', True),
+                health_check_interval=config.get('replica_health_check_interval', 5),
+                max_failures=config.get('replica_max_failures', 3),
+                readmit_successes=config.get('replica_readmit_successes', 2)
+            )
     
     async def connect(self) -> bool:
         """建立MySQL连接池"""
         try:
             # 创建连接池
-            self.connection_pool = await aiomysql.create_pool(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password,
-                db=self.database,
-                charset=self.charset,
-                maxsize=self.pool_size,
-                minsize=1,
-                autocommit=True,
-                pool_recycle=3600,  # 1小时回收连接
-                echo=False
-            )
+            self.connection_pool = await self._create_pool(self.host, self.port)
             
             # 测试连接
             async with self.connection_pool.acquire() as conn:
@@ -56,6 +159,9 @@ class MySQLQueryEngine(BaseQueryEngine):
                     if result[0] != 1:
                         raise QueryEngineException("MySQL连接测试失败")
             
+            if self.replica_router:
+                await self.replica_router.start()
+            
             self.is_connected = True
             logger.info(f"MySQL连接池创建成功: {self.host}:{self.port}/{self.database}")
             return True
@@ -64,9 +170,86 @@ class MySQLQueryEngine(BaseQueryEngine):
             logger.error(f"MySQL连接失败: {e}")
             raise QueryEngineException(f"MySQL连接失败: {e}")
     
+    async def _create_pool(self, host: str, port: int) -> Any:
+        """创建指定服务器的连接池（主库和副本使用相同的连接参数）"""
+        return await aiomysql.create_pool(
+            host=host,
+            port=port,
+            user=self.user,
+            password=self.password,
+            db=self.database,
+            charset=self.charset,
+            maxsize=self.pool_size,
+            minsize=1,
+            autocommit=True,
+            pool_recycle=3600,  # 1小时回收连接
+            echo=False
+        )
+    
+    @asynccontextmanager
+    async def _acquire_read_connection(self) -> AsyncIterator[Tuple[Any, Optional[ReplicaEndpoint]]]:
+        """获取只读查询使用的连接：批量执行的工作协程使用其固定的连接，其余查询单独签出"""
+        worker = self._current_worker_connection()
+        if worker is None:
+            async with self._acquire_pooled_connection() as (conn, endpoint):
+                yield conn, endpoint
+            return
+        
+        if worker.conn is None or worker.conn.closed:
+            await worker.release()
+            await worker.attach(self._acquire_pooled_connection())
+        yield worker.conn, worker.endpoint
+    
+    @asynccontextmanager
+    async def _acquire_pooled_connection(self) -> AsyncIterator[Tuple[Any, Optional[ReplicaEndpoint]]]:
+        """从连接池签出连接：配置了副本时按路由选择，否则使用主库连接池"""
+        if self.replica_router is None:
+            async with self.connection_pool.acquire() as conn:
+                yield conn, None
+        else:
+            async with self.replica_router.acquire() as (conn, endpoint):
+                yield conn, endpoint
+    
+    @staticmethod
+    def _current_worker_connection() -> Optional[_WorkerConnection]:
+        """当前协程所属的批量工作会话；子任务（如合并查询的共享执行）继承了上下文但不使用"""
+        worker = _worker_connection.get()
+        if worker is not None and worker.owner is asyncio.current_task():
+            return worker
+        return None
+    
+    @asynccontextmanager
+    async def _worker_session(self) -> AsyncIterator[None]:
+        """批量执行工作协程的会话：获得调度名额后签出一个只读连接，批次内复用"""
+        if not self.is_connected:
+            await self.connect()
+        
+        worker = _WorkerConnection(asyncio.current_task())
+        token = _worker_connection.set(worker)
+        try:
+            yield
+        finally:
+            _worker_connection.reset(token)
+            await worker.release()
+    
+    async def _execute_scheduled(
+        self,
+        sql: str,
+        params: Optional[Dict[str, Any]],
+        timeout: Optional[float]
+    ) -> Tuple[QueryResult, Dict[str, Any]]:
+        """需要排队等待调度名额时先归还工作协程固定的连接，排队期间不占用连接池"""
+        worker = self._current_worker_connection()
+        if worker is not None and worker.conn is not None and not self.scheduler.has_capacity:
+            await worker.release()
+        return await super()._execute_scheduled(sql, params, timeout)
+    
     async def disconnect(self) -> bool:
         """关闭MySQL连接池"""
         try:
+            if self.replica_router:
+                await self.replica_router.close()
+            
             if self.connection_pool:
                 self.connection_pool.close()
                 await self.connection_pool.wait_closed()
@@ -79,7 +262,7 @@ class MySQLQueryEngine(BaseQueryEngine):
             logger.error(f"MySQL连接池关闭失败: {e}")
             return False
     
-    async def execute_query(
+    async def _execute_query(
         self,
         sql: str,
         params: Optional[Dict[str, Any]] = None,
@@ -95,97 +278,351 @@ class MySQLQueryEngine(BaseQueryEngine):
         try:
             start_time = time.time()
             
-            async with self.connection_pool.acquire() as conn:
-                async with conn.cursor() as cursor:
-                    # 设置查询超时
-                    if timeout:
-                        await cursor.execute(f"SET SESSION max_execution_time={timeout * 1000}")
-                    
-                    # 执行查询
-                    if params:
-                        await cursor.execute(sql, params)
-                    else:
-                        await cursor.execute(sql)
-                    
-                    # 获取结果
-                    columns = [desc[0] for desc in cursor.description] if cursor.description else []
-                    rows = await cursor.fetchall()
+            async with self._acquire_read_connection() as (conn, endpoint):
+                # 登记连接线程ID，取消任务时在同一服务器上通过 KILL QUERY 中断语句
+                thread_id = conn.thread_id()
+                with query_registry.track(current_task_id.get(), lambda: self._kill_query(thread_id, endpoint)):
+                    async with conn.cursor() as cursor:
+                        # 设置查询超时
+                        if timeout:
+                            await cursor.execute(f"SET SESSION max_execution_time={int(timeout * 1000)}")
+                        
+                        # 结果将写入缓存且由副本执行时，先确认副本没有落后
+                        cache_write = current_cache_write.get()
+                        if cache_write is not None and endpoint is not None:
+                            await self._check_replica_position(cursor, cache_write, endpoint)
+                        
+                        # 执行查询，参数化查询使用连接上缓存的预处理语句
+                        await self._execute_prepared(conn, cursor, sql, params)
+                        
+                        # 获取结果
+                        description = cursor.description
+                        columns = [desc[0] for desc in description] if description else []
+                        rows = await cursor.fetchall()
             
             execution_time_ms = int((time.time() - start_time) * 1000)
             
             logger.info(f"MySQL查询执行成功，返回 {len(rows)} 行，耗时 {execution_time_ms}ms")
             
-            return self._format_query_result(columns, list(rows), execution_time_ms, sql)
+            return self._format_query_result(columns, list(rows), execution_time_ms, sql, description)
             
+        except QueryCancelledException:
+            logger.info("MySQL查询已取消")
+            raise
         except Exception as e:
             logger.error(f"MySQL查询执行失败: {e}")
             raise QueryEngineException(f"MySQL查询执行失败: {e}")
     
-    async def get_schema_info(self, table_name: Optional[str] = None) -> Dict[str, Any]:
-        """获取MySQL模式信息"""
+    async def _execute_prepared(self, conn: Any, cursor: Any, sql: str, params: Optional[Any] = None):
+        """
+        在连接上以服务端预处理语句执行参数化查询
+        
+        aiomysql只支持文本协议，这里使用SQL级的 PREPARE/EXECUTE，参数通过会话变量传入；
+        预处理语句属于会话，因此按池化连接缓存。MySQL每次 EXECUTE 仍重新优化，
+        只省去解析，却多一次设置会话变量的往返，因此默认关闭（MYSQL_PREPARED_STATEMENT_CACHE_SIZE）
+        """
+        converted = _to_server_placeholders(sql, params) if params and self.statement_cache_size > 0 else None
+        if converted is None:
+            if params:
+                await cursor.execute(sql, params)
+            else:
+                await cursor.execute(sql)
+            return
+        
+        statement, values = converted
+        cache = self._statement_caches.get(conn)
+        if cache is None:
+            cache = PreparedStatementCache(self.statement_cache_size)
+            self._statement_caches[conn] = cache
+        
+        for attempt in range(2):
+            name = cache.lookup(statement)
+            if name is None:
+                name, evicted = cache.add(statement)
+                for evicted_name in evicted:
+                    await cursor.execute(f"DEALLOCATE PREPARE {evicted_name}")
+                try:
+                    await cursor.execute(f"PREPARE {name} FROM %s", [statement])
+                except Exception:
+                    cache.discard(statement)
+                    raise
+            
+            try:
+                if values:
+                    variables = [f"@{name}_{index}" for index in range(len(values))]
+                    await cursor.execute(
+                        "SET " + ", ".join(f"{variable} = %s" for variable in variables), values
+                    )
+                    await cursor.execute(f"EXECUTE {name} USING {', '.join(variables)}")
+                else:
+                    await cursor.execute(f"EXECUTE {name}")
+                return
+            except aiomysql.Error as e:
+                # 会话被重置后预处理语句丢失，重新预处理一次
+                if attempt == 0 and e.args and e.args[0] == _ER_UNKNOWN_STMT_HANDLER:
+                    cache.discard(statement)
+                    continue
+                raise
+    
+    async def execute_query_stream(
+        self,
+        sql: str,
+        params: Optional[Dict[str, Any]] = None,
+        batch_size: Optional[int] = None
+    ) -> AsyncIterator[ResultBatch]:
+        """流式执行MySQL查询，使用无缓冲的SSCursor按批次读取"""
+        if not self.is_connected:
+            await self.connect()
+        
+        # 清理SQL
+        sql = self._sanitize_sql(sql)
+        batch_size = batch_size or self.stream_batch_size
+        
+        task_id = current_task_id.get()
+        exhausted = False
         try:
-            schema_info = {"tables": [], "columns": []}
+            start_time = time.time()
             
-            async with self.connection_pool.acquire() as conn:
-                async with conn.cursor() as cursor:
-                    if table_name:
-                        # 获取指定表的列信息
-                        columns_sql = """
-                            SELECT 
-                                COLUMN_NAME,
-                                DATA_TYPE,
-                                IS_NULLABLE,
-                                COLUMN_DEFAULT,
-                                COLUMN_KEY,
-                                EXTRA,
-                                COLUMN_COMMENT
-                            FROM INFORMATION_SCHEMA.COLUMNS 
-                            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s
-                            ORDER BY ORDINAL_POSITION
-                        """
-                        await cursor.execute(columns_sql, [self.database, table_name])
-                        columns = await cursor.fetchall()
+            async with self._acquire_read_connection() as (conn, endpoint):
+                thread_id = conn.thread_id()
+                cursor = await conn.cursor(aiomysql.SSCursor)
+                try:
+                    with query_registry.track(task_id, lambda: self._kill_query(thread_id, endpoint)):
+                        if params:
+                            await cursor.execute(sql, params)
+                        else:
+                            await cursor.execute(sql)
                         
-                        for col in columns:
-                            schema_info["columns"].append({
-                                "column_name": col[0],
-                                "data_type": col[1],
-                                "is_nullable": col[2] == 'YES',
-                                "default_value": col[3],
-                                "column_key": col[4],
-                                "extra": col[5],
-                                "comment": col[6]
-                            })
-                    else:
-                        # 获取所有表信息
-                        tables_sql = """
-                            SELECT 
-                                TABLE_NAME,
-                                TABLE_TYPE,
-                                TABLE_COMMENT,
-                                TABLE_ROWS,
-                                DATA_LENGTH
-                            FROM INFORMATION_SCHEMA.TABLES 
-                            WHERE TABLE_SCHEMA = %s
-                            ORDER BY TABLE_NAME
-                        """
-                        await cursor.execute(tables_sql, [self.database])
-                        tables = await cursor.fetchall()
+                        columns = [desc[0] for desc in cursor.description] if cursor.description else []
+                        encoder = self._get_result_encoder(cursor.description, len(columns))
                         
-                        for table in tables:
-                            schema_info["tables"].append({
-                                "table_name": table[0],
-                                "table_type": table[1],
-                                "comment": table[2],
-                                "estimated_rows": table[3],
-                                "data_length": table[4]
-                            })
+                        batch_index = 0
+                        offset = 0
+                        while True:
+                            query_registry.check(task_id)
+                            
+                            rows = await cursor.fetchmany(batch_size)
+                            if not rows:
+                                exhausted = True
+                                break
+                            
+                            yield ResultBatch(
+                                columns=columns,
+                                rows=self._format_rows(rows, encoder),
+                                batch_index=batch_index,
+                                offset=offset
+                            )
+                            
+                            batch_index += 1
+                            offset += len(rows)
+                finally:
+                    if exhausted:
+                        await cursor.close()
+                    else:
+                        # 调用方提前结束或出错时直接关闭连接，避免SSCursor读完剩余结果集
+                        conn.close()
             
-            return schema_info
+            execution_time_ms = int((time.time() - start_time) * 1000)
+            logger.info(f"MySQL流式查询完成，共 {batch_index} 批 {offset} 行，耗时 {execution_time_ms}ms")
             
+        except QueryCancelledException:
+            logger.info("MySQL流式查询已取消")
+            raise
         except Exception as e:
-            logger.error(f"获取MySQL模式信息失败: {e}")
-            return {"tables": [], "columns": []}
+            logger.error(f"MySQL流式查询失败: {e}")
+            raise QueryEngineException(f"MySQL流式查询执行失败: {e}")
+    
+    async def _get_table_versions(self, tables: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        以表的创建时间和最后更新时间作为MySQL表的数据版本
+        
+        视图、不存在的表和没有记录更新时间的表（UPDATE_TIME为NULL）无法确定版本，返回None；
+        配置了副本时同时记录主库的GTID集合，副本返回的结果据此判断是否落后
+        """
+        # {(schema, table): 原始表名}
+        table_keys = {}
+        for name in tables:
+            parts = name.split(".")
+            schema = parts[-2] if len(parts) > 1 else self.database
+            table_keys[(schema.lower(), parts[-1].lower())] = name
+        
+        placeholders = ", ".join(["(%s, %s)"] * len(table_keys))
+        version_sql = f"""
+            SELECT TABLE_SCHEMA, TABLE_NAME, TABLE_TYPE, CREATE_TIME, UPDATE_TIME
+            FROM INFORMATION_SCHEMA.TABLES
+            WHERE (TABLE_SCHEMA, TABLE_NAME) IN ({placeholders})
+        """
+        params = [value for key in table_keys for value in key]
+        cache_write = current_cache_write.get()
+        
+        async with self.connection_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await self._disable_stats_cache(cursor)
+                await cursor.execute(version_sql, params)
+                rows = await cursor.fetchall()
+                
+                if self.replica_router is not None and cache_write is not None:
+                    cache_write.source_position = await self._read_gtid_executed(cursor)
+        
+        versions = {}
+        for schema, table, table_type, create_time, update_time in rows:
+            name = table_keys.get((schema.lower(), table.lower()))
+            if name is None:
+                continue
+            if table_type != "BASE TABLE" or update_time is None:
+                return None
+            versions[name] = (str(create_time), str(update_time))
+        
+        if len(versions) < len(table_keys):
+            return None
+        return versions
+    
+    async def _read_gtid_executed(self, cursor: Any) -> Optional[str]:
+        """读取服务器已执行的GTID集合，未启用GTID或不支持时返回None"""
+        try:
+            await cursor.execute("SELECT @@GLOBAL.gtid_executed")
+            row = await cursor.fetchone()
+        except Exception as e:
+            logger.debug(f"读取GTID集合失败: {e}")
+            return None
+        return row[0] if row and row[0] else None
+    
+    async def _check_replica_position(self, cursor: Any, cache_write: CacheWrite, endpoint: ReplicaEndpoint):
+        """
+        副本返回的结果只在副本已应用读取版本时主库的全部事务后才写入缓存
+        
+        版本读自主库，副本上的更新时间与主库不同、无法直接比较，
+        这里在执行查询的同一连接上以 GTID_SUBSET 判断副本是否追上读取版本时的主库
+        """
+        caught_up = False
+        if cache_write.source_position:
+            try:
+                await cursor.execute(
+                    "SELECT GTID_SUBSET(%s, @@GLOBAL.gtid_executed)", [cache_write.source_position]
+                )
+                row = await cursor.fetchone()
+                caught_up = bool(row and row[0])
+            except Exception as e:
+                logger.debug(f"检查副本复制进度失败: {endpoint.name}, 错误: {e}")
+        
+        if not caught_up:
+            cache_write.reject(f"副本 {endpoint.name} 可能落后于读取版本时的主库")
+    
+    async def _disable_stats_cache(self, cursor: Any):
+        """
+        关闭当前会话的INFORMATION_SCHEMA统计缓存
+        
+        MySQL 8.0 默认缓存 UPDATE_TIME 等统计值 information_schema_stats_expiry（86400秒），
+        不关闭时表更新后的一天内仍读到旧版本；5.7 和 MariaDB 没有该变量，直接读取的就是实时值
+        """
+        try:
+            await cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+        except Exception as e:
+            logger.debug(f"当前MySQL版本不支持 information_schema_stats_expiry: {e}")
+    
+    async def _kill_query(self, thread_id: int, endpoint: Optional[ReplicaEndpoint] = None):
+        """在旁路连接上终止指定连接线程正在执行的语句（endpoint为空时为主库）"""
+        kill_sql = f"KILL QUERY {int(thread_id)}"
+        pool = endpoint.pool if endpoint else self.connection_pool
+        host = endpoint.host if endpoint else self.host
+        port = endpoint.port if endpoint else self.port
+        
+        if pool.freesize == 0 and pool.size >= pool.maxsize:
+            # 连接池已满时使用临时连接，避免取消请求在池中排队
+            conn = await aiomysql.connect(
+                host=host,
+                port=port,
+                user=self.user,
+                password=self.password,
+                db=self.database,
+                charset=self.charset,
+                autocommit=True
+            )
+            try:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(kill_sql)
+            finally:
+                conn.close()
+        else:
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(kill_sql)
+        
+        logger.info(f"已终止MySQL连接 {host}:{port}/{thread_id} 上的查询")
+    
+    async def _load_catalog_tables(self) -> Dict[str, Tuple[Dict[str, Any], Any]]:
+        """加载MySQL表列表，以表的创建时间和最后更新时间作为版本"""
+        tables_sql = """
+            SELECT 
+                TABLE_NAME,
+                TABLE_TYPE,
+                TABLE_COMMENT,
+                TABLE_ROWS,
+                DATA_LENGTH,
+                CREATE_TIME,
+                UPDATE_TIME
+            FROM INFORMATION_SCHEMA.TABLES 
+            WHERE TABLE_SCHEMA = %s
+            ORDER BY TABLE_NAME
+        """
+        
+        async with self.connection_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(tables_sql, [self.database])
+                tables = await cursor.fetchall()
+        
+        return {
+            table[0]: (
+                {
+                    "table_name": table[0],
+                    "table_type": table[1],
+                    "comment": table[2],
+                    "estimated_rows": table[3],
+                    "data_length": table[4]
+                },
+                (str(table[5]), str(table[6]))
+            )
+            for table in tables
+        }
+    
+    async def _load_catalog_columns(self, table_names: Optional[List[str]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """加载MySQL列信息，table_names为空时加载整个库"""
+        columns_sql = """
+            SELECT 
+                TABLE_NAME,
+                COLUMN_NAME,
+                DATA_TYPE,
+                IS_NULLABLE,
+                COLUMN_DEFAULT,
+                COLUMN_KEY,
+                EXTRA,
+                COLUMN_COMMENT
+            FROM INFORMATION_SCHEMA.COLUMNS 
+            WHERE TABLE_SCHEMA = %s
+        """
+        params = [self.database]
+        if table_names is not None:
+            columns_sql += f" AND TABLE_NAME IN ({', '.join(['%s'] * len(table_names))})"
+            params.extend(table_names)
+        columns_sql += " ORDER BY TABLE_NAME, ORDINAL_POSITION"
+        
+        async with self.connection_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(columns_sql, params)
+                columns = await cursor.fetchall()
+        
+        table_columns: Dict[str, List[Dict[str, Any]]] = {}
+        for col in columns:
+            table_columns.setdefault(col[0], []).append({
+                "column_name": col[1],
+                "data_type": col[2],
+                "is_nullable": col[3] == 'YES',
+                "default_value": col[4],
+                "column_key": col[5],
+                "extra": col[6],
+                "comment": col[7]
+            })
+        return table_columns
     
     async def validate_sql(self, sql: str) -> Dict[str, Any]:
         """验证MySQL SQL语法"""
@@ -278,7 +715,12 @@ class MySQLQueryEngine(BaseQueryEngine):
             return {}
     
     async def estimate_query_cost(self, sql: str) -> Dict[str, Any]:
-        """估算MySQL查询成本"""
+        """
+        估算MySQL查询成本
+        
+        使用 EXPLAIN FORMAT=JSON 获取执行计划（不执行查询），
+        从各表访问节点读取扫描行数、输出行数和读取数据量
+        """
         try:
             sql = self._sanitize_sql(sql)
             
@@ -288,35 +730,67 @@ class MySQLQueryEngine(BaseQueryEngine):
                     explain_sql = f"EXPLAIN FORMAT=JSON {sql}"
                     await cursor.execute(explain_sql)
                     result = await cursor.fetchone()
-                    
-                    if result:
-                        import json
-                        plan = json.loads(result[0])
-                        
-                        # 提取成本信息
-                        query_block = plan.get("query_block", {})
-                        cost_info = query_block.get("cost_info", {})
-                        
-                        return {
-                            "estimated_rows": int(cost_info.get("read_cost", 0)),
-                            "estimated_cost": float(cost_info.get("query_cost", 0)),
-                            "estimated_time_ms": int(float(cost_info.get("query_cost", 0)) * 10),
-                            "query_plan": plan
-                        }
+            
+            if not result:
+                return self._empty_cost_estimate()
+            
+            plan = json.loads(result[0])
+            
+            # 提取成本信息
+            query_block = plan.get("query_block", {})
+            query_cost = float(query_block.get("cost_info", {}).get("query_cost", 0))
+            
+            table_nodes: List[Dict[str, Any]] = []
+            self._collect_plan_tables(plan, table_nodes)
+            
+            scan_rows = sum(int(node.get("rows_examined_per_scan", 0)) for node in table_nodes)
+            scan_bytes = sum(
+                self._parse_plan_size(node.get("cost_info", {}).get("data_read_per_join", 0))
+                for node in table_nodes
+            )
+            # 连接顺序中最后一张表的输出行数即连接结果的行数估计
+            estimated_rows = int(table_nodes[-1].get("rows_produced_per_join", 0)) if table_nodes else 0
             
             return {
-                "estimated_rows": 0,
-                "estimated_cost": 0.0,
-                "estimated_time_ms": 0
+                "estimated_rows": estimated_rows,
+                "estimated_cost": query_cost,
+                "estimated_time_ms": int(query_cost * 10),
+                "scan_rows": scan_rows,
+                "scan_bytes": scan_bytes,
+                "scanned_tables": [node.get("table_name") for node in table_nodes],
+                "query_plan": plan
             }
             
         except Exception as e:
             logger.warning(f"MySQL查询成本估算失败: {e}")
-            return {
-                "estimated_rows": 0,
-                "estimated_cost": 0.0,
-                "estimated_time_ms": 0
-            }
+            return self._empty_cost_estimate()
+    
+    def _collect_plan_tables(self, node: Any, table_nodes: List[Dict[str, Any]]):
+        """递归收集JSON执行计划中的表访问节点"""
+        if isinstance(node, dict):
+            table = node.get("table")
+            if isinstance(table, dict) and "table_name" in table:
+                table_nodes.append(table)
+            for value in node.values():
+                self._collect_plan_tables(value, table_nodes)
+        elif isinstance(node, list):
+            for item in node:
+                self._collect_plan_tables(item, table_nodes)
+    
+    @staticmethod
+    def _parse_plan_size(value: Any) -> int:
+        """解析执行计划中的数据量（如 "240", "15K", "1M"）"""
+        text = str(value).strip().upper()
+        multiplier = 1
+        for unit, size in (("K", 1024), ("M", 1024 ** 2), ("G", 1024 ** 3), ("T", 1024 ** 4)):
+            if text.endswith(unit):
+                text = text[:-1]
+                multiplier = size
+                break
+        try:
+            return int(float(text) * multiplier)
+        except ValueError:
+            return 0
     
     async def optimize_table(self, table_name: str) -> Dict[str, Any]:
         """优化MySQL表"""
@@ -366,6 +840,25 @@ class MySQLQueryEngine(BaseQueryEngine):
                 "error": str(e)
             }
     
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """获取主库连接池和副本连接池指标"""
+        pool = self.connection_pool
+        return {
+            "pool_size": self.pool_size,
+            "size": pool.size if pool else 0,
+            "free": pool.freesize if pool else 0,
+            "in_use": pool.size - pool.freesize if pool else 0,
+            "replicas": self.replica_router.get_stats() if self.replica_router else None
+        }
+    
+    def get_engine_info(self) -> Dict[str, Any]:
+        """获取MySQL引擎信息（含预处理语句缓存统计）"""
+        engine_info = super().get_engine_info()
+        engine_info["prepared_statements"] = summarize_statement_caches(
+            list(self._statement_caches.values()), self.statement_cache_size
+        )
+        return engine_info
+    
     async def get_connection_info(self) -> Dict[str, Any]:
         """获取MySQL连接信息"""
         try:
@@ -399,7 +892,8 @@ class MySQLQueryEngine(BaseQueryEngine):
                         "port": self.port,
                         "threads_connected": int(threads_connected[1]) if threads_connected else 0,
                         "max_used_connections": int(max_used_connections[1]) if max_used_connections else 0,
-                        "database_size_mb": float(db_size[0]) if db_size and db_size[0] else 0
+                        "database_size_mb": float(db_size[0]) if db_size and db_size[0] else 0,
+                        "replicas": self.replica_router.get_stats() if self.replica_router else None
                     }
                     
         except Exception as e:
@@ -420,5 +914,12 @@ class MySQLQueryEngine(BaseQueryEngine):
             "table_analysis",
             "connection_pool",
             "transaction_support",
-            "prepared_statements"
+            "prepared_statements",
+            "read_replicas",
+            "streaming_query",
+            "query_cancellation",
+            "result_cache",
+            "query_coalescing",
+            "schema_catalog",
+            "batch_execution"
         ]
\ No newline at end of file
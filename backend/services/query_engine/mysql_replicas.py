@@ -0,0 +1,307 @@
+"""
+MySQL只读副本路由
+按权重的最少在途请求选择副本，定期探测健康状态，自动摘除和恢复副本，可回退到主库
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Any, Optional, Callable, Awaitable, AsyncIterator, Tuple
+
+import aiomysql
+
+from utils.logger import get_logger
+from utils.exceptions import QueryEngineException
+
+logger = get_logger(__name__)
+
+# 连接级错误（无法连接、连接断开等），只有这类错误计入副本故障，SQL错误不计入
+_CONNECTION_ERROR_CODES = {2002, 2003, 2006, 2013, 2055}
+# 延迟滑动平均的平滑系数
+_LATENCY_ALPHA = 0.2
+
+
+def parse_replicas(value: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    解析副本配置字符串
+    
+    格式: "host[:port[:weight]],host[:port[:weight]]"，端口默认3306，权重默认1
+    """
+    replicas = []
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        parts = item.split(":")
+        replicas.append({
+            "host": parts[0],
+            "port": int(parts[1]) if len(parts) > 1 and parts[1] else 3306,
+            "weight": float(parts[2]) if len(parts) > 2 and parts[2] else 1.0
+        })
+    return replicas
+
+
+def _is_connection_error(error: BaseException) -> bool:
+    """是否为连接级错误"""
+    if isinstance(error, (OSError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, aiomysql.OperationalError):
+        return bool(error.args) and error.args[0] in _CONNECTION_ERROR_CODES
+    return False
+
+
+class ReplicaEndpoint:
+    """只读副本端点"""
+    
+    def __init__(self, host: str, port: int = 3306, weight: float = 1.0):
+        self.host = host
+        self.port = port
+        self.weight = weight if weight > 0 else 1.0
+        self.pool = None
+        self.healthy = False
+        self.in_flight = 0
+        
+        # 健康状态
+        self.consecutive_failures = 0
+        self.consecutive_successes = 0
+        self.last_error: Optional[str] = None
+        self.ejected_at: Optional[float] = None
+        
+        # 统计信息
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+        self.latency_ms: Optional[float] = None
+        self.probe_latency_ms: Optional[float] = None
+    
+    @property
+    def name(self) -> str:
+        return f"{self.host}:{self.port}"
+    
+    @property
+    def load(self) -> float:
+        """按权重折算的在途请求数，包含即将分配的请求"""
+        return (self.in_flight + 1) / self.weight
+    
+    def record_latency(self, latency_ms: float):
+        """更新请求延迟滑动平均"""
+        if self.latency_ms is None:
+            self.latency_ms = latency_ms
+        else:
+            self.latency_ms += _LATENCY_ALPHA * (latency_ms - self.latency_ms)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取副本统计信息"""
+        return {
+            "endpoint": self.name,
+            "weight": self.weight,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+            "latency_ms": round(self.latency_ms, 2) if self.latency_ms is not None else None,
+            "probe_latency_ms": round(self.probe_latency_ms, 2) if self.probe_latency_ms is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "pool_size": self.pool.size if self.pool else 0,
+            "pool_free": self.pool.freesize if self.pool else 0
+        }
+
+
+class ReplicaRouter:
+    """
+    只读副本路由器
+    
+    连续出现 max_failures 次连接级错误（查询或探测）的副本被摘除，
+    之后由后台探测连续成功 readmit_successes 次再恢复；没有可用副本时按配置回退到主库
+    """
+    
+    def __init__(
+        self,
+        replicas: List[Dict[str, Any]],
+        pool_factory: Callable[[str, int], Awaitable[Any]],
+        primary_pool: Callable[[], Any],
+        fallback_to_primary: bool = True,
+        health_check_interval: int = 5,
+        probe_timeout: int = 3,
+        max_failures: int = 3,
+        readmit_successes: int = 2
+    ):
+        self.endpoints = [
+            ReplicaEndpoint(replica["host"], replica.get("port", 3306), replica.get("weight", 1.0))
+            for replica in replicas
+        ]
+        self._pool_factory = pool_factory
+        self._primary_pool = primary_pool
+        self.fallback_to_primary = fallback_to_primary
+        self.health_check_interval = health_check_interval
+        self.probe_timeout = probe_timeout
+        self.max_failures = max_failures
+        self.readmit_successes = readmit_successes
+        self._probe_task: Optional[asyncio.Task] = None
+        
+        # 统计信息
+        self._primary_fallbacks = 0
+        self._primary_in_flight = 0
+    
+    async def start(self):
+        """为各副本创建连接池并启动健康探测"""
+        for endpoint in self.endpoints:
+            await self._open_pool(endpoint)
+        
+        healthy = sum(1 for endpoint in self.endpoints if endpoint.healthy)
+        logger.info(f"MySQL只读副本路由已启动: {healthy}/{len(self.endpoints)} 个副本可用")
+        
+        if self._probe_task is None:
+            self._probe_task = asyncio.ensure_future(self._probe_loop())
+    
+    async def close(self):
+        """停止健康探测并关闭副本连接池"""
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+        
+        for endpoint in self.endpoints:
+            if endpoint.pool is not None:
+                endpoint.pool.close()
+                await endpoint.pool.wait_closed()
+                endpoint.pool = None
+            endpoint.healthy = False
+    
+    async def _open_pool(self, endpoint: ReplicaEndpoint) -> bool:
+        """创建副本连接池，失败时保持摘除状态"""
+        try:
+            endpoint.pool = await asyncio.wait_for(
+                self._pool_factory(endpoint.host, endpoint.port), timeout=self.probe_timeout
+            )
+            endpoint.healthy = True
+            endpoint.consecutive_failures = 0
+            return True
+        except Exception as e:
+            endpoint.last_error = str(e)
+            endpoint.ejected_at = endpoint.ejected_at or time.time()
+            logger.warning(f"MySQL副本连接失败: {endpoint.name}, 错误: {e}")
+            return False
+    
+    def choose(self) -> Optional[ReplicaEndpoint]:
+        """选择按权重折算在途请求最少的健康副本，负载相同时选择延迟较低者"""
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.healthy and endpoint.pool is not None]
+        if not candidates:
+            return None
+        return min(
+            candidates,
+            key=lambda endpoint: (endpoint.load, endpoint.latency_ms if endpoint.latency_ms is not None else 0.0)
+        )
+    
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[Tuple[Any, Optional[ReplicaEndpoint]]]:
+        """
+        获取只读连接
+        
+        Yields:
+            (连接, 所属副本)，回退到主库时副本为None
+        """
+        endpoint = self.choose()
+        
+        if endpoint is None:
+            if not self.fallback_to_primary:
+                raise QueryEngineException("没有可用的MySQL只读副本")
+            
+            self._primary_fallbacks += 1
+            self._primary_in_flight += 1
+            try:
+                async with self._primary_pool().acquire() as conn:
+                    yield conn, None
+            finally:
+                self._primary_in_flight -= 1
+            return
+        
+        endpoint.in_flight += 1
+        endpoint.requests += 1
+        start_time = time.perf_counter()
+        try:
+            async with endpoint.pool.acquire() as conn:
+                yield conn, endpoint
+        except BaseException as e:
+            if _is_connection_error(e):
+                endpoint.errors += 1
+                self._record_failure(endpoint, e)
+            raise
+        else:
+            endpoint.consecutive_failures = 0
+            endpoint.record_latency((time.perf_counter() - start_time) * 1000)
+        finally:
+            endpoint.in_flight -= 1
+    
+    def _record_failure(self, endpoint: ReplicaEndpoint, error: BaseException):
+        """记录一次连接级故障，连续故障达到阈值时摘除副本"""
+        endpoint.consecutive_failures += 1
+        endpoint.consecutive_successes = 0
+        endpoint.last_error = str(error)
+        
+        if endpoint.healthy and endpoint.consecutive_failures >= self.max_failures:
+            endpoint.healthy = False
+            endpoint.ejected_at = time.time()
+            endpoint.ejections += 1
+            logger.warning(f"MySQL副本已摘除: {endpoint.name}，连续 {endpoint.consecutive_failures} 次失败，错误: {error}")
+    
+    def _record_success(self, endpoint: ReplicaEndpoint):
+        """记录一次探测成功，被摘除的副本连续成功达到阈值时恢复"""
+        endpoint.consecutive_failures = 0
+        endpoint.consecutive_successes += 1
+        
+        if not endpoint.healthy and endpoint.consecutive_successes >= self.readmit_successes:
+            endpoint.healthy = True
+            endpoint.ejected_at = None
+            endpoint.last_error = None
+            logger.info(f"MySQL副本已恢复: {endpoint.name}")
+    
+    async def _probe_loop(self):
+        """后台定期探测所有副本"""
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await asyncio.gather(
+                *(self.probe(endpoint) for endpoint in self.endpoints),
+                return_exceptions=True
+            )
+    
+    async def probe(self, endpoint: ReplicaEndpoint) -> bool:
+        """探测单个副本，连接池不存在时先尝试创建"""
+        if endpoint.pool is None:
+            if not await self._open_pool(endpoint):
+                return False
+            # 连接池刚建立，仍需连续探测成功才恢复
+            endpoint.healthy = False
+        
+        start_time = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._ping(endpoint), timeout=self.probe_timeout)
+        except Exception as e:
+            self._record_failure(endpoint, e)
+            return False
+        
+        endpoint.probe_latency_ms = (time.perf_counter() - start_time) * 1000
+        self._record_success(endpoint)
+        return True
+    
+    @staticmethod
+    async def _ping(endpoint: ReplicaEndpoint):
+        """在副本上执行探测语句"""
+        async with endpoint.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("SELECT 1")
+                await cursor.fetchone()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取路由统计信息"""
+        return {
+            "replicas": [endpoint.get_stats() for endpoint in self.endpoints],
+            "healthy_replicas": sum(1 for endpoint in self.endpoints if endpoint.healthy),
+            "fallback_to_primary": self.fallback_to_primary,
+            "primary_fallbacks": self._primary_fallbacks,
+            "primary_in_flight": self._primary_in_flight
+        }
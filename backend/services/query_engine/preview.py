@@ -0,0 +1,204 @@
+"""
+预览查询
+在固定延迟目标内返回结果的前N行，聚合查询在大表上改写为 TABLESAMPLE 抽样近似；
+完整精确结果由调用方在后台计算
+"""
+import decimal
+import re
+from typing import List, Any, Optional, Callable
+
+from .result_cache import normalize_sql
+
+# 聚合查询：含聚合函数或 GROUP BY
+_AGGREGATE_PATTERN = re.compile(r"\b(?:COUNT|SUM|AVG|MIN|MAX)\s*\(|\bGROUP\s+BY\b", re.IGNORECASE)
+# 单表查询的 FROM 子句：表名和可选的别名
+_SINGLE_TABLE_PATTERN = re.compile(
+    r"\bFROM\s+([\w.`\"]+)(?:\s+(?:AS\s+)?(?!(?:WHERE|GROUP|ORDER|HAVING|LIMIT|QUALIFY|WINDOW|TABLESAMPLE|USING)\b)(\w+))?",
+    re.IGNORECASE
+)
+# 含这些结构的查询不做抽样改写（多表、子查询、集合运算）
+_NOT_SAMPLEABLE_PATTERN = re.compile(
+    r"\b(?:JOIN|UNION|INTERSECT|EXCEPT|WITH|TABLESAMPLE|SAMPLE)\b|\(\s*SELECT\b",
+    re.IGNORECASE
+)
+# 可按抽样比例放大的可加性聚合调用的开头（COUNT(DISTINCT ...) 不可放大）
+_ADDITIVE_CALL_PATTERN = re.compile(r"^(?:COUNT|SUM)\s*\((?!\s*DISTINCT\b)", re.IGNORECASE)
+# 聚合调用之后只允许出现列别名
+_ALIAS_PATTERN = re.compile(r"^(?:\s+(?:AS\s+)?[\w`\"]+)?$", re.IGNORECASE)
+# 最外层的排序和行数限制子句
+_ORDER_BY_PATTERN = re.compile(r"\bORDER\s+BY\b", re.IGNORECASE)
+_LIMIT_PATTERN = re.compile(r"\b(?:LIMIT|OFFSET|FETCH)\b", re.IGNORECASE)
+
+
+def is_aggregate_query(sql: str) -> bool:
+    """是否为聚合查询"""
+    return bool(_AGGREGATE_PATTERN.search(normalize_sql(sql)))
+
+
+def _top_level_positions(sql: str):
+    """逐个返回不在字符串和括号内的字符位置"""
+    depth = 0
+    quote = None
+    for index, char in enumerate(sql):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"', "`"):
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0:
+            yield index
+
+
+def _has_top_level(sql: str, pattern: re.Pattern) -> bool:
+    """最外层（不在字符串和括号内）是否出现指定子句"""
+    return any(pattern.match(sql, index) for index in _top_level_positions(sql))
+
+
+def _closing_paren(text: str, open_index: int) -> int:
+    """返回与 open_index 处左括号配对的右括号位置，不配对时返回-1"""
+    depth = 0
+    quote = None
+    for index in range(open_index, len(text)):
+        char = text[index]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"', "`"):
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return index
+    return -1
+
+
+def limit_sql(sql: str, limit: int) -> str:
+    """
+    限制查询结果行数
+    
+    最外层有 ORDER BY 而没有 LIMIT 时直接在外层追加 LIMIT：MySQL会忽略派生表中
+    不带 LIMIT 的 ORDER BY，包装为子查询后取到的不一定是排序后的前N行
+    """
+    sql = normalize_sql(sql)
+    if _has_top_level(sql, _ORDER_BY_PATTERN) and not _has_top_level(sql, _LIMIT_PATTERN):
+        return f"{sql} LIMIT {int(limit)}"
+    return f"SELECT * FROM ({sql}) AS _preview_limited LIMIT {int(limit)}"
+
+
+def sample_sql(sql: str, sample_table: Callable[[str], Optional[str]]) -> Optional[str]:
+    """
+    将单表查询的表替换为抽样子查询
+    
+    Args:
+        sql: 原始SQL
+        sample_table: 根据表名返回抽样子查询的函数，引擎不支持抽样时返回None
+    
+    Returns:
+        改写后的SQL，查询不适合抽样时返回None
+    """
+    sql = normalize_sql(sql)
+    if _NOT_SAMPLEABLE_PATTERN.search(sql):
+        return None
+    
+    matches = list(_SINGLE_TABLE_PATTERN.finditer(sql))
+    if len(matches) != 1:
+        return None
+    
+    match = matches[0]
+    if sql[match.end():].lstrip().startswith(","):
+        # FROM a, b 形式的多表查询
+        return None
+    
+    table = match.group(1)
+    sampled = sample_table(table)
+    if sampled is None:
+        return None
+    
+    # 保留原有别名，没有别名时以表名作为别名，使 表名.列名 的引用仍然有效
+    alias = match.group(2) or table.split(".")[-1]
+    return f"{sql[:match.start()]}FROM {sampled} AS {alias}{sql[match.end():]}"
+
+
+def _split_select_items(sql: str) -> List[str]:
+    """拆分最外层 SELECT 的选择列表（跳过字符串和括号内的逗号）"""
+    sql = normalize_sql(sql)
+    head = re.match(r"^SELECT\s+(?:DISTINCT\s+)?", sql, re.IGNORECASE)
+    if not head:
+        return []
+    
+    items = []
+    depth = 0
+    quote = None
+    start = head.end()
+    index = start
+    while index < len(sql):
+        char = sql[index]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"', "`"):
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0 and char == ",":
+            items.append(sql[start:index].strip())
+            start = index + 1
+        elif depth == 0 and re.match(r"\sFROM\b", sql[index:index + 6], re.IGNORECASE):
+            break
+        index += 1
+    
+    items.append(sql[start:index].strip())
+    return items
+
+
+def _is_additive_item(item: str) -> bool:
+    """选择项是否整体为一个 COUNT(...)/SUM(...) 调用（可带别名），比值和算术表达式不可放大"""
+    match = _ADDITIVE_CALL_PATTERN.match(item)
+    if not match:
+        return False
+    close = _closing_paren(item, match.end() - 1)
+    return close >= 0 and bool(_ALIAS_PATTERN.match(item[close + 1:]))
+
+
+def additive_columns(sql: str) -> List[int]:
+    """最外层选择列表中可按抽样比例放大的列（COUNT/SUM）的序号"""
+    return [
+        index for index, item in enumerate(_split_select_items(sql))
+        if _is_additive_item(item)
+    ]
+
+
+def _scale_value(value: Any, factor: float) -> Any:
+    """按抽样比例放大单个值，计数保持整数"""
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return int(round(value * factor))
+    if isinstance(value, decimal.Decimal):
+        return value * decimal.Decimal(repr(factor))
+    if isinstance(value, float):
+        return value * factor
+    return value
+
+
+def scale_rows(rows: List[List[Any]], columns: List[int], factor: float) -> List[List[Any]]:
+    """按抽样比例放大指定列"""
+    if not columns or factor == 1:
+        return rows
+    
+    scaled = []
+    for row in rows:
+        row = list(row)
+        for index in columns:
+            if index < len(row):
+                row[index] = _scale_value(row[index], factor)
+        scaled.append(row)
+    return scaled
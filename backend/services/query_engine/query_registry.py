@@ -0,0 +1,131 @@
+"""
+运行中查询登记表
+按任务ID跟踪正在执行的SQL语句，支持在引擎层真正取消查询
+"""
+import asyncio
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Set, Any, Optional, Callable, Iterator
+
+from utils.logger import get_logger
+from utils.exceptions import QueryCancelledException
+
+logger = get_logger(__name__)
+
+# 当前协程上下文所属的查询任务ID，由查询处理器在执行工作流时设置
+current_task_id: ContextVar[Optional[str]] = ContextVar("current_task_id", default=None)
+
+
+class RunningQueryRegistry:
+    """
+    运行中查询登记表
+    
+    引擎在执行语句前登记取消回调（DuckDB为 cursor.interrupt，MySQL为 KILL QUERY），
+    取消任务时调用该任务下所有回调；登记和取消可能发生在不同线程
+    """
+    
+    def __init__(self):
+        # {task_id: {statement_id: canceller}}
+        self._running: Dict[str, Dict[int, Callable[[], Any]]] = {}
+        # 处于执行范围内的任务，以及其中已被取消的任务
+        self._active_tasks: Set[str] = set()
+        self._cancelled_tasks: Set[str] = set()
+        self._statement_ids = itertools.count(1)
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def task_scope(self, task_id: str) -> Iterator[None]:
+        """在当前上下文中绑定任务ID，范围结束后清理取消标记"""
+        token = current_task_id.set(task_id)
+        with self._lock:
+            self._active_tasks.add(task_id)
+        try:
+            yield
+        finally:
+            current_task_id.reset(token)
+            with self._lock:
+                self._active_tasks.discard(task_id)
+                self._cancelled_tasks.discard(task_id)
+    
+    @contextmanager
+    def track(self, task_id: Optional[str], canceller: Callable[[], Any]) -> Iterator[None]:
+        """
+        登记一条正在执行的语句
+        
+        Args:
+            task_id: 任务ID，为空时不做登记
+            canceller: 取消回调，可以是普通函数或返回协程的函数
+        """
+        if not task_id:
+            yield
+            return
+        
+        self.check(task_id)
+        
+        statement_id = next(self._statement_ids)
+        with self._lock:
+            self._running.setdefault(task_id, {})[statement_id] = canceller
+        
+        try:
+            yield
+        except Exception as e:
+            # 被取消的语句通常以中断错误结束，统一转换为取消异常
+            if self.is_cancelled(task_id):
+                raise QueryCancelledException(f"任务 {task_id} 的查询已取消") from e
+            raise
+        finally:
+            with self._lock:
+                statements = self._running.get(task_id)
+                if statements is not None:
+                    statements.pop(statement_id, None)
+                    if not statements:
+                        del self._running[task_id]
+    
+    def is_cancelled(self, task_id: Optional[str]) -> bool:
+        """任务是否已被取消"""
+        if not task_id:
+            return False
+        with self._lock:
+            return task_id in self._cancelled_tasks
+    
+    def check(self, task_id: Optional[str]):
+        """任务已被取消时抛出取消异常"""
+        if self.is_cancelled(task_id):
+            raise QueryCancelledException(f"任务 {task_id} 的查询已取消")
+    
+    async def cancel(self, task_id: str) -> int:
+        """
+        取消任务下所有正在执行的语句
+        
+        Returns:
+            被中断的语句数量
+        """
+        with self._lock:
+            if task_id in self._active_tasks:
+                self._cancelled_tasks.add(task_id)
+            cancellers = list(self._running.get(task_id, {}).values())
+        
+        interrupted = 0
+        for canceller in cancellers:
+            try:
+                result = canceller()
+                if asyncio.iscoroutine(result):
+                    await result
+                interrupted += 1
+            except Exception as e:
+                logger.warning(f"中断任务 {task_id} 的语句失败: {e}")
+        
+        if interrupted:
+            logger.info(f"已中断任务 {task_id} 的 {interrupted} 条运行中语句")
+        return interrupted
+    
+    def get_running_count(self) -> int:
+        """获取运行中的语句数量"""
+        with self._lock:
+            return sum(len(statements) for statements in self._running.values())
+
+
+# 全局运行中查询登记表实例
+query_registry = RunningQueryRegistry()
@@ -0,0 +1,376 @@
+"""
+查询结果缓存
+按规范化SQL和参数缓存查询结果，按字节预算做LRU淘汰，并在底层表变更时失效
+"""
+import copy
+import hashlib
+import json
+import re
+import sys
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, List, Any, Optional, Iterable
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 规范化时保留字符串和引号标识符，去掉注释并合并空白
+_SQL_TOKEN_PATTERN = re.compile(
+    r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`)|(--[^\n]*|/\*.*?\*/)|(\s+)",
+    re.DOTALL
+)
+# 扫描FROM子句用的词法单元：字符串和引号标识符、单词、括号
+_SQL_SCAN_PATTERN = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`)|(\w+)|([(),])")
+# 参数中使用 FROM 关键字的函数，如 EXTRACT(YEAR FROM d)
+_FROM_ARGUMENT_FUNCTIONS = {"EXTRACT", "SUBSTRING", "SUBSTR", "TRIM", "POSITION", "OVERLAY"}
+# FROM列表中的一项：表名（后跟括号时为表函数），可带别名
+_FROM_ITEM_PATTERN = re.compile(r"\s*([\w.`\"]+)\s*(\()?")
+_ALIAS_PATTERN = re.compile(r"\s*(?:AS\s+)?([\w`\"]+)", re.IGNORECASE)
+# 表名之后结束FROM列表项的子句关键字（不是别名）
+_CLAUSE_KEYWORDS = {
+    "WHERE", "GROUP", "ORDER", "HAVING", "LIMIT", "OFFSET", "FETCH", "FOR", "WINDOW", "QUALIFY",
+    "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL", "OUTER", "STRAIGHT_JOIN",
+    "ON", "USING", "UNION", "EXCEPT", "INTERSECT", "TABLESAMPLE", "USE", "FORCE", "IGNORE"
+}
+# JOIN 之后的表名
+_JOIN_TABLE_PATTERN = re.compile(r"\bJOIN\s+([\w.`\"]+)(?!\s*\()", re.IGNORECASE)
+# WITH 定义的公用表表达式名称，不是实际的表
+_CTE_NAME_PATTERN = re.compile(r"(?:\bWITH(?:\s+RECURSIVE)?|,)\s*([\w`\"]+)\s*(?:\([^()]*\)\s*)?AS\s*\(", re.IGNORECASE)
+# 结果不确定或依赖系统状态的查询不缓存
+_UNCACHEABLE_PATTERN = re.compile(
+    r"\b(NOW|CURRENT_TIMESTAMP|CURRENT_DATE|CURRENT_TIME|LOCALTIME|LOCALTIMESTAMP|SYSDATE|"
+    r"UNIX_TIMESTAMP|RAND|RANDOM|UUID|GEN_RANDOM_UUID|CONNECTION_ID|LAST_INSERT_ID|"
+    r"INFORMATION_SCHEMA|PERFORMANCE_SCHEMA|DUCKDB_\w+|PRAGMA_\w+)\b",
+    re.IGNORECASE
+)
+
+
+def normalize_sql(sql: str) -> str:
+    """规范化SQL文本：去掉注释、合并空白和末尾分号，字符串字面量保持不变"""
+    def replace(match):
+        if match.group(1):
+            return match.group(1)
+        return " "
+    
+    return _SQL_TOKEN_PATTERN.sub(replace, sql).strip().rstrip(";").strip()
+
+
+def _unquote(name: str) -> str:
+    return name.replace("`", "").replace('"', "").lower()
+
+
+def _skip_parens(sql: str, start: int) -> int:
+    """返回从 start 处左括号开始的括号组之后的位置"""
+    depth = 0
+    for match in _SQL_SCAN_PATTERN.finditer(sql, start):
+        if match.group(3) == "(":
+            depth += 1
+        elif match.group(3) == ")":
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    return len(sql)
+
+
+def _from_list_positions(sql: str) -> List[int]:
+    """返回各FROM子句表列表的起始位置，跳过函数参数中的FROM和 IS DISTINCT FROM"""
+    positions = []
+    # 每层括号前的函数名
+    functions: List[Optional[str]] = []
+    previous = None
+    for match in _SQL_SCAN_PATTERN.finditer(sql):
+        word = match.group(2).upper() if match.group(2) else None
+        if match.group(3) == "(":
+            functions.append(previous)
+        elif match.group(3) == ")" and functions:
+            functions.pop()
+        elif word == "FROM" and previous != "DISTINCT":
+            if not (functions and functions[-1] in _FROM_ARGUMENT_FUNCTIONS):
+                positions.append(match.end())
+        previous = word
+    return positions
+
+
+def _from_list_tables(sql: str, position: int) -> List[str]:
+    """读取FROM列表中逗号分隔的各项表名；子查询和表函数跳过（子查询中的表另行提取）"""
+    tables = []
+    while True:
+        item = _FROM_ITEM_PATTERN.match(sql, position)
+        if sql[position:].lstrip().startswith("("):
+            position = _skip_parens(sql, sql.index("(", position))
+        elif item is None:
+            break
+        elif item.group(2):
+            position = _skip_parens(sql, item.start(2))
+        else:
+            tables.append(_unquote(item.group(1)))
+            position = item.end(1)
+        
+        alias = _ALIAS_PATTERN.match(sql, position)
+        if alias is not None and alias.group(1).upper() not in _CLAUSE_KEYWORDS:
+            position = alias.end()
+        
+        rest = sql[position:].lstrip()
+        if not rest.startswith(","):
+            break
+        position = len(sql) - len(rest) + 1
+    return tables
+
+
+def extract_tables(sql: str) -> List[str]:
+    """提取SQL中引用的表名（小写，去掉引号），包括FROM列表中逗号分隔的各表，不含公用表表达式"""
+    normalized = normalize_sql(sql)
+    names = [
+        table
+        for position in _from_list_positions(normalized)
+        for table in _from_list_tables(normalized, position)
+    ]
+    names += [_unquote(name) for name in _JOIN_TABLE_PATTERN.findall(normalized)]
+    
+    ctes = {_unquote(name) for name in _CTE_NAME_PATTERN.findall(normalized)}
+    tables = []
+    for table in names:
+        if table and table not in ctes and table not in tables:
+            tables.append(table)
+    return tables
+
+
+def make_query_key(sql: str, params: Optional[Any] = None) -> str:
+    """根据规范化SQL和参数生成查询键"""
+    payload = json.dumps([normalize_sql(sql), params], default=str, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def estimate_result_size(result: Any) -> int:
+    """估算查询结果占用的内存字节数"""
+    if result.arrow_table is not None:
+        return result.arrow_table.nbytes
+    
+    rows = result.rows
+    if not rows:
+        return 0
+    
+    # 抽样估算平均行大小
+    sample = rows[:100]
+    sample_size = sum(
+        sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+        for row in sample
+    )
+    return sample_size * len(rows) // len(sample)
+
+
+class CacheEntry:
+    """缓存条目"""
+    
+    def __init__(
+        self,
+        result: Any,
+        size: int,
+        expires_at: float,
+        tables: List[str],
+        table_versions: Dict[str, Any]
+    ):
+        self.result = result
+        self.size = size
+        self.expires_at = expires_at
+        self.tables = tables
+        self.table_versions = table_versions
+        self.hits = 0
+
+
+class CacheWrite:
+    """
+    一次查询的结果缓存写入
+    
+    执行前读取表数据版本并登记到上下文中；执行方发现结果可能比这些版本旧时
+    （如由落后于主库的副本返回）调用 reject，结果不写入缓存
+    """
+    
+    def __init__(self, tables: List[str]):
+        self.tables = tables
+        self.table_versions: Optional[Dict[str, Any]] = None
+        # 读取版本时源库的复制位置（如MySQL的GTID集合），由引擎记录
+        self.source_position: Optional[Any] = None
+        self.rejected = False
+    
+    def reject(self, reason: str):
+        """放弃本次写入"""
+        self.rejected = True
+        logger.info(f"查询结果不写入缓存: {reason}")
+
+
+# 当前查询的结果缓存写入，引擎在读取版本和执行查询时访问
+current_cache_write: ContextVar[Optional[CacheWrite]] = ContextVar("current_cache_write", default=None)
+
+
+class QueryResultCache:
+    """
+    查询结果缓存
+    
+    每个查询引擎实例持有独立的缓存。条目记录写入时各表的数据版本，
+    读取时版本不一致即视为底层表已变更
+    """
+    
+    def __init__(
+        self,
+        max_bytes: int = 256 * 1024 * 1024,
+        default_ttl: int = 300,
+        max_entry_bytes: Optional[int] = None
+    ):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        # 单个结果超过该大小不缓存，避免一次查询挤掉全部条目
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 4
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._current_bytes = 0
+        
+        # 统计信息
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+        self._rejected = 0
+    
+    @staticmethod
+    def is_cacheable(sql: str) -> bool:
+        """只缓存不含不确定函数和系统表的只读查询"""
+        normalized = normalize_sql(sql).upper()
+        if not normalized.startswith(("SELECT", "WITH")):
+            return False
+        return _UNCACHEABLE_PATTERN.search(normalized) is None
+    
+    def get(self, key: str, table_versions: Dict[str, Any]) -> Optional[Any]:
+        """
+        读取缓存结果
+        
+        Args:
+            key: 查询键
+            table_versions: 当前各表的数据版本
+        
+        Returns:
+            缓存的查询结果（QueryResult）副本，未命中返回None
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+        
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self._expirations += 1
+            self._misses += 1
+            return None
+        
+        if any(table_versions.get(table) != version for table, version in entry.table_versions.items()):
+            self._remove(key)
+            self._invalidations += 1
+            self._misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        entry.hits += 1
+        self._hits += 1
+        
+        # 返回浅拷贝，行数据和Arrow表共享，元数据各自独立
+        cached = copy.copy(entry.result)
+        cached.metadata = {
+            **entry.result.metadata,
+            "cache_hit": True,
+            "cached_at": entry.result.created_at.isoformat()
+        }
+        return cached
+    
+    def put(
+        self,
+        key: str,
+        result: Any,
+        tables: List[str],
+        table_versions: Dict[str, Any],
+        ttl: Optional[int] = None
+    ) -> bool:
+        """
+        写入缓存
+        
+        Args:
+            key: 查询键
+            result: 查询结果
+            tables: 查询引用的表
+            table_versions: 执行前读取的各表数据版本
+            ttl: 条目有效期（秒），为空时使用默认有效期
+        
+        Returns:
+            是否写入成功
+        """
+        size = estimate_result_size(result)
+        if size > self.max_entry_bytes:
+            self._rejected += 1
+            return False
+        
+        if key in self._entries:
+            self._remove(key)
+        
+        ttl = ttl if ttl is not None else self.default_ttl
+        self._entries[key] = CacheEntry(
+            result=result,
+            size=size,
+            expires_at=time.monotonic() + ttl,
+            tables=tables,
+            table_versions=table_versions
+        )
+        self._current_bytes += size
+        
+        # 超出字节预算时淘汰最久未使用的条目
+        while self._current_bytes > self.max_bytes and self._entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self._evictions += 1
+        
+        return True
+    
+    def invalidate_tables(self, tables: Iterable[str]) -> int:
+        """
+        使引用了指定表的缓存条目失效
+        
+        Returns:
+            失效的条目数
+        """
+        targets = {table.lower() for table in tables}
+        keys = [
+            key for key, entry in self._entries.items()
+            if any(table in targets or table.split(".")[-1] in targets for table in entry.tables)
+        ]
+        for key in keys:
+            self._remove(key)
+        self._invalidations += len(keys)
+        return len(keys)
+    
+    def clear(self):
+        """清空缓存"""
+        self._invalidations += len(self._entries)
+        self._entries.clear()
+        self._current_bytes = 0
+    
+    def _remove(self, key: str):
+        """删除缓存条目"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._current_bytes -= entry.size
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            "evictions": self._evictions,
+            "expirations": self._expirations,
+            "invalidations": self._invalidations,
+            "rejected": self._rejected
+        }
@@ -0,0 +1,316 @@
+"""
+查询结果编码
+按列类型一次性选择转换器，逐列而非逐单元格转换结果行；JSON序列化优先使用orjson，
+输出与 FastAPI 默认的 JSONResponse（jsonable_encoder + json.dumps）逐字节一致
+"""
+import datetime
+import decimal
+import json
+import re
+import uuid
+from enum import Enum
+from typing import Dict, List, Any, Optional, Callable, Sequence
+
+try:
+    import orjson
+except ImportError:  # 未安装orjson时使用标准库序列化
+    orjson = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ColumnKind(str, Enum):
+    """列的编码类别"""
+    PLAIN = "plain"  # 行数据无需转换，JSON序列化结果与标准库一致（整数、字符串、布尔、日期等）
+    DATETIME = "datetime"  # 日期时间，行数据中转换为ISO格式字符串
+    FLOAT = "float"  # 浮点数（含时间间隔），JSON需检查数值范围
+    DECIMAL = "decimal"  # 定点数，JSON按 FastAPI 的规则转换为整数或浮点数
+    GENERIC = "generic"  # 嵌套或未知类型，逐值判断
+
+
+# DuckDB 类型名（cursor.description 中的类型）到编码类别
+_DUCKDB_KINDS = {
+    "TIMESTAMP": ColumnKind.DATETIME,
+    "TIMESTAMP WITH TIME ZONE": ColumnKind.DATETIME,
+    "TIMESTAMP_S": ColumnKind.DATETIME,
+    "TIMESTAMP_MS": ColumnKind.DATETIME,
+    "TIMESTAMP_NS": ColumnKind.DATETIME,
+    "FLOAT": ColumnKind.FLOAT,
+    "DOUBLE": ColumnKind.FLOAT,
+    "INTERVAL": ColumnKind.FLOAT,
+    "BOOLEAN": ColumnKind.PLAIN,
+    "TINYINT": ColumnKind.PLAIN, "SMALLINT": ColumnKind.PLAIN,
+    "INTEGER": ColumnKind.PLAIN, "BIGINT": ColumnKind.PLAIN, "HUGEINT": ColumnKind.PLAIN,
+    "UTINYINT": ColumnKind.PLAIN, "USMALLINT": ColumnKind.PLAIN,
+    "UINTEGER": ColumnKind.PLAIN, "UBIGINT": ColumnKind.PLAIN, "UHUGEINT": ColumnKind.PLAIN,
+    "VARCHAR": ColumnKind.PLAIN, "BLOB": ColumnKind.PLAIN, "UUID": ColumnKind.PLAIN,
+    "DATE": ColumnKind.PLAIN, "TIME": ColumnKind.PLAIN, "TIME WITH TIME ZONE": ColumnKind.PLAIN,
+    "BIT": ColumnKind.PLAIN, "JSON": ColumnKind.PLAIN
+}
+
+# MySQL 字段类型码（pymysql.constants.FIELD_TYPE）到编码类别
+_MYSQL_KINDS = {
+    0: ColumnKind.DECIMAL, 246: ColumnKind.DECIMAL,  # DECIMAL, NEWDECIMAL
+    4: ColumnKind.FLOAT, 5: ColumnKind.FLOAT,  # FLOAT, DOUBLE
+    11: ColumnKind.FLOAT,  # TIME，驱动返回 timedelta
+    7: ColumnKind.DATETIME, 12: ColumnKind.DATETIME,  # TIMESTAMP, DATETIME
+    1: ColumnKind.PLAIN, 2: ColumnKind.PLAIN, 3: ColumnKind.PLAIN, 6: ColumnKind.PLAIN,
+    8: ColumnKind.PLAIN, 9: ColumnKind.PLAIN, 10: ColumnKind.PLAIN, 13: ColumnKind.PLAIN,
+    14: ColumnKind.PLAIN, 15: ColumnKind.PLAIN, 16: ColumnKind.PLAIN, 245: ColumnKind.PLAIN,
+    247: ColumnKind.PLAIN, 248: ColumnKind.PLAIN, 249: ColumnKind.PLAIN, 250: ColumnKind.PLAIN,
+    251: ColumnKind.PLAIN, 252: ColumnKind.PLAIN, 253: ColumnKind.PLAIN, 254: ColumnKind.PLAIN,
+    255: ColumnKind.PLAIN
+}
+
+_DECIMAL_TYPE_PATTERN = re.compile(r"^DECIMAL\(\d+,\s*\d+\)$")
+
+# orjson与标准库 repr 的浮点数格式只在该区间内完全一致（区间外一方使用科学计数法）
+_SAFE_FLOAT_MIN = 1e-4
+_SAFE_FLOAT_MAX = 1e16
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_SERIALIZE_NUMPY
+else:
+    _ORJSON_OPTIONS = 0
+
+
+def _kind_from_duckdb_type(type_code: Any) -> ColumnKind:
+    """根据DuckDB类型判断编码类别"""
+    type_name = str(type_code).upper()
+    if type_name in _DUCKDB_KINDS:
+        return _DUCKDB_KINDS[type_name]
+    if _DECIMAL_TYPE_PATTERN.match(type_name):
+        return ColumnKind.DECIMAL
+    if type_name.startswith(("ENUM(", "VARCHAR")):
+        return ColumnKind.PLAIN
+    return ColumnKind.GENERIC
+
+
+def _kind_from_arrow_type(arrow_type: Any) -> ColumnKind:
+    """根据Arrow类型判断编码类别（时间戳已在转换为行时格式化为字符串）"""
+    if pa.types.is_floating(arrow_type) or pa.types.is_duration(arrow_type) or pa.types.is_interval(arrow_type):
+        return ColumnKind.FLOAT
+    if pa.types.is_decimal(arrow_type):
+        return ColumnKind.DECIMAL
+    if pa.types.is_nested(arrow_type) or pa.types.is_dictionary(arrow_type) or pa.types.is_null(arrow_type):
+        return ColumnKind.GENERIC
+    return ColumnKind.PLAIN
+
+
+def _format_datetime_column(values: Sequence[Any]) -> List[Any]:
+    """日期时间列：转换为ISO格式字符串（驱动对非法日期可能返回字符串，原样保留）"""
+    return [value.isoformat() if isinstance(value, datetime.datetime) else value for value in values]
+
+
+# 逐行转换时各类别使用的列转换器，None 表示无需转换
+_ROW_CONVERTERS: Dict[ColumnKind, Optional[Callable[[Sequence[Any]], List[Any]]]] = {
+    ColumnKind.PLAIN: None,
+    ColumnKind.FLOAT: None,
+    ColumnKind.DECIMAL: None,
+    ColumnKind.DATETIME: _format_datetime_column,
+    ColumnKind.GENERIC: _format_datetime_column
+}
+
+
+def _decimal_to_number(value: decimal.Decimal) -> Any:
+    """与 fastapi.encoders.decimal_encoder 一致：无小数位时为整数，否则为浮点数"""
+    exponent = value.as_tuple().exponent
+    if isinstance(exponent, int) and exponent >= 0:
+        return int(value)
+    return float(value)
+
+
+def _is_safe_float(value: float) -> bool:
+    """浮点数经orjson序列化后是否与标准库逐字节一致（非有限值标准库会拒绝序列化）"""
+    return value == 0.0 or _SAFE_FLOAT_MIN <= abs(value) < _SAFE_FLOAT_MAX
+
+
+def _is_orjson_safe(value: Any) -> bool:
+    """递归检查值经orjson序列化是否与标准库一致"""
+    if value is None or isinstance(value, (str, bool, int)):
+        return True
+    if isinstance(value, float):
+        return _is_safe_float(value)
+    if isinstance(value, decimal.Decimal):
+        number = _decimal_to_number(value) if value.is_finite() else float("nan")
+        return not isinstance(number, float) or _is_safe_float(number)
+    if isinstance(value, datetime.timedelta):
+        return _is_safe_float(value.total_seconds())
+    if isinstance(value, dict):
+        return all(_is_orjson_safe(key) and _is_orjson_safe(item) for key, item in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return all(_is_orjson_safe(item) for item in value)
+    return True
+
+
+def _is_column_safe(kind: ColumnKind, values: Sequence[Any]) -> bool:
+    """按列类别检查整列经orjson序列化是否与标准库一致"""
+    if kind in (ColumnKind.PLAIN, ColumnKind.DATETIME):
+        return True
+    if kind == ColumnKind.FLOAT:
+        return all(
+            value is None or (_is_safe_float(value) if isinstance(value, float) else _is_orjson_safe(value))
+            for value in values
+        )
+    return all(_is_orjson_safe(value) for value in values)
+
+
+def _orjson_default(value: Any) -> Any:
+    """orjson不直接支持的类型，与 jsonable_encoder 的转换规则一致"""
+    if isinstance(value, decimal.Decimal):
+        return _decimal_to_number(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, bytes):
+        return value.decode()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"不支持的类型: {type(value).__name__}")
+
+
+def _dumps_stdlib(content: Any) -> bytes:
+    """标准库序列化，与 FastAPI JSONResponse 的输出一致"""
+    from fastapi.encoders import jsonable_encoder
+    
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+
+_fallback_logged = False
+
+
+def _orjson_available() -> bool:
+    """orjson是否可用；未安装时首次回退到标准库序列化时记录一次日志"""
+    global _fallback_logged
+    if orjson is None and not _fallback_logged:
+        _fallback_logged = True
+        logger.warning("未安装orjson，查询结果使用标准库JSON序列化")
+    return orjson is not None
+
+
+def _dumps_fast(content: Any) -> Optional[bytes]:
+    """orjson序列化，失败时返回None"""
+    try:
+        return orjson.dumps(content, default=_orjson_default, option=_ORJSON_OPTIONS)
+    except (orjson.JSONEncodeError, TypeError):
+        return None
+
+
+def encode_json(content: Any) -> bytes:
+    """
+    序列化为JSON字节串
+    
+    输出与 JSONResponse(jsonable_encoder(content)) 逐字节一致；orjson格式可能不同的情况
+    （超出区间的浮点数、超过64位的整数、无法编码的字符串等）回退到标准库
+    """
+    if _orjson_available() and _is_orjson_safe(content):
+        encoded = _dumps_fast(content)
+        if encoded is not None:
+            return encoded
+    return _dumps_stdlib(content)
+
+
+class ResultEncoder:
+    """
+    查询结果编码器
+    
+    根据游标描述或Arrow模式为每列确定一次编码类别，
+    之后行格式化和JSON序列化都按列处理，不再逐单元格做类型判断
+    """
+    
+    def __init__(self, kinds: List[ColumnKind]):
+        self.kinds = kinds
+    
+    @classmethod
+    def from_description(cls, description: Optional[Sequence[Any]], engine_type: str) -> "ResultEncoder":
+        """
+        根据 cursor.description 创建编码器
+        
+        Args:
+            description: 游标描述，每项第二个元素为类型
+            engine_type: 引擎类型（duckdb / mysql）
+        """
+        kinds = []
+        for column in description or []:
+            type_code = column[1]
+            if engine_type == "mysql":
+                kinds.append(_MYSQL_KINDS.get(type_code, ColumnKind.GENERIC))
+            elif engine_type == "duckdb":
+                kinds.append(_kind_from_duckdb_type(type_code))
+            else:
+                kinds.append(ColumnKind.GENERIC)
+        return cls(kinds)
+    
+    @classmethod
+    def from_arrow_schema(cls, schema: Any) -> "ResultEncoder":
+        """根据Arrow模式创建编码器"""
+        return cls([_kind_from_arrow_type(field.type) for field in schema])
+    
+    @classmethod
+    def generic(cls, column_count: int) -> "ResultEncoder":
+        """列类型未知时逐值判断"""
+        return cls([ColumnKind.GENERIC] * column_count)
+    
+    def format_rows(self, rows: Sequence[Sequence[Any]]) -> List[List[Any]]:
+        """格式化行数据：按列转换日期时间为ISO格式字符串，结果与逐单元格转换一致"""
+        if not rows:
+            return []
+        
+        converters = [(index, _ROW_CONVERTERS[kind]) for index, kind in enumerate(self.kinds)]
+        converters = [(index, converter) for index, converter in converters if converter is not None]
+        if not converters:
+            return [list(row) for row in rows]
+        
+        columns = list(zip(*rows))
+        if len(columns) != len(self.kinds):
+            # 列数与描述不符时逐值判断
+            return ResultEncoder.generic(len(columns)).format_rows(rows)
+        
+        for index, converter in converters:
+            columns[index] = converter(columns[index])
+        return [list(row) for row in zip(*columns)]
+    
+    def rows_safe_for_orjson(self, rows: Sequence[Sequence[Any]]) -> bool:
+        """逐列检查行数据经orjson序列化是否与标准库一致"""
+        if not rows:
+            return True
+        
+        checked = [index for index, kind in enumerate(self.kinds) if kind not in (ColumnKind.PLAIN, ColumnKind.DATETIME)]
+        if not checked:
+            return True
+        
+        columns = list(zip(*rows))
+        if len(columns) != len(self.kinds):
+            return all(_is_orjson_safe(value) for column in columns for value in column)
+        return all(_is_column_safe(self.kinds[index], columns[index]) for index in checked)
+    
+    def encode_json(self, content: Dict[str, Any], rows_key: str = "rows") -> bytes:
+        """
+        序列化包含行数据的字典
+        
+        行数据按列检查，其余字段递归检查，输出与 encode_json 一致
+        """
+        rows = content.get(rows_key) or []
+        envelope = {key: value for key, value in content.items() if key != rows_key}
+        
+        if _orjson_available() and _is_orjson_safe(envelope) and self.rows_safe_for_orjson(rows):
+            encoded = _dumps_fast(content)
+            if encoded is not None:
+                return encoded
+        return _dumps_stdlib(content)
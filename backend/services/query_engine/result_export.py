@@ -0,0 +1,447 @@
+"""
+查询结果导出
+从查询引擎流式读取结果，按批次写入CSV、XLSX（只写模式）或Parquet文件，不在内存中保留完整结果；
+导出进度通过WebSocket推送，完成的文件以分块HTTP响应下载
+"""
+import asyncio
+import csv
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from pathlib import Path
+from typing import Dict, List, Any, Optional, AsyncIterator
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 未安装pyarrow时不支持Parquet导出
+    pa = None
+    pq = None
+
+try:
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+except ImportError:  # 未安装openpyxl时不支持XLSX导出
+    Workbook = None
+    ILLEGAL_CHARACTERS_RE = None
+
+from .engine_factory import get_connected_engine
+from .query_registry import query_registry
+from .scheduler import scheduling_scope, QueryLane
+from services.websocket.manager import connection_manager
+from utils.logger import get_logger
+from utils.exceptions import ValidationException, ResourceNotFoundException, QueryCancelledException
+from config.settings import get_settings
+
+logger = get_logger(__name__)
+
+# XLSX单个工作表的最大行数（含表头）
+_XLSX_MAX_SHEET_ROWS = 1048576
+
+
+class ExportFormat(str, Enum):
+    """导出格式"""
+    CSV = "csv"
+    XLSX = "xlsx"
+    PARQUET = "parquet"
+
+
+class ExportStatus(str, Enum):
+    """导出任务状态"""
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.CSV: "text/csv; charset=utf-8",
+    ExportFormat.XLSX: "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet"
+}
+
+
+class _CsvWriter:
+    """CSV写入器，带BOM以便Excel正确识别UTF-8"""
+    
+    def __init__(self, path: str, columns: List[str]):
+        self._file = open(path, "w", encoding="utf-8-sig", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+    
+    def write(self, rows: List[List[Any]]):
+        self._writer.writerows(rows)
+    
+    def close(self):
+        self._file.close()
+
+
+class _XlsxWriter:
+    """XLSX写入器，使用openpyxl只写模式逐行写出，超过单表行数上限时续写新工作表"""
+    
+    def __init__(self, path: str, columns: List[str]):
+        self._path = path
+        self._columns = columns
+        self._workbook = Workbook(write_only=True)
+        self._sheet = None
+        self._sheet_rows = 0
+        self._new_sheet()
+    
+    def _new_sheet(self):
+        index = len(self._workbook.worksheets) + 1
+        self._sheet = self._workbook.create_sheet(title="结果" if index == 1 else f"结果{index}")
+        self._sheet.append(self._columns)
+        self._sheet_rows = 1
+    
+    @staticmethod
+    def _clean(value: Any) -> Any:
+        if isinstance(value, str):
+            return ILLEGAL_CHARACTERS_RE.sub("", value)
+        if isinstance(value, (list, dict)):
+            return str(value)
+        return value
+    
+    def write(self, rows: List[List[Any]]):
+        for row in rows:
+            if self._sheet_rows >= _XLSX_MAX_SHEET_ROWS:
+                self._new_sheet()
+            self._sheet.append([self._clean(value) for value in row])
+            self._sheet_rows += 1
+    
+    def close(self):
+        self._workbook.save(self._path)
+
+
+class _ParquetWriter:
+    """Parquet写入器，首个批次确定列类型，后续批次按该类型转换"""
+    
+    def __init__(self, path: str, columns: List[str]):
+        self._path = path
+        self._columns = columns
+        self._writer = None
+        self._schema = None
+    
+    def _to_table(self, rows: List[List[Any]]) -> Any:
+        arrays = []
+        for index in range(len(self._columns)):
+            values = [row[index] for row in rows]
+            try:
+                array = pa.array(values)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                array = pa.array([None if value is None else str(value) for value in values])
+            arrays.append(array)
+        return pa.Table.from_arrays(arrays, names=self._columns)
+    
+    def write(self, rows: List[List[Any]]):
+        table = self._to_table(rows)
+        if self._writer is None:
+            # 首个批次中全为空的列按字符串处理
+            self._schema = pa.schema([
+                pa.field(field.name, pa.string()) if pa.types.is_null(field.type) else field
+                for field in table.schema
+            ])
+            self._writer = pq.ParquetWriter(self._path, self._schema)
+        if table.schema != self._schema:
+            table = table.cast(self._schema)
+        self._writer.write_table(table)
+    
+    def close(self):
+        if self._writer is None:
+            pq.write_table(pa.table({column: pa.array([], pa.string()) for column in self._columns}), self._path)
+        else:
+            self._writer.close()
+
+
+_WRITERS = {
+    ExportFormat.CSV: _CsvWriter,
+    ExportFormat.XLSX: _XlsxWriter,
+    ExportFormat.PARQUET: _ParquetWriter
+}
+
+
+class ExportJob:
+    """导出任务"""
+    
+    def __init__(self, task_id: str, sql: str, export_format: ExportFormat, user_id: Optional[int] = None):
+        self.export_id = str(uuid.uuid4())
+        self.task_id = task_id
+        self.sql = sql
+        self.format = export_format
+        self.user_id = user_id
+        self.status = ExportStatus.PENDING
+        self.path: Optional[str] = None
+        self.columns: List[str] = []
+        self.rows_written = 0
+        self.truncated = False
+        self.file_size = 0
+        self.error_message: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+    
+    @property
+    def filename(self) -> str:
+        """下载文件名"""
+        timestamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(self.created_at))
+        return f"query_{self.task_id[:8]}_{timestamp}.{self.format.value}"
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典格式"""
+        return {
+            "export_id": self.export_id,
+            "task_id": self.task_id,
+            "format": self.format.value,
+            "status": self.status.value,
+            "filename": self.filename,
+            "columns": self.columns,
+            "rows_written": self.rows_written,
+            "truncated": self.truncated,
+            "file_size": self.file_size,
+            "error_message": self.error_message,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+
+class ResultExporter:
+    """
+    查询结果导出管理器
+    
+    每个导出任务在后台从引擎流式读取结果，写文件在独立线程池中完成；
+    同时执行的导出数受限，已完成的文件超过保留时间后删除
+    """
+    
+    def __init__(
+        self,
+        base_dir: str,
+        max_rows: int = 1000000,
+        batch_size: int = 10000,
+        max_concurrent: int = 2,
+        file_ttl: int = 3600,
+        chunk_size: int = 256 * 1024,
+        progress_interval: float = 1.0
+    ):
+        self.base_dir = Path(base_dir)
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.file_ttl = file_ttl
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="result-export")
+        # {export_id: 导出任务}
+        self._jobs: Dict[str, ExportJob] = {}
+        
+        # 统计信息
+        self._completed = 0
+        self._failed = 0
+        self._rows_exported = 0
+        self._bytes_exported = 0
+    
+    def is_supported(self, export_format: ExportFormat) -> bool:
+        """导出格式所需的依赖是否已安装"""
+        if export_format == ExportFormat.XLSX:
+            return Workbook is not None
+        if export_format == ExportFormat.PARQUET:
+            return pq is not None
+        return True
+    
+    def start_export(
+        self,
+        task_id: str,
+        sql: str,
+        export_format: ExportFormat,
+        user_id: Optional[int] = None
+    ) -> ExportJob:
+        """
+        创建导出任务并在后台执行
+        
+        Args:
+            task_id: 查询任务ID，进度推送给订阅该任务的连接
+            sql: 导出的SQL
+            export_format: 导出格式
+            user_id: 发起导出的用户
+        """
+        if not self.is_supported(export_format):
+            raise ValidationException(f"导出格式 {export_format.value} 所需的依赖未安装")
+        
+        self._cleanup_expired()
+        
+        job = ExportJob(task_id, sql, export_format, user_id)
+        self._jobs[job.export_id] = job
+        job.task = asyncio.create_task(self._run(job))
+        logger.info(f"导出任务已创建: {job.export_id}（任务 {task_id}，格式 {export_format.value}）")
+        return job
+    
+    def get_job(self, export_id: str) -> ExportJob:
+        """获取导出任务"""
+        job = self._jobs.get(export_id)
+        if job is None:
+            raise ResourceNotFoundException(f"导出任务 {export_id} 不存在")
+        return job
+    
+    async def cancel(self, export_id: str) -> ExportJob:
+        """取消导出任务"""
+        job = self.get_job(export_id)
+        if job.status in (ExportStatus.PENDING, ExportStatus.RUNNING):
+            await query_registry.cancel(job.export_id)
+            if job.task is not None:
+                job.task.cancel()
+        return job
+    
+    async def _run(self, job: ExportJob):
+        """执行导出：流式读取结果并分批写入文件"""
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        path = str(self.base_dir / f"{job.export_id}.{job.format.value}")
+        loop = asyncio.get_running_loop()
+        writer = None
+        
+        try:
+            async with self._semaphore:
+                job.status = ExportStatus.RUNNING
+                engine = await get_connected_engine()
+                last_notified = 0.0
+                
+                # 导出在批量通道执行，不挤占交互查询；登记在导出任务下以便取消时中断语句
+                with query_registry.task_scope(job.export_id), scheduling_scope(job.user_id, QueryLane.BATCH):
+                    stream = engine.execute_query_stream(job.sql, batch_size=self.batch_size)
+                    try:
+                        async for batch in stream:
+                            if writer is None:
+                                job.columns = batch.columns
+                                writer = await loop.run_in_executor(
+                                    self._executor, _WRITERS[job.format], path, batch.columns
+                                )
+                            
+                            rows = batch.rows
+                            remaining = self.max_rows - job.rows_written
+                            if len(rows) > remaining:
+                                rows = rows[:remaining]
+                                job.truncated = True
+                            
+                            await loop.run_in_executor(self._executor, writer.write, rows)
+                            job.rows_written += len(rows)
+                            
+                            if time.monotonic() - last_notified >= self.progress_interval:
+                                last_notified = time.monotonic()
+                                await self._notify(job, "export_progress")
+                            
+                            if job.truncated:
+                                break
+                    finally:
+                        await stream.aclose()
+                
+                if writer is None:
+                    # 空结果只写表头
+                    writer = await loop.run_in_executor(self._executor, _WRITERS[job.format], path, job.columns)
+                await loop.run_in_executor(self._executor, writer.close)
+                writer = None
+            
+            job.path = path
+            job.file_size = os.path.getsize(path)
+            job.status = ExportStatus.COMPLETED
+            self._completed += 1
+            self._rows_exported += job.rows_written
+            self._bytes_exported += job.file_size
+            logger.info(f"导出完成: {job.export_id}，{job.rows_written} 行，{job.file_size} 字节")
+        
+        except (asyncio.CancelledError, QueryCancelledException):
+            job.status = ExportStatus.CANCELLED
+            logger.info(f"导出已取消: {job.export_id}")
+        except Exception as e:
+            job.status = ExportStatus.FAILED
+            job.error_message = str(e)
+            self._failed += 1
+            logger.error(f"导出失败: {job.export_id}, 错误: {e}")
+        finally:
+            job.finished_at = time.time()
+            if job.status != ExportStatus.COMPLETED:
+                if writer is not None:
+                    try:
+                        await loop.run_in_executor(self._executor, writer.close)
+                    except Exception:
+                        pass
+                self._remove_file(path)
+        
+        event = {
+            ExportStatus.COMPLETED: "export_completed",
+            ExportStatus.CANCELLED: "export_cancelled"
+        }.get(job.status, "export_failed")
+        await self._notify(job, event)
+    
+    async def _notify(self, job: ExportJob, event: str):
+        """推送导出进度"""
+        try:
+            await connection_manager.notify_task_update(job.task_id, {"type": event, **job.to_dict()})
+        except Exception as e:
+            logger.warning(f"推送导出进度失败: {e}")
+    
+    async def iter_file(self, export_id: str) -> AsyncIterator[bytes]:
+        """按块读取已完成的导出文件"""
+        job = self.get_job(export_id)
+        if job.status != ExportStatus.COMPLETED or job.path is None:
+            raise ValidationException(f"导出任务 {export_id} 尚未完成")
+        
+        loop = asyncio.get_running_loop()
+        handle = await loop.run_in_executor(self._executor, open, job.path, "rb")
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self._executor, handle.read, self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            handle.close()
+    
+    def _cleanup_expired(self):
+        """删除超过保留时间的导出任务和文件"""
+        now = time.time()
+        for export_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and now - job.finished_at > self.file_ttl:
+                if job.path:
+                    self._remove_file(job.path)
+                del self._jobs[export_id]
+    
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"删除导出文件失败 {path}: {e}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            "jobs": len(self._jobs),
+            "running": sum(1 for job in self._jobs.values() if job.status == ExportStatus.RUNNING),
+            "completed": self._completed,
+            "failed": self._failed,
+            "rows_exported": self._rows_exported,
+            "bytes_exported": self._bytes_exported
+        }
+
+
+# 全局导出管理器实例
+_result_exporter: Optional[ResultExporter] = None
+
+
+def get_result_exporter() -> ResultExporter:
+    """获取导出管理器实例"""
+    global _result_exporter
+    
+    if _result_exporter is None:
+        settings = get_settings()
+        _result_exporter = ResultExporter(
+            base_dir=settings.EXPORT_DIR,
+            max_rows=settings.EXPORT_MAX_ROWS,
+            batch_size=settings.EXPORT_BATCH_SIZE,
+            max_concurrent=settings.EXPORT_MAX_CONCURRENT,
+            file_ttl=settings.EXPORT_FILE_TTL
+        )
+    
+    return _result_exporter
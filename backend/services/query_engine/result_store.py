@@ -0,0 +1,246 @@
+"""
+查询结果落盘存储
+超过大小阈值的查询结果按任务写入本地Parquet文件，分页时按行组读取，不在内存中保留完整结果
+"""
+import asyncio
+import copy
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 未安装pyarrow时不落盘，结果保留在内存中
+    pa = None
+    pq = None
+
+from .base_engine import QueryResult, arrow_table_to_rows
+from .result_cache import estimate_result_size
+from utils.logger import get_logger
+from config.settings import get_settings
+
+logger = get_logger(__name__)
+
+
+class ResultStore:
+    """
+    查询结果落盘存储
+    
+    每个任务一个Parquet文件，按固定行数划分行组；
+    读取分页时根据文件元数据只解码覆盖该页的行组
+    """
+    
+    def __init__(
+        self,
+        base_dir: str,
+        spill_threshold_bytes: int = 16 * 1024 * 1024,
+        row_group_size: int = 10000,
+        max_workers: int = 2
+    ):
+        self.base_dir = Path(base_dir)
+        self.spill_threshold_bytes = spill_threshold_bytes
+        self.row_group_size = row_group_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="result-store")
+        # {task_id: 文件路径}
+        self._files: Dict[str, str] = {}
+        
+        # 统计信息
+        self._spilled = 0
+        self._spilled_bytes = 0
+        self._pages_served = 0
+    
+    @property
+    def enabled(self) -> bool:
+        """是否可以落盘（需要pyarrow）"""
+        return pq is not None
+    
+    def should_spill(self, result: QueryResult) -> bool:
+        """结果是否超过落盘阈值"""
+        if not self.enabled or result.is_spilled or result.row_count == 0:
+            return False
+        return estimate_result_size(result) > self.spill_threshold_bytes
+    
+    async def spill(self, task_id: str, result: QueryResult) -> Optional[QueryResult]:
+        """
+        将超过阈值的结果写入Parquet文件
+        
+        Args:
+            task_id: 任务ID
+            result: 查询结果
+        
+        Returns:
+            从文件读取行数据的结果副本，未落盘返回None
+        """
+        if not self.should_spill(result):
+            return None
+        
+        try:
+            loop = asyncio.get_running_loop()
+            path = await loop.run_in_executor(
+                self._executor, self._write_parquet, task_id, result.columns, result._rows, result.arrow_table
+            )
+        except Exception as e:
+            logger.warning(f"查询结果落盘失败，保留在内存中: {task_id}, 错误: {e}")
+            return None
+        
+        self._files[task_id] = path
+        self._spilled += 1
+        self._spilled_bytes += os.path.getsize(path)
+        logger.info(f"查询结果已落盘: {task_id}，{result.row_count} 行")
+        
+        # 返回副本，不影响结果缓存等仍持有原结果的地方
+        spilled = copy.copy(result)
+        spilled.metadata = dict(result.metadata)
+        spilled.attach_spill(path, self)
+        return spilled
+    
+    def _write_parquet(
+        self,
+        task_id: str,
+        columns: List[str],
+        rows: Optional[List[List[Any]]],
+        arrow_table: Optional[Any]
+    ) -> str:
+        """写入Parquet文件（工作线程中调用）"""
+        if arrow_table is None:
+            arrow_table = pa.Table.from_arrays(
+                [pa.array(list(values)) for values in zip(*rows)],
+                names=columns
+            )
+        
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        path = self.base_dir / f"{task_id}.parquet"
+        tmp_path = self.base_dir / f"{task_id}.parquet.tmp"
+        
+        pq.write_table(arrow_table, tmp_path, row_group_size=self.row_group_size)
+        os.replace(tmp_path, path)
+        return str(path)
+    
+    def has_result(self, task_id: str) -> bool:
+        """任务结果是否已落盘"""
+        return task_id in self._files
+    
+    async def read_page(self, task_id: str, offset: int, limit: int) -> List[List[Any]]:
+        """
+        读取已落盘任务结果的指定区间
+        
+        Args:
+            task_id: 任务ID
+            offset: 起始行
+            limit: 行数
+        """
+        path = self._files.get(task_id)
+        if path is None:
+            return []
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.read_rows, path, offset, limit)
+    
+    def read_rows(self, path: str, offset: int = 0, limit: Optional[int] = None) -> List[List[Any]]:
+        """按行组读取Parquet文件的指定区间"""
+        parquet_file = pq.ParquetFile(path)
+        metadata = parquet_file.metadata
+        total_rows = metadata.num_rows
+        
+        if limit is None:
+            limit = total_rows - offset
+        end = min(offset + limit, total_rows)
+        if offset >= end:
+            return []
+        
+        # 定位覆盖 [offset, end) 的行组
+        row_groups = []
+        first_row = None
+        group_start = 0
+        for index in range(metadata.num_row_groups):
+            group_rows = metadata.row_group(index).num_rows
+            group_end = group_start + group_rows
+            if group_end > offset and group_start < end:
+                if first_row is None:
+                    first_row = group_start
+                row_groups.append(index)
+            group_start = group_end
+        
+        table = parquet_file.read_row_groups(row_groups)
+        self._pages_served += 1
+        return arrow_table_to_rows(table, offset - first_row, end - offset)
+    
+    def delete(self, task_id: str) -> bool:
+        """删除任务的落盘结果"""
+        path = self._files.pop(task_id, None)
+        if path is None:
+            return False
+        
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"删除落盘结果失败: {path}, 错误: {e}")
+            return False
+    
+    def cleanup(self, max_age_hours: int = 24) -> int:
+        """
+        删除超过保留时间的结果文件（包括进程重启后遗留的文件）
+        
+        Returns:
+            删除的文件数
+        """
+        if not self.base_dir.exists():
+            return 0
+        
+        expire_before = time.time() - max_age_hours * 3600
+        removed = 0
+        
+        for path in self.base_dir.glob("*.parquet*"):
+            try:
+                if path.stat().st_mtime < expire_before:
+                    path.unlink()
+                    self._files.pop(path.name.split(".")[0], None)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.warning(f"清理落盘结果失败: {path}, 错误: {e}")
+        
+        if removed:
+            logger.info(f"清理了 {removed} 个过期的落盘结果")
+        return removed
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取落盘存储统计信息"""
+        return {
+            "enabled": self.enabled,
+            "files": len(self._files),
+            "spilled": self._spilled,
+            "spilled_bytes": self._spilled_bytes,
+            "pages_served": self._pages_served,
+            "spill_threshold_bytes": self.spill_threshold_bytes
+        }
+    
+    def shutdown(self):
+        """关闭读写线程池"""
+        self._executor.shutdown(wait=True)
+
+
+# 全局结果存储实例
+_result_store: Optional[ResultStore] = None
+
+
+def get_result_store() -> ResultStore:
+    """获取结果存储实例"""
+    global _result_store
+    
+    if _result_store is None:
+        settings = get_settings()
+        _result_store = ResultStore(
+            base_dir=settings.RESULT_STORE_DIR,
+            spill_threshold_bytes=settings.RESULT_SPILL_THRESHOLD_BYTES,
+            row_group_size=settings.RESULT_SPILL_ROW_GROUP_SIZE
+        )
+    
+    return _result_store
@@ -0,0 +1,952 @@
+"""
+预聚合表（Rollup）
+从查询历史中挖掘高频的单表 GROUP BY 查询形态，在DuckDB中建立预聚合表；
+匹配的查询透明改写为读取预聚合表，基表只有追加时增量合并，其他变更时整体重建
+"""
+import asyncio
+import hashlib
+import json
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple, Set, Iterable, Callable
+
+from .result_cache import normalize_sql
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 预聚合表所在的schema，不会出现在模式目录中
+ROLLUP_SCHEMA = "taosha_rollup"
+_DEFINITIONS_TABLE = f"{ROLLUP_SCHEMA}.rollup_definitions"
+
+# 可由预聚合表回答的聚合函数
+_AGGREGATES = {"sum", "count", "min", "max", "avg"}
+# 预聚合表中度量的再聚合方式
+_REAGGREGATE = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}
+# 预聚合表行数超过基表的该比例时收益不足，不保留
+_MAX_ROLLUP_RATIO = 0.5
+
+# SQL词元：字符串、带引号标识符、数字、单词、多字符运算符、其他单字符
+_TOKEN_PATTERN = re.compile(
+    r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|\w+|<=|>=|<>|!=|\|\||::|\S"
+)
+_IDENTIFIER_PATTERN = re.compile(r"^[a-z_]\w*$")
+# 单表聚合查询的整体结构
+_QUERY_PATTERN = re.compile(
+    r"^SELECT\s+(?P<select>.+?)\s+FROM\s+(?P<table>[\w.]+)"
+    r"(?:\s+(?:AS\s+)?(?!(?:WHERE|GROUP)\b)(?P<alias>\w+))?"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"\s+GROUP\s+BY\s+(?P<group>.+?)"
+    r"(?:\s+HAVING\s+(?P<having>.+?))?"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>.+?))?"
+    r"(?:\s+LIMIT\s+(?P<limit>\d+))?$",
+    re.IGNORECASE | re.DOTALL
+)
+# 含这些结构的查询不做改写
+_UNSUPPORTED_PATTERN = re.compile(
+    r"\b(?:JOIN|UNION|INTERSECT|EXCEPT|WITH|DISTINCT|OVER|QUALIFY|ROLLUP|CUBE|GROUPING|TABLESAMPLE|SAMPLE)\b"
+    r"|\(\s*SELECT\b|\$|\?",
+    re.IGNORECASE
+)
+# 跟在表达式后面但不是别名的关键字
+_NOT_ALIAS = {"end", "asc", "desc", "null", "true", "false", "and", "or", "not", "is"}
+
+
+def _tokenize(text: str, qualifiers: Set[str]) -> List[str]:
+    """规范化为词元列表：标识符和关键字小写，去掉表名或别名限定，字符串字面量保持不变"""
+    tokens: List[str] = []
+    for token in _TOKEN_PATTERN.findall(text):
+        if token[0] in ('"', "`") and re.fullmatch(r"[\"`]\w+[\"`]", token):
+            token = token[1:-1].lower()
+        elif token[0] not in ("'", '"', "`"):
+            token = token.lower()
+        
+        if token == "." and tokens and tokens[-1] in qualifiers:
+            tokens.pop()
+            continue
+        tokens.append(token)
+    return tokens
+
+
+def _join(tokens: List[str]) -> str:
+    """词元拼接为SQL文本"""
+    return " ".join(tokens)
+
+
+def _split_top_level(tokens: List[str]) -> List[List[str]]:
+    """按最外层逗号拆分词元列表"""
+    items: List[List[str]] = [[]]
+    depth = 0
+    for token in tokens:
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        if token == "," and depth == 0:
+            items.append([])
+        else:
+            items[-1].append(token)
+    return [item for item in items if item]
+
+
+def _strip_alias(tokens: List[str]) -> List[str]:
+    """去掉选择项末尾的别名"""
+    if len(tokens) >= 3 and tokens[-2] == "as":
+        return tokens[:-2]
+    if len(tokens) >= 2:
+        last, previous = tokens[-1], tokens[-2]
+        last_is_name = bool(_IDENTIFIER_PATTERN.match(last)) or last[0] in ('"', "`")
+        previous_ends_expr = (
+            previous == ")" or previous[0] in ("'", '"', "`") or bool(re.match(r"^\w+$", previous))
+        )
+        if last_is_name and last not in _NOT_ALIAS and previous_ends_expr and previous not in _NOT_ALIAS:
+            return tokens[:-1]
+    return tokens
+
+
+def _matching_paren(tokens: List[str], start: int) -> int:
+    """返回与 start 处左括号匹配的右括号位置，不匹配时返回-1"""
+    depth = 0
+    for index in range(start, len(tokens)):
+        if tokens[index] == "(":
+            depth += 1
+        elif tokens[index] == ")":
+            depth -= 1
+            if depth == 0:
+                return index
+    return -1
+
+
+def _find_aggregates(tokens: List[str]) -> Optional[List[Tuple[int, int, Tuple[str, str]]]]:
+    """
+    查找聚合函数调用
+    
+    Returns:
+        [(起始位置, 结束位置, (函数名, 参数))]，存在嵌套聚合或括号不匹配时返回None
+    """
+    aggregates = []
+    index = 0
+    while index < len(tokens):
+        if tokens[index] in _AGGREGATES and index + 1 < len(tokens) and tokens[index + 1] == "(":
+            end = _matching_paren(tokens, index + 1)
+            if end < 0:
+                return None
+            inner = tokens[index + 2:end]
+            if not inner or any(
+                token in _AGGREGATES and position + 1 < len(inner) and inner[position + 1] == "("
+                for position, token in enumerate(inner)
+            ):
+                return None
+            argument = _join(inner)
+            if tokens[index] == "count" and argument in ("*", "1"):
+                argument = "*"
+            aggregates.append((index, end, (tokens[index], argument)))
+            index = end + 1
+        else:
+            index += 1
+    return aggregates
+
+
+def _identifiers(tokens: List[str]) -> Set[str]:
+    """词元中作为列名出现的标识符（排除函数名）"""
+    return {
+        token for index, token in enumerate(tokens)
+        if _IDENTIFIER_PATTERN.match(token) and (index + 1 >= len(tokens) or tokens[index + 1] != "(")
+    }
+
+
+class AggregateQuery:
+    """解析后的单表聚合查询"""
+    
+    def __init__(self, table: str):
+        self.table = table
+        # 选择项（已去掉别名的词元）
+        self.select_items: List[List[str]] = []
+        self.where: List[str] = []
+        # GROUP BY 项，None 表示 GROUP BY ALL
+        self.group_items: Optional[List[List[str]]] = None
+        self.having: List[str] = []
+        self.order: List[str] = []
+        self.limit: Optional[int] = None
+        # 维度表达式（规范化文本）
+        self.dimensions: List[str] = []
+        # 聚合度量 {(函数名, 参数)}
+        self.measures: Set[Tuple[str, str]] = set()
+    
+    @property
+    def filter_columns(self) -> Set[str]:
+        """WHERE 条件中引用的标识符"""
+        return _identifiers(self.where)
+
+
+def parse_aggregate_query(sql: str) -> Optional[AggregateQuery]:
+    """
+    解析单表 GROUP BY 聚合查询
+    
+    Returns:
+        解析结果，多表、子查询、窗口函数等不支持改写的查询返回None
+    """
+    sql = normalize_sql(sql)
+    if _UNSUPPORTED_PATTERN.search(sql):
+        return None
+    
+    match = _QUERY_PATTERN.match(sql)
+    if not match:
+        return None
+    
+    table = match.group("table").lower()
+    if table.startswith("main."):
+        table = table[len("main."):]
+    if "." in table:
+        return None
+    
+    qualifiers = {table}
+    if match.group("alias"):
+        qualifiers.add(match.group("alias").lower())
+    
+    query = AggregateQuery(table)
+    query.select_items = [_strip_alias(item) for item in _split_top_level(_tokenize(match.group("select"), qualifiers))]
+    query.where = _tokenize(match.group("where") or "", qualifiers)
+    query.having = _tokenize(match.group("having") or "", qualifiers)
+    query.order = _tokenize(match.group("order") or "", qualifiers)
+    if match.group("limit"):
+        query.limit = int(match.group("limit"))
+    
+    # 度量：选择项、HAVING、ORDER BY 中的聚合函数
+    plain_items = []
+    for index, tokens in enumerate(query.select_items + [query.having, query.order]):
+        aggregates = _find_aggregates(tokens)
+        if aggregates is None:
+            return None
+        query.measures.update(measure for _, _, measure in aggregates)
+        if index < len(query.select_items) and not aggregates:
+            plain_items.append(tokens)
+    if not query.measures:
+        return None
+    
+    # 维度：GROUP BY 项，支持序号、选择项别名和 ALL
+    group_tokens = _tokenize(match.group("group"), qualifiers)
+    if group_tokens == ["all"]:
+        dimension_items = plain_items
+    else:
+        query.group_items = []
+        aliases = _select_aliases(match.group("select"), qualifiers)
+        for item in _split_top_level(group_tokens):
+            if len(item) == 1 and item[0].isdigit():
+                position = int(item[0]) - 1
+                if not 0 <= position < len(query.select_items):
+                    return None
+                item = query.select_items[position]
+            elif len(item) == 1 and item[0] in aliases:
+                item = aliases[item[0]]
+            query.group_items.append(item)
+        dimension_items = query.group_items
+    
+    query.dimensions = sorted({_join(item) for item in dimension_items})
+    if any(_find_aggregates(item) for item in dimension_items):
+        return None
+    # 非聚合选择项必须是维度
+    if any(_join(item) not in query.dimensions for item in plain_items):
+        return None
+    return query
+
+
+def _select_aliases(select_text: str, qualifiers: Set[str]) -> Dict[str, List[str]]:
+    """选择项别名到表达式词元的映射"""
+    aliases = {}
+    for item in _split_top_level(_tokenize(select_text, qualifiers)):
+        expression = _strip_alias(item)
+        if len(expression) < len(item):
+            aliases[item[-1].strip('"`').lower()] = expression
+    return aliases
+
+
+class RollupDefinition:
+    """预聚合表定义及其刷新状态"""
+    
+    def __init__(self, base_table: str, dimensions: Iterable[str], measures: Iterable[Tuple[str, str]]):
+        self.base_table = base_table
+        self.dimensions = sorted(set(dimensions))
+        
+        # AVG 拆分为 SUM 和 COUNT 存储
+        expanded: Set[Tuple[str, str]] = set()
+        for func, argument in measures:
+            if func == "avg":
+                expanded.update({("sum", argument), ("count", argument)})
+            else:
+                expanded.add((func, argument))
+        self.measures = sorted(expanded)
+        
+        digest = hashlib.sha256(
+            json.dumps([base_table, self.dimensions, self.measures]).encode("utf-8")
+        ).hexdigest()[:10]
+        self.name = f"{base_table}_{digest}"
+        
+        # 简单列名维度保留列名，表达式维度使用 d_N
+        self.dimension_columns = {
+            dimension: dimension if _IDENTIFIER_PATTERN.match(dimension) else f"d_{index}"
+            for index, dimension in enumerate(self.dimensions)
+        }
+        self.measure_columns = {measure: f"m_{index}" for index, measure in enumerate(self.measures)}
+        
+        # 刷新状态：已聚合到的最大rowid、当时的基表行数、水位以内相关列的内容校验和
+        self.watermark: Optional[int] = None
+        self.base_row_count: Optional[int] = None
+        self.checksum: Optional[int] = None
+        self.row_count = 0
+        self.built_at = 0.0
+        self.refreshed_at = 0.0
+        self.verified_at = 0.0
+        # 基表发生非追加变更，等待整体重建
+        self.stale = False
+        self.hits = 0
+    
+    @property
+    def qualified_name(self) -> str:
+        return f'{ROLLUP_SCHEMA}."{self.name}"'
+    
+    def aggregate_sql(self, lower: Optional[int], upper: int) -> str:
+        """聚合基表中 rowid 在 (lower, upper] 范围内的行"""
+        columns = [f'{dimension} AS "{column}"' for dimension, column in self.dimension_columns.items()]
+        columns += [
+            f'{func}({argument}) AS "{self.measure_columns[(func, argument)]}"'
+            for func, argument in self.measures
+        ]
+        condition = f"rowid <= {int(upper)}"
+        if lower is not None:
+            condition = f"rowid > {int(lower)} AND {condition}"
+        return f"SELECT {', '.join(columns)} FROM {self.base_table} WHERE {condition} GROUP BY ALL"
+    
+    def checksum_sql(self, lower: Optional[int], upper: int) -> str:
+        """
+        基表中 rowid 在 (lower, upper] 范围内的行数和相关列内容校验和
+        
+        校验和为各行维度和度量参数哈希值之和：原地UPDATE、删除后再插入等行数和
+        最大rowid都不变的修改也会改变校验和；求和可加，增量合并时直接累加
+        """
+        columns = list(self.dimensions) + sorted({argument for _, argument in self.measures if argument != "*"})
+        row_hash = f"hash({', '.join(columns)})" if columns else "hash(rowid)"
+        condition = f"rowid <= {int(upper)}"
+        if lower is not None:
+            condition = f"rowid > {int(lower)} AND {condition}"
+        return f"SELECT count(*), sum({row_hash}::HUGEINT) FROM {self.base_table} WHERE {condition}"
+    
+    def merge_sql(self, delta_sql: str) -> str:
+        """将增量聚合结果与现有预聚合表合并"""
+        columns = [f'"{column}"' for column in self.dimension_columns.values()]
+        columns += [
+            f'{_REAGGREGATE[func]}("{column}") AS "{column}"'
+            for (func, _), column in self.measure_columns.items()
+        ]
+        return (
+            f"SELECT {', '.join(columns)} FROM "
+            f"(SELECT * FROM {self.qualified_name} UNION ALL BY NAME ({delta_sql})) GROUP BY ALL"
+        )
+    
+    def covers(self, query: AggregateQuery) -> bool:
+        """维度和度量是否足以回答该查询"""
+        if query.table != self.base_table or not set(query.dimensions) <= set(self.dimensions):
+            return False
+        for func, argument in query.measures:
+            if func == "avg":
+                if ("sum", argument) not in self.measure_columns or ("count", argument) not in self.measure_columns:
+                    return False
+            elif (func, argument) not in self.measure_columns:
+                return False
+        return True
+    
+    def _reaggregate(self, func: str, argument: str) -> List[str]:
+        """原查询中的聚合函数在预聚合表上的等价表达式"""
+        if func == "avg":
+            total = self.measure_columns[("sum", argument)]
+            count = self.measure_columns[("count", argument)]
+            return ["(", "sum", "(", total, ")", "/", "sum", "(", count, ")", ")"]
+        column = self.measure_columns[(func, argument)]
+        if func == "count":
+            return ["cast", "(", "sum", "(", column, ")", "as", "bigint", ")"]
+        return [_REAGGREGATE[func], "(", column, ")"]
+    
+    def rewrite_tokens(self, tokens: List[str]) -> List[str]:
+        """替换词元中的聚合函数和维度表达式"""
+        aggregates = {start: (end, measure) for start, end, measure in _find_aggregates(tokens) or []}
+        dimension_tokens = sorted(
+            ((dimension.split(" "), column) for dimension, column in self.dimension_columns.items()),
+            key=lambda item: -len(item[0])
+        )
+        
+        output: List[str] = []
+        index = 0
+        while index < len(tokens):
+            if index in aggregates:
+                end, (func, argument) = aggregates[index]
+                output.extend(self._reaggregate(func, argument))
+                index = end + 1
+                continue
+            following = tokens[index + 1] if index + 1 < len(tokens) else ""
+            for dimension, column in dimension_tokens:
+                # 同名的函数调用和类型字面量（如 date '2024-01-01'）不是维度列
+                if len(dimension) == 1 and (following == "(" or following.startswith("'")):
+                    continue
+                if tokens[index:index + len(dimension)] == dimension:
+                    output.append(f'"{column}"')
+                    index += len(dimension)
+                    break
+            else:
+                output.append(tokens[index])
+                index += 1
+        return output
+    
+    def to_row(self) -> List[Any]:
+        """持久化到定义表的行"""
+        return [
+            self.name, self.base_table, json.dumps(self.dimensions, ensure_ascii=False),
+            json.dumps(self.measures, ensure_ascii=False), self.watermark, self.base_row_count,
+            self.row_count, self.built_at, self.refreshed_at,
+            str(self.checksum) if self.checksum is not None else None
+        ]
+    
+    @classmethod
+    def from_row(cls, row: Tuple[Any, ...]) -> "RollupDefinition":
+        """从定义表的行恢复"""
+        rollup = cls(row[1], json.loads(row[2]), [tuple(measure) for measure in json.loads(row[3])])
+        rollup.watermark, rollup.base_row_count, rollup.row_count = row[4], row[5], row[6] or 0
+        rollup.built_at, rollup.refreshed_at = row[7] or 0.0, row[8] or 0.0
+        # 没有校验和的旧定义无法确认内容未变，加载后先整体重建
+        if len(row) > 9 and row[9] is not None:
+            rollup.checksum = int(row[9])
+        else:
+            rollup.stale = True
+        return rollup
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "base_table": self.base_table,
+            "dimensions": self.dimensions,
+            "measures": [f"{func}({argument})" for func, argument in self.measures],
+            "row_count": self.row_count,
+            "base_row_count": self.base_row_count,
+            "refreshed_at": self.refreshed_at,
+            "stale": self.stale,
+            "hits": self.hits
+        }
+
+
+def rewrite_query(
+    query: AggregateQuery,
+    rollup: RollupDefinition,
+    base_columns: Set[str],
+    output_names: List[str]
+) -> Optional[str]:
+    """
+    将聚合查询改写为读取预聚合表
+    
+    Args:
+        query: 解析后的查询
+        rollup: 预聚合表定义
+        base_columns: 基表列名（小写），改写后不允许残留非维度的基表列
+        output_names: 原查询的结果列名，改写后保持一致
+    
+    Returns:
+        改写后的SQL，无法改写时返回None
+    """
+    if not rollup.covers(query) or len(output_names) != len(query.select_items):
+        return None
+    
+    select = [rollup.rewrite_tokens(item) for item in query.select_items]
+    parts = [
+        "SELECT " + ", ".join(
+            f'{_join(tokens)} AS "{name.replace(chr(34), chr(34) * 2)}"'
+            for tokens, name in zip(select, output_names)
+        ),
+        f"FROM {rollup.qualified_name}"
+    ]
+    rewritten = list(select)
+    
+    if query.where:
+        where = rollup.rewrite_tokens(query.where)
+        rewritten.append(where)
+        parts.append(f"WHERE {_join(where)}")
+    if query.group_items is None:
+        parts.append("GROUP BY ALL")
+    else:
+        group = [rollup.rewrite_tokens(item) for item in query.group_items]
+        rewritten.extend(group)
+        parts.append("GROUP BY " + ", ".join(_join(tokens) for tokens in group))
+    if query.having:
+        having = rollup.rewrite_tokens(query.having)
+        rewritten.append(having)
+        parts.append(f"HAVING {_join(having)}")
+    if query.order:
+        order = rollup.rewrite_tokens(query.order)
+        rewritten.append(order)
+        parts.append(f"ORDER BY {_join(order)}")
+    if query.limit is not None:
+        parts.append(f"LIMIT {query.limit}")
+    
+    # 残留的基表列必须是预聚合表中的同名维度列
+    allowed = {column for column in rollup.dimension_columns.values()}
+    for tokens in rewritten:
+        if (_identifiers(tokens) & base_columns) - allowed:
+            return None
+    return " ".join(parts)
+
+
+def mine_rollups(
+    statements: Iterable[Tuple[str, int]],
+    table_columns: Callable[[str], Set[str]],
+    min_frequency: int = 5,
+    max_rollups: int = 20,
+    max_dimensions: int = 6
+) -> List[RollupDefinition]:
+    """
+    从历史SQL中挖掘高频聚合形态
+    
+    同一张表的形态按频次从高到低贪心合并，合并后的维度数不超过上限
+    
+    Args:
+        statements: [(SQL, 权重)]
+        table_columns: 根据表名返回列名集合（小写）的函数，表不存在时返回空集合
+    
+    Returns:
+        按频次从高到低排列的预聚合表定义
+    """
+    shapes: Dict[Tuple[str, frozenset], List[Any]] = {}
+    for sql, weight in statements:
+        query = parse_aggregate_query(sql)
+        if query is None:
+            continue
+        columns = table_columns(query.table)
+        if not columns:
+            continue
+        # WHERE 条件中的列作为维度，过滤可在预聚合表上完成
+        dimensions = frozenset(set(query.dimensions) | (query.filter_columns & columns))
+        if len(dimensions) > max_dimensions:
+            continue
+        shape = shapes.setdefault((query.table, dimensions), [0, set()])
+        shape[0] += max(int(weight or 1), 1)
+        shape[1].update(query.measures)
+    
+    # [表名, 维度, 度量, 频次]
+    candidates: List[List[Any]] = []
+    for (table, dimensions), (frequency, measures) in sorted(shapes.items(), key=lambda item: -item[1][0]):
+        best = None
+        for candidate in candidates:
+            if candidate[0] != table:
+                continue
+            merged = candidate[1] | dimensions
+            if len(merged) > max_dimensions:
+                continue
+            growth = len(merged) - len(candidate[1])
+            if best is None or growth < best[0]:
+                best = (growth, candidate)
+        if best is not None:
+            candidate = best[1]
+            candidate[1] = candidate[1] | dimensions
+            candidate[2] = candidate[2] | measures
+            candidate[3] += frequency
+        else:
+            candidates.append([table, dimensions, set(measures), frequency])
+    
+    candidates = [candidate for candidate in candidates if candidate[3] >= min_frequency]
+    candidates.sort(key=lambda candidate: -candidate[3])
+    return [
+        RollupDefinition(table, dimensions, measures)
+        for table, dimensions, measures, _ in candidates[:max_rollups]
+    ]
+
+
+async def load_history_statements(session: Any, since: datetime) -> List[Tuple[str, int]]:
+    """
+    从任务表和查询历史中读取成功执行的SQL
+    
+    历史记录的访问次数作为权重，与任务表重复的记录只计额外的访问次数
+    """
+    from sqlalchemy import select
+    from models.nlquery_models import NlqueryTask, NlqueryHistory, TaskStatusEnum
+    
+    tasks = await session.execute(
+        select(NlqueryTask.task_id, NlqueryTask.final_sql).where(
+            NlqueryTask.task_status == TaskStatusEnum.SUCCESS,
+            NlqueryTask.final_sql.isnot(None),
+            NlqueryTask.created_at >= since
+        )
+    )
+    statements: List[Tuple[str, int]] = []
+    task_ids = set()
+    for task_id, sql in tasks.all():
+        task_ids.add(task_id)
+        statements.append((sql, 1))
+    
+    history = await session.execute(
+        select(NlqueryHistory.task_id, NlqueryHistory.generated_sql, NlqueryHistory.access_count).where(
+            NlqueryHistory.task_status == TaskStatusEnum.SUCCESS,
+            NlqueryHistory.generated_sql.isnot(None),
+            NlqueryHistory.last_accessed_at >= since
+        )
+    )
+    for task_id, sql, access_count in history.all():
+        weight = (access_count or 1) - (1 if task_id in task_ids else 0)
+        if weight > 0:
+            statements.append((sql, weight))
+    return statements
+
+
+class RollupManager:
+    """DuckDB预聚合表管理器：挖掘、建表、刷新和查询改写"""
+    
+    def __init__(
+        self,
+        engine: Any,
+        min_frequency: int = 5,
+        max_rollups: int = 20,
+        max_dimensions: int = 6,
+        min_base_rows: int = 100000,
+        history_days: int = 30,
+        mine_interval: int = 3600,
+        refresh_interval: int = 60,
+        full_rebuild_interval: int = 86400,
+        verify_interval: int = 0
+    ):
+        self.engine = engine
+        self.min_frequency = min_frequency
+        self.max_rollups = max_rollups
+        self.max_dimensions = max_dimensions
+        self.min_base_rows = min_base_rows
+        self.history_days = history_days
+        self.mine_interval = mine_interval
+        self.refresh_interval = refresh_interval
+        self.full_rebuild_interval = full_rebuild_interval
+        # 查询改写前校验基表内容的最小间隔（秒），0表示每次改写都校验
+        self.verify_interval = verify_interval
+        
+        self._rollups: Dict[str, RollupDefinition] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._last_mined = 0.0
+        
+        # 统计信息
+        self._rewrites = 0
+        self._builds = 0
+        self._incremental_refreshes = 0
+        self._full_rebuilds = 0
+        self._refresh_errors = 0
+        self._changes_detected = 0
+    
+    async def start(self):
+        """创建schema和定义表，加载已有预聚合表并启动后台维护"""
+        rows = await self.engine.executor.run_with_cursor(self._load_definitions)
+        for row in rows:
+            rollup = RollupDefinition.from_row(row)
+            self._rollups[rollup.name] = rollup
+        if self._rollups:
+            logger.info(f"已加载 {len(self._rollups)} 个预聚合表")
+        self._task = asyncio.create_task(self._maintenance_loop())
+    
+    async def close(self):
+        """停止后台维护"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    @staticmethod
+    def _load_definitions(cursor) -> List[Tuple[Any, ...]]:
+        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {ROLLUP_SCHEMA}")
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {_DEFINITIONS_TABLE} (
+                name VARCHAR PRIMARY KEY,
+                base_table VARCHAR,
+                dimensions VARCHAR,
+                measures VARCHAR,
+                watermark BIGINT,
+                base_row_count BIGINT,
+                row_count BIGINT,
+                built_at DOUBLE,
+                refreshed_at DOUBLE,
+                checksum VARCHAR
+            )
+        """)
+        cursor.execute(f"ALTER TABLE {_DEFINITIONS_TABLE} ADD COLUMN IF NOT EXISTS checksum VARCHAR")
+        return cursor.execute(f"SELECT * FROM {_DEFINITIONS_TABLE}").fetchall()
+    
+    async def _base_columns(self, table: str) -> Set[str]:
+        """基表列名（小写）"""
+        await self.engine.schema_catalog.refresh(self.engine)
+        return {column["column_name"].lower() for column in self.engine.schema_catalog.get_columns(table)}
+    
+    async def rewrite(self, sql: str) -> Tuple[str, Optional[str]]:
+        """
+        尝试将查询改写为读取预聚合表
+        
+        Returns:
+            (执行的SQL, 使用的预聚合表名)，不能改写时返回原SQL和None
+        """
+        if not self._rollups:
+            return sql, None
+        
+        query = parse_aggregate_query(sql)
+        if query is None:
+            return sql, None
+        
+        candidates = sorted(
+            (rollup for rollup in self._rollups.values() if not rollup.stale and rollup.covers(query)),
+            key=lambda rollup: rollup.row_count
+        )
+        if not candidates:
+            return sql, None
+        
+        base_columns = await self._base_columns(query.table)
+        output_names = await self.engine.executor.run_with_cursor(self._describe, sql)
+        for rollup in candidates:
+            rewritten = rewrite_query(query, rollup, base_columns, output_names)
+            if rewritten is None or not await self._ensure_fresh(rollup):
+                continue
+            rollup.hits += 1
+            self._rewrites += 1
+            return rewritten, rollup.name
+        return sql, None
+    
+    @staticmethod
+    def _describe(cursor, sql: str) -> List[str]:
+        """查询结果列名（只绑定不执行）"""
+        return [row[0] for row in cursor.execute(f"DESCRIBE {sql}").fetchall()]
+    
+    async def _ensure_fresh(self, rollup: RollupDefinition) -> bool:
+        """基表有追加时先增量合并，检测到非追加变更时放弃使用该预聚合表"""
+        async with self._lock:
+            if rollup.stale or rollup.name not in self._rollups:
+                return False
+            verify = time.time() - rollup.verified_at >= self.verify_interval
+            try:
+                await self.engine.executor.run_with_cursor(self._refresh_sync, rollup, False, verify)
+            except Exception as e:
+                self._refresh_errors += 1
+                logger.warning(f"预聚合表 {rollup.name} 刷新失败: {e}")
+                return False
+            return not rollup.stale
+    
+    def _refresh_sync(self, cursor, rollup: RollupDefinition, full: bool, verify: bool = True) -> str:
+        """
+        刷新预聚合表（在执行线程中运行）
+        
+        Args:
+            full: 是否整体重建；否则只在基表仅有追加时增量合并，其他变更标记为待重建
+            verify: 是否校验水位以内的内容；否则只比较行数和最大rowid
+        
+        Returns:
+            unchanged / incremental / full / stale
+        """
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            count, max_rowid = cursor.execute(f"SELECT count(*), max(rowid) FROM {rollup.base_table}").fetchone()
+            max_rowid = -1 if max_rowid is None else max_rowid
+            
+            if not full:
+                if rollup.watermark is None or rollup.checksum is None:
+                    cursor.execute("ROLLBACK")
+                    rollup.stale = True
+                    return "stale"
+                
+                # 水位以内的行数和内容校验和都不变才说明只有追加
+                if verify:
+                    retained = cursor.execute(rollup.checksum_sql(None, rollup.watermark)).fetchone()
+                    if (retained[0], retained[1] or 0) != (rollup.base_row_count, rollup.checksum):
+                        cursor.execute("ROLLBACK")
+                        rollup.stale = True
+                        self._changes_detected += 1
+                        logger.info(f"预聚合表 {rollup.name} 的基表存在非追加变更，等待整体重建")
+                        return "stale"
+                    rollup.verified_at = time.time()
+                elif count != rollup.base_row_count and max_rowid == rollup.watermark:
+                    cursor.execute("ROLLBACK")
+                    rollup.stale = True
+                    return "stale"
+                
+                if (count, max_rowid) == (rollup.base_row_count, rollup.watermark):
+                    cursor.execute("ROLLBACK")
+                    return "unchanged"
+                
+                delta = cursor.execute(rollup.checksum_sql(rollup.watermark, max_rowid)).fetchone()
+                if rollup.base_row_count + delta[0] != count:
+                    cursor.execute("ROLLBACK")
+                    rollup.stale = True
+                    return "stale"
+                checksum = rollup.checksum + (delta[1] or 0)
+                
+                staging = f'{ROLLUP_SCHEMA}."{rollup.name}__staging"'
+                cursor.execute(
+                    f"CREATE OR REPLACE TABLE {staging} AS "
+                    f"{rollup.merge_sql(rollup.aggregate_sql(rollup.watermark, max_rowid))}"
+                )
+                cursor.execute(f"DROP TABLE {rollup.qualified_name}")
+                cursor.execute(f'ALTER TABLE {staging} RENAME TO "{rollup.name}"')
+                result = "incremental"
+            else:
+                cursor.execute(
+                    f"CREATE OR REPLACE TABLE {rollup.qualified_name} AS {rollup.aggregate_sql(None, max_rowid)}"
+                )
+                checksum = cursor.execute(rollup.checksum_sql(None, max_rowid)).fetchone()[1] or 0
+                result = "full"
+            
+            row_count = cursor.execute(f"SELECT count(*) FROM {rollup.qualified_name}").fetchone()[0]
+            now = time.time()
+            rollup.watermark, rollup.base_row_count, rollup.row_count = max_rowid, count, row_count
+            rollup.checksum = checksum
+            rollup.refreshed_at = now
+            if full:
+                rollup.built_at = now
+                rollup.verified_at = now
+            cursor.execute(
+                f"INSERT OR REPLACE INTO {_DEFINITIONS_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rollup.to_row()
+            )
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        
+        rollup.stale = False
+        if full:
+            self._full_rebuilds += 1
+        else:
+            self._incremental_refreshes += 1
+        return result
+    
+    def _drop_sync(self, cursor, rollup: RollupDefinition):
+        cursor.execute(f"DROP TABLE IF EXISTS {rollup.qualified_name}")
+        cursor.execute(f"DELETE FROM {_DEFINITIONS_TABLE} WHERE name = ?", [rollup.name])
+    
+    async def drop(self, name: str) -> bool:
+        """删除预聚合表"""
+        async with self._lock:
+            rollup = self._rollups.pop(name, None)
+            if rollup is None:
+                return False
+            await self.engine.executor.run_with_cursor(self._drop_sync, rollup)
+            logger.info(f"预聚合表 {name} 已删除")
+            return True
+    
+    async def build_from_statements(self, statements: Iterable[Tuple[str, int]]) -> List[str]:
+        """
+        根据SQL挖掘并建立新的预聚合表
+        
+        Returns:
+            新建的预聚合表名
+        """
+        await self.engine.schema_catalog.refresh(self.engine)
+        catalog = self.engine.schema_catalog
+        definitions = mine_rollups(
+            statements,
+            lambda table: {column["column_name"].lower() for column in catalog.get_columns(table)},
+            min_frequency=self.min_frequency,
+            max_rollups=self.max_rollups,
+            max_dimensions=self.max_dimensions
+        )
+        
+        built = []
+        for rollup in definitions:
+            if len(self._rollups) >= self.max_rollups:
+                break
+            if rollup.name in self._rollups or any(
+                existing.base_table == rollup.base_table
+                and set(rollup.dimensions) <= set(existing.dimensions)
+                and set(rollup.measures) <= set(existing.measures)
+                for existing in self._rollups.values()
+            ):
+                continue
+            
+            async with self._lock:
+                try:
+                    kept = await self.engine.executor.run_with_cursor(self._build_sync, rollup)
+                except Exception as e:
+                    logger.warning(f"预聚合表 {rollup.name} 创建失败: {e}")
+                    continue
+                if kept:
+                    self._rollups[rollup.name] = rollup
+                    self._builds += 1
+                    built.append(rollup.name)
+                    logger.info(
+                        f"预聚合表 {rollup.name} 已创建: {rollup.base_row_count} -> {rollup.row_count} 行，"
+                        f"维度 {rollup.dimensions}"
+                    )
+        return built
+    
+    def _build_sync(self, cursor, rollup: RollupDefinition) -> bool:
+        """建表，基表过小或压缩比不足时不保留"""
+        base_rows = cursor.execute(f"SELECT count(*) FROM {rollup.base_table}").fetchone()[0]
+        if base_rows < self.min_base_rows:
+            return False
+        
+        self._refresh_sync(cursor, rollup, True)
+        if rollup.row_count > rollup.base_row_count * _MAX_ROLLUP_RATIO:
+            self._drop_sync(cursor, rollup)
+            logger.info(f"预聚合表 {rollup.name} 压缩比不足（{rollup.row_count}/{rollup.base_row_count}），已放弃")
+            return False
+        return True
+    
+    async def mine_from_history(self) -> List[str]:
+        """从查询历史中挖掘并建立预聚合表"""
+        from utils.database import db_manager
+        
+        self._last_mined = time.monotonic()
+        if db_manager.async_session_maker is None:
+            return []
+        
+        async with db_manager.get_session() as session:
+            statements = await load_history_statements(
+                session, datetime.now() - timedelta(days=self.history_days)
+            )
+        return await self.build_from_statements(statements)
+    
+    async def refresh_all(self):
+        """刷新全部预聚合表：到期或待重建的整体重建，其余校验内容后增量合并"""
+        for rollup in list(self._rollups.values()):
+            full = rollup.stale or time.time() - rollup.built_at >= self.full_rebuild_interval
+            async with self._lock:
+                if rollup.name not in self._rollups:
+                    continue
+                try:
+                    result = await self.engine.executor.run_with_cursor(self._refresh_sync, rollup, full)
+                    if result == "stale":
+                        await self.engine.executor.run_with_cursor(self._refresh_sync, rollup, True)
+                except Exception as e:
+                    self._refresh_errors += 1
+                    logger.warning(f"预聚合表 {rollup.name} 刷新失败: {e}")
+    
+    def invalidate(self, tables: Optional[List[str]] = None):
+        """基表数据被原地修改时标记相关预聚合表待重建"""
+        names = {table.lower() for table in tables} if tables is not None else None
+        for rollup in self._rollups.values():
+            if names is None or rollup.base_table in names:
+                rollup.stale = True
+    
+    async def _maintenance_loop(self):
+        """后台维护：定期挖掘历史和刷新预聚合表"""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                if time.monotonic() - self._last_mined >= self.mine_interval:
+                    await self.mine_from_history()
+                await self.refresh_all()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"预聚合表维护失败: {e}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            "rollups": [rollup.get_stats() for rollup in self._rollups.values()],
+            "rewrites": self._rewrites,
+            "builds": self._builds,
+            "incremental_refreshes": self._incremental_refreshes,
+            "full_rebuilds": self._full_rebuilds,
+            "refresh_errors": self._refresh_errors,
+            "changes_detected": self._changes_detected,
+            "verify_interval": self.verify_interval
+        }
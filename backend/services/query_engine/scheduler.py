@@ -0,0 +1,250 @@
+"""
+查询调度器
+限制单个引擎的并发查询数，按优先级通道和用户公平分配执行名额
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from enum import Enum
+from typing import Dict, Any, Optional, Deque, AsyncIterator, Iterator
+
+from utils.logger import get_logger
+from utils.exceptions import QueryEngineException, QueryTimeoutException
+
+logger = get_logger(__name__)
+
+
+class QueryLane(str, Enum):
+    """查询优先级通道"""
+    INTERACTIVE = "interactive"  # 交互式查询
+    BATCH = "batch"  # 批量查询
+    SCHEDULED = "scheduled"  # 定时任务
+
+
+# 默认通道权重：名额紧张时各通道按权重比例获得执行名额
+DEFAULT_LANE_WEIGHTS = {
+    QueryLane.INTERACTIVE: 8,
+    QueryLane.BATCH: 3,
+    QueryLane.SCHEDULED: 1
+}
+
+# 当前协程上下文的调度身份，由查询处理器或调用方设置
+current_query_user: ContextVar[Optional[str]] = ContextVar("current_query_user", default=None)
+current_query_lane: ContextVar[QueryLane] = ContextVar("current_query_lane", default=QueryLane.INTERACTIVE)
+
+
+@contextmanager
+def scheduling_scope(user_id: Any, lane: QueryLane = QueryLane.INTERACTIVE) -> Iterator[None]:
+    """在当前上下文中绑定调度使用的用户和通道"""
+    user_token = current_query_user.set(str(user_id) if user_id is not None else None)
+    lane_token = current_query_lane.set(QueryLane(lane))
+    try:
+        yield
+    finally:
+        current_query_user.reset(user_token)
+        current_query_lane.reset(lane_token)
+
+
+class _Waiter:
+    """排队中的查询"""
+    
+    def __init__(self, user: str, lane: QueryLane, future: asyncio.Future):
+        self.user = user
+        self.lane = lane
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class _LaneQueue:
+    """单个通道的队列：按用户分组，用户之间轮转出队"""
+    
+    def __init__(self, weight: int):
+        self.weight = max(1, weight)
+        # 步幅调度的虚拟时间，值最小的非空通道优先出队
+        self.pass_value = 0.0
+        # {user: 该用户排队中的查询}，出队后有剩余的用户移到末尾
+        self.users: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self.size = 0
+        
+        # 统计信息
+        self.dispatched = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+    
+    def push(self, waiter: _Waiter):
+        self.users.setdefault(waiter.user, deque()).append(waiter)
+        self.size += 1
+    
+    def pop(self) -> _Waiter:
+        user, waiters = next(iter(self.users.items()))
+        waiter = waiters.popleft()
+        del self.users[user]
+        if waiters:
+            self.users[user] = waiters
+        self.size -= 1
+        return waiter
+    
+    def remove(self, waiter: _Waiter) -> bool:
+        waiters = self.users.get(waiter.user)
+        if waiters is None or waiter not in waiters:
+            return False
+        waiters.remove(waiter)
+        if not waiters:
+            del self.users[waiter.user]
+        self.size -= 1
+        return True
+
+
+class FairShareScheduler:
+    """
+    公平调度器
+    
+    引擎同时执行的查询数不超过 max_concurrency；名额不足时排队，
+    通道之间按权重做步幅调度（低优先级通道也不会饿死），通道内各用户轮转出队，
+    单个用户提交的大量查询不会挤占其他用户
+    """
+    
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        max_queue_size: int = 1000,
+        lane_weights: Optional[Dict[QueryLane, int]] = None
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue_size = max_queue_size
+        weights = {**DEFAULT_LANE_WEIGHTS, **(lane_weights or {})}
+        self._lanes: Dict[QueryLane, _LaneQueue] = {
+            lane: _LaneQueue(weights[lane]) for lane in QueryLane
+        }
+        self._running = 0
+        self._running_by_user: Dict[str, int] = {}
+        
+        # 统计信息
+        self._rejected = 0
+        self._timed_out = 0
+    
+    @property
+    def queued(self) -> int:
+        return sum(lane.size for lane in self._lanes.values())
+    
+    @property
+    def has_capacity(self) -> bool:
+        """是否有空闲名额且无人排队（此时获取名额不需要等待）"""
+        return self._running < self.max_concurrency and self.queued == 0
+    
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        获取执行名额，用户和通道取自当前上下文
+        
+        Args:
+            timeout: 最长排队时间（秒）
+        
+        Yields:
+            调度信息 {"lane", "user", "queue_wait_ms"}
+        """
+        user = current_query_user.get() or "anonymous"
+        lane = current_query_lane.get()
+        wait_ms = await self._acquire(user, lane, timeout)
+        try:
+            yield {"lane": lane.value, "user": user, "queue_wait_ms": wait_ms}
+        finally:
+            self._release(user)
+    
+    async def _acquire(self, user: str, lane: QueryLane, timeout: Optional[float]) -> int:
+        """获取名额，返回排队时间（毫秒）"""
+        if self.has_capacity:
+            self._start(user)
+            return 0
+        
+        if self.queued >= self.max_queue_size:
+            self._rejected += 1
+            logger.warning(f"查询排队数已达上限，拒绝查询: user={user}, lane={lane.value}")
+            raise QueryEngineException(f"查询排队数已达上限（{self.max_queue_size}），请稍后重试")
+        
+        waiter = _Waiter(user, lane, asyncio.get_running_loop().create_future())
+        lane_queue = self._lanes[lane]
+        if lane_queue.size == 0:
+            # 空闲后重新进入的通道从当前最小虚拟时间加一个步幅开始，不因空闲积累优先权
+            lane_queue.pass_value = max(lane_queue.pass_value, self._min_pass() + 1.0 / lane_queue.weight)
+        lane_queue.push(waiter)
+        
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except BaseException as e:
+            if not lane_queue.remove(waiter) and waiter.future.done() and not waiter.future.cancelled():
+                # 已分配名额但调用方已放弃，归还名额
+                self._release(user)
+            elif not waiter.future.done():
+                waiter.future.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self._timed_out += 1
+                raise QueryTimeoutException(f"查询排队超过时限（{timeout:.1f}s）") from e
+            raise
+        
+        return int((time.perf_counter() - waiter.enqueued_at) * 1000)
+    
+    def _min_pass(self) -> float:
+        """非空通道中最小的虚拟时间"""
+        values = [lane.pass_value for lane in self._lanes.values() if lane.size]
+        return min(values) if values else 0.0
+    
+    def _start(self, user: str):
+        self._running += 1
+        self._running_by_user[user] = self._running_by_user.get(user, 0) + 1
+    
+    def _release(self, user: str):
+        """归还名额并调度下一个排队的查询"""
+        self._running -= 1
+        remaining = self._running_by_user.get(user, 0) - 1
+        if remaining > 0:
+            self._running_by_user[user] = remaining
+        else:
+            self._running_by_user.pop(user, None)
+        self._dispatch()
+    
+    def _dispatch(self):
+        """按通道步幅和用户轮转分配空闲名额"""
+        while self._running < self.max_concurrency:
+            candidates = [(lane.pass_value, index, lane) for index, lane in enumerate(self._lanes.values()) if lane.size]
+            if not candidates:
+                return
+            
+            _, _, lane_queue = min(candidates)
+            waiter = lane_queue.pop()
+            lane_queue.pass_value += 1.0 / lane_queue.weight
+            
+            if waiter.future.done():
+                continue
+            
+            wait_ms = (time.perf_counter() - waiter.enqueued_at) * 1000
+            lane_queue.dispatched += 1
+            lane_queue.total_wait_ms += wait_ms
+            lane_queue.max_wait_ms = max(lane_queue.max_wait_ms, wait_ms)
+            
+            self._start(waiter.user)
+            waiter.future.set_result(None)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度统计信息"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": self._running,
+            "queued": self.queued,
+            "running_users": len(self._running_by_user),
+            "rejected": self._rejected,
+            "timed_out": self._timed_out,
+            "lanes": {
+                lane.value: {
+                    "weight": queue.weight,
+                    "queued": queue.size,
+                    "queued_users": len(queue.users),
+                    "dispatched": queue.dispatched,
+                    "avg_wait_ms": round(queue.total_wait_ms / queue.dispatched, 2) if queue.dispatched else 0.0,
+                    "max_wait_ms": round(queue.max_wait_ms, 2)
+                }
+                for lane, queue in self._lanes.items()
+            }
+        }
@@ -0,0 +1,131 @@
+"""
+模式目录缓存
+在进程内缓存表和列信息，按表的版本增量刷新，避免每次请求都查询 information_schema
+"""
+import asyncio
+import time
+from typing import Dict, List, Any, Optional, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class SchemaCatalog:
+    """
+    模式目录
+    
+    首次使用时整体加载；之后每隔 refresh_interval 秒读取一次表列表及各表版本，
+    只重新加载版本发生变化的表的列信息
+    """
+    
+    def __init__(self, refresh_interval: int = 30):
+        self.refresh_interval = refresh_interval
+        # {table_name: 表信息}
+        self._tables: Dict[str, Dict[str, Any]] = {}
+        # {table_name: 列信息列表}
+        self._columns: Dict[str, List[Dict[str, Any]]] = {}
+        # {table_name: 版本}
+        self._versions: Dict[str, Any] = {}
+        # 小写表名索引，用于大小写不敏感的查找
+        self._lower_names: Dict[str, str] = {}
+        self._loaded = False
+        self._last_checked = 0.0
+        self._lock = asyncio.Lock()
+        
+        # 统计信息
+        self._full_loads = 0
+        self._refreshes = 0
+        self._tables_reloaded = 0
+        self._last_refresh_ms = 0
+    
+    async def refresh(self, engine: Any, force: bool = False):
+        """
+        按需刷新目录
+        
+        Args:
+            engine: 查询引擎，提供 _load_catalog_tables 和 _load_catalog_columns
+            force: 是否忽略刷新间隔立即检查
+        """
+        if not force and self._is_fresh():
+            return
+        
+        async with self._lock:
+            if not force and self._is_fresh():
+                return
+            
+            start_time = time.time()
+            
+            # {table_name: (表信息, 版本)}
+            tables: Dict[str, Tuple[Dict[str, Any], Any]] = await engine._load_catalog_tables()
+            
+            if not self._loaded:
+                changed = None
+            else:
+                changed = [name for name, (_, version) in tables.items() if self._versions.get(name) != version]
+            
+            columns = {}
+            if changed is None or changed:
+                columns = await engine._load_catalog_columns(changed)
+            
+            # 表信息（估计行数等）每次都更新，列信息只更新变化的表
+            removed = set(self._tables) - set(tables)
+            for name in removed:
+                self._columns.pop(name, None)
+            
+            self._tables = {name: info for name, (info, _) in tables.items()}
+            self._versions = {name: version for name, (_, version) in tables.items()}
+            self._lower_names = {name.lower(): name for name in tables}
+            
+            if changed is None:
+                self._columns = {name: columns.get(name, []) for name in tables}
+                self._full_loads += 1
+            else:
+                for name in changed:
+                    self._columns[name] = columns.get(name, [])
+                self._tables_reloaded += len(changed)
+            
+            self._loaded = True
+            self._refreshes += 1
+            self._last_checked = time.monotonic()
+            self._last_refresh_ms = int((time.time() - start_time) * 1000)
+            
+            if changed is None:
+                logger.info(f"模式目录加载完成: {len(tables)} 张表，耗时 {self._last_refresh_ms}ms")
+            elif changed or removed:
+                logger.info(f"模式目录增量刷新: 变更 {len(changed)} 张表，删除 {len(removed)} 张表")
+    
+    def _is_fresh(self) -> bool:
+        """目录是否在刷新间隔内"""
+        return self._loaded and time.monotonic() - self._last_checked < self.refresh_interval
+    
+    def _resolve(self, table_name: str) -> Optional[str]:
+        """解析表名（优先精确匹配，其次大小写不敏感匹配）"""
+        if table_name in self._tables:
+            return table_name
+        return self._lower_names.get(table_name.lower())
+    
+    def get_tables(self) -> List[Dict[str, Any]]:
+        """获取所有表信息（按表名排序）"""
+        return [self._tables[name] for name in sorted(self._tables)]
+    
+    def get_columns(self, table_name: str) -> List[Dict[str, Any]]:
+        """获取指定表的列信息，表不存在时返回空列表"""
+        name = self._resolve(table_name)
+        return list(self._columns.get(name, [])) if name else []
+    
+    def invalidate(self):
+        """使目录在下次访问时重新检查版本"""
+        self._last_checked = 0.0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取目录统计信息"""
+        return {
+            "loaded": self._loaded,
+            "tables": len(self._tables),
+            "full_loads": self._full_loads,
+            "refreshes": self._refreshes,
+            "tables_reloaded": self._tables_reloaded,
+            "last_refresh_ms": self._last_refresh_ms,
+            "refresh_interval": self.refresh_interval
+        }
@@ -0,0 +1,110 @@
+"""
+预处理语句缓存
+按SQL文本缓存单个连接（游标）上已预处理的语句，重复执行参数化模板时跳过解析和计划生成
+"""
+import itertools
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+
+# 语句名全局递增，避免不同缓存实例在同一会话中重名
+_statement_ids = itertools.count(1)
+
+
+class PreparedStatementCache:
+    """
+    单个连接上的预处理语句缓存（LRU）
+    
+    预处理语句属于会话，缓存与连接一一对应，只在持有该连接的执行方中使用，不需要加锁；
+    淘汰时返回被淘汰的语句名，由调用方在连接上释放。
+    驱动提供语句对象时（如DuckDB解析后的语句）可随语句名一并登记，通过 get_handle 取回
+    """
+    
+    def __init__(self, capacity: int = 128, name_prefix: str = "taosha_stmt"):
+        self.capacity = capacity
+        self.name_prefix = name_prefix
+        # {sql: 语句名}
+        self._statements: "OrderedDict[str, str]" = OrderedDict()
+        # {语句名: 语句对象}
+        self._handles: Dict[str, Any] = {}
+        
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def lookup(self, sql: str) -> Optional[str]:
+        """查找已预处理的语句名，未命中返回None"""
+        name = self._statements.get(sql)
+        if name is None:
+            self.misses += 1
+            return None
+        
+        self._statements.move_to_end(sql)
+        self.hits += 1
+        return name
+    
+    def add(self, sql: str, handle: Optional[Any] = None) -> Tuple[str, List[str]]:
+        """
+        为SQL分配语句名并登记
+        
+        Args:
+            sql: SQL文本
+            handle: 可选的语句对象
+        
+        Returns:
+            (语句名, 需要在连接上释放的被淘汰语句名列表)
+        """
+        name = f"{self.name_prefix}_{next(_statement_ids)}"
+        self._statements[sql] = name
+        self._statements.move_to_end(sql)
+        if handle is not None:
+            self._handles[name] = handle
+        
+        evicted = []
+        while len(self._statements) > self.capacity:
+            _, evicted_name = self._statements.popitem(last=False)
+            self._handles.pop(evicted_name, None)
+            evicted.append(evicted_name)
+            self.evictions += 1
+        return name, evicted
+    
+    def discard(self, sql: str) -> Optional[str]:
+        """移除语句登记（预处理失败或会话中语句已失效时调用）"""
+        name = self._statements.pop(sql, None)
+        if name is not None:
+            self._handles.pop(name, None)
+            self.invalidations += 1
+        return name
+    
+    def get_handle(self, name: str) -> Optional[Any]:
+        """取回随语句名登记的语句对象"""
+        return self._handles.get(name)
+    
+    def clear(self):
+        """清空登记（连接重建后调用）"""
+        self._statements.clear()
+        self._handles.clear()
+    
+    def __len__(self) -> int:
+        return len(self._statements)
+
+
+def summarize_statement_caches(caches: Iterable[PreparedStatementCache], capacity: int) -> Dict[str, Any]:
+    """汇总多个连接上的缓存统计信息"""
+    caches = list(caches)
+    hits = sum(cache.hits for cache in caches)
+    misses = sum(cache.misses for cache in caches)
+    lookups = hits + misses
+    
+    return {
+        "enabled": capacity > 0,
+        "capacity_per_connection": capacity,
+        "connections": len(caches),
+        "statements": sum(len(cache) for cache in caches),
+        "hits": hits,
+        "misses": misses,
+        "evictions": sum(cache.evictions for cache in caches),
+        "invalidations": sum(cache.invalidations for cache in caches),
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+    }
@@ -0,0 +1,8 @@
+"""
+测试公共配置
+"""
+import sys
+from pathlib import Path
+
+# 与 main.py 一致，以 backend 目录为导入根
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
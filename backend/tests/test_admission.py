@@ -0,0 +1,41 @@
+"""
+查询准入控制测试
+"""
+import asyncio
+
+from services.query_engine.admission import AdmissionController, AdmissionDecision
+
+SQL = "SELECT * FROM orders ORDER BY amount DESC"
+
+
+class FakeEngine:
+    def __init__(self, **estimate):
+        self.estimate = estimate
+    
+    async def estimate_query_cost(self, sql):
+        return dict(self.estimate)
+
+
+def _evaluate(controller, **estimate):
+    return asyncio.run(controller.evaluate(FakeEngine(**estimate), SQL))
+
+
+def test_result_rows_above_max_result_rows_are_accepted():
+    controller = AdmissionController(downgrade_rows=100_000)
+    result = _evaluate(controller, scan_rows=50_000, scan_bytes=0, estimated_rows=50_000)
+    assert result["decision"] == AdmissionDecision.ACCEPT.value
+    assert result["row_limit"] is None
+
+
+def test_downgrade_keeps_sql_and_reports_row_limit():
+    controller = AdmissionController(downgrade_rows=100_000)
+    result = _evaluate(controller, scan_rows=500_000, scan_bytes=0, estimated_rows=500_000)
+    assert result["decision"] == AdmissionDecision.DOWNGRADE.value
+    assert result["sql"] == SQL
+    assert result["row_limit"] == 100_000
+
+
+def test_scan_above_limit_is_rejected():
+    controller = AdmissionController(max_scan_rows=1_000_000)
+    result = _evaluate(controller, scan_rows=2_000_000, scan_bytes=0, estimated_rows=10)
+    assert result["decision"] == AdmissionDecision.REJECT.value
@@ -0,0 +1,53 @@
+"""
+DuckDB参数绑定测试
+"""
+import asyncio
+
+from services.query_engine.duckdb_engine import DuckDBQueryEngine
+
+
+async def _prepare_engine():
+    # 单个工作线程，所有查询使用同一游标上的语句缓存
+    engine = DuckDBQueryEngine({
+        "type": "duckdb", "path": ":memory:", "result_cache_enabled": False, "executor_workers": 1
+    })
+    await engine.connect()
+    engine.connection.execute("CREATE TABLE users AS SELECT i AS id, 'user' || i AS name FROM range(10) r(i)")
+    return engine
+
+
+def test_parameter_values_are_bound_as_data():
+    async def scenario():
+        engine = await _prepare_engine()
+        try:
+            value = "x'; DROP TABLE users; --"
+            result = await engine.execute_query("SELECT ? AS value, COUNT(*) AS total FROM users", [value])
+            assert result.rows[0] == [value, 10]
+            
+            remaining = await engine.execute_query("SELECT COUNT(*) FROM users")
+            assert remaining.rows[0][0] == 10
+        finally:
+            await engine.disconnect()
+    
+    asyncio.run(scenario())
+
+
+def test_positional_and_named_parameters_reuse_parsed_statement():
+    async def scenario():
+        engine = await _prepare_engine()
+        try:
+            positional = "SELECT name FROM users WHERE id = ?"
+            named = "SELECT name FROM users WHERE id = $user_id"
+            for user_id in (3, 4):
+                result = await engine.execute_query(positional, [user_id])
+                assert result.rows[0][0] == f"user{user_id}"
+                result = await engine.execute_query(named, {"user_id": user_id})
+                assert result.rows[0][0] == f"user{user_id}"
+            
+            stats = engine.get_engine_info()["prepared_statements"]
+            assert stats["misses"] == 2
+            assert stats["hits"] == 2
+        finally:
+            await engine.disconnect()
+    
+    asyncio.run(scenario())
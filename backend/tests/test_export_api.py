@@ -0,0 +1,75 @@
+"""
+查询结果导出接口测试
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+pytest.importorskip("langgraph")
+pytest.importorskip("vanna")
+nlquery = pytest.importorskip("api.v1.nlquery")
+
+from services.query_engine.result_export import ExportFormat
+
+SQL = "SELECT * FROM orders;"
+
+
+class FakeProcessor:
+    def __init__(self):
+        self.active_tasks = {"task-1": {"task_id": "task-1", "user_id": 1}}
+    
+    async def get_task_result(self, task_id):
+        return {"task_id": task_id, "status": "success", "final_sql": SQL}
+
+
+class FakeJob:
+    def __init__(self, **fields):
+        self.fields = fields
+    
+    def to_dict(self):
+        return dict(self.fields)
+
+
+class FakeExporter:
+    def __init__(self):
+        self.started = []
+    
+    def start_export(self, task_id, sql, export_format, user_id=None):
+        self.started.append((task_id, sql, export_format, user_id))
+        return FakeJob(task_id=task_id, format=export_format.value)
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = FakeExporter()
+    monkeypatch.setattr(nlquery, "get_query_processor", FakeProcessor)
+    monkeypatch.setattr(nlquery, "get_result_exporter", lambda: exporter)
+    return exporter
+
+
+def test_export_of_another_users_task_is_forbidden(exporter):
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(nlquery.export_query_result("task-1", ExportFormat.CSV, {"id": 2}))
+    assert excinfo.value.status_code == 403
+    assert exporter.started == []
+
+
+def test_owner_and_superuser_can_export(exporter):
+    asyncio.run(nlquery.export_query_result("task-1", ExportFormat.CSV, {"id": 1}))
+    asyncio.run(nlquery.export_query_result("task-1", ExportFormat.CSV, {"id": 2, "is_superuser": True}))
+    assert [started[3] for started in exporter.started] == [1, 2]
+
+
+def test_export_of_unknown_task_is_not_found(exporter):
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(nlquery.export_query_result("missing", ExportFormat.CSV, {"id": 1}))
+    assert excinfo.value.status_code == 404
+
+
+def test_export_format_query_parameter_is_still_named_format():
+    route = next(
+        route for route in nlquery.router.routes
+        if route.path == "/export/{task_id}" and "POST" in route.methods
+    )
+    assert [param.alias for param in route.dependant.query_params] == ["format"]
@@ -0,0 +1,30 @@
+"""
+MySQL预处理语句缓存开关测试
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiomysql")
+
+from config.settings import Settings
+from services.query_engine.mysql_engine import MySQLQueryEngine
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.statements = []
+    
+    async def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+
+
+def test_mysql_prepared_statement_cache_is_opt_in():
+    settings = Settings(QUERY_ENGINE_TYPE="mysql")
+    assert settings.get_query_engine_config()["prepared_statement_cache_size"] == 0
+    
+    engine = MySQLQueryEngine(settings.get_query_engine_config())
+    cursor = RecordingCursor()
+    asyncio.run(engine._execute_prepared(object(), cursor, "SELECT * FROM orders WHERE id = %s", [7]))
+    # 参数化查询一次往返直接执行，不经过 PREPARE / SET / EXECUTE
+    assert cursor.statements == [("SELECT * FROM orders WHERE id = %s", [7])]
@@ -0,0 +1,123 @@
+"""
+MySQL结果缓存版本读取测试
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+pytest.importorskip("aiomysql")
+
+from services.query_engine.mysql_engine import MySQLQueryEngine
+from services.query_engine.mysql_replicas import ReplicaEndpoint
+from services.query_engine.result_cache import CacheWrite, current_cache_write
+
+PRIMARY_GTID = "3e11fa47-71ca-11e1-9e33-c80aa9429562:1-100"
+
+
+class FakeCursor:
+    """按语句返回预设结果"""
+    
+    def __init__(self, version_rows=(), gtid_subset=1):
+        self.version_rows = list(version_rows)
+        self.gtid_subset = gtid_subset
+        self.statements = []
+        self._result = []
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        return False
+    
+    async def execute(self, sql, params=None):
+        self.statements.append(sql)
+        if "INFORMATION_SCHEMA.TABLES" in sql:
+            self._result = self.version_rows
+        elif "GTID_SUBSET" in sql:
+            self._result = [(self.gtid_subset,)]
+        elif "gtid_executed" in sql:
+            self._result = [(PRIMARY_GTID,)]
+        else:
+            self._result = []
+    
+    async def fetchall(self):
+        return self._result
+    
+    async def fetchone(self):
+        return self._result[0] if self._result else None
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+    
+    def cursor(self):
+        return self._cursor
+
+
+class FakePool:
+    def __init__(self, cursor):
+        self.cursor = cursor
+    
+    @asynccontextmanager
+    async def acquire(self):
+        yield FakeConnection(self.cursor)
+
+
+def _engine(cursor, replicas=None):
+    engine = MySQLQueryEngine({"type": "mysql", "database": "shop", "replicas": replicas})
+    engine.connection_pool = FakePool(cursor)
+    engine.is_connected = True
+    return engine
+
+
+def test_views_and_unknown_update_time_have_no_version():
+    async def scenario():
+        orders = ("shop", "orders", "BASE TABLE", "2024-01-01 00:00:00", "2024-05-01 10:00:00")
+        engine = _engine(FakeCursor([orders]))
+        assert await engine._get_table_versions(["orders"]) == {
+            "orders": ("2024-01-01 00:00:00", "2024-05-01 10:00:00")
+        }
+        
+        view = ("shop", "order_view", "VIEW", None, None)
+        engine = _engine(FakeCursor([orders, view]))
+        assert await engine._get_table_versions(["orders", "order_view"]) is None
+        
+        never_updated = ("shop", "orders", "BASE TABLE", "2024-01-01 00:00:00", None)
+        engine = _engine(FakeCursor([never_updated]))
+        assert await engine._get_table_versions(["orders"]) is None
+        
+        # 不存在的表
+        engine = _engine(FakeCursor([orders]))
+        assert await engine._get_table_versions(["orders", "missing"]) is None
+    
+    asyncio.run(scenario())
+
+
+def test_replica_results_are_cached_only_when_caught_up():
+    async def scenario():
+        orders = ("shop", "orders", "BASE TABLE", "2024-01-01 00:00:00", "2024-05-01 10:00:00")
+        engine = _engine(FakeCursor([orders]), replicas=[{"host": "replica-1"}])
+        endpoint = ReplicaEndpoint("replica-1")
+        
+        cache_write = CacheWrite(["orders"])
+        token = current_cache_write.set(cache_write)
+        try:
+            await engine._get_table_versions(["orders"])
+        finally:
+            current_cache_write.reset(token)
+        assert cache_write.source_position == PRIMARY_GTID
+        
+        await engine._check_replica_position(FakeCursor(gtid_subset=1), cache_write, endpoint)
+        assert cache_write.rejected is False
+        
+        await engine._check_replica_position(FakeCursor(gtid_subset=0), cache_write, endpoint)
+        assert cache_write.rejected is True
+        
+        # 主库未启用GTID时无法确认副本进度
+        unknown = CacheWrite(["orders"])
+        await engine._check_replica_position(FakeCursor(gtid_subset=1), unknown, endpoint)
+        assert unknown.rejected is True
+    
+    asyncio.run(scenario())
@@ -0,0 +1,117 @@
+"""
+MySQL批量执行工作会话的连接固定测试
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+pytest.importorskip("aiomysql")
+
+from services.query_engine.mysql_engine import MySQLQueryEngine
+from services.query_engine.scheduler import FairShareScheduler
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+
+
+class FakePool:
+    """记录签出中的连接"""
+    
+    def __init__(self):
+        self.created = 0
+        self.in_use = set()
+    
+    @asynccontextmanager
+    async def acquire(self):
+        self.created += 1
+        conn = FakeConnection(self.created)
+        self.in_use.add(conn)
+        try:
+            yield conn
+        finally:
+            self.in_use.discard(conn)
+
+
+def _engine(scheduler=None):
+    engine = MySQLQueryEngine({"type": "mysql"})
+    engine.connection_pool = FakePool()
+    engine.is_connected = True
+    engine.scheduler = scheduler
+    return engine
+
+
+async def _used_connection(engine):
+    async with engine._acquire_read_connection() as (conn, endpoint):
+        await asyncio.sleep(0)
+        return conn
+
+
+def test_worker_pins_connection_lazily_and_releases_it():
+    async def scenario():
+        engine = _engine()
+        pool = engine.connection_pool
+        async with engine._worker_session():
+            assert pool.in_use == set()
+            first = await _used_connection(engine)
+            second = await _used_connection(engine)
+            assert first is second
+            assert pool.in_use == {first}
+        assert pool.in_use == set()
+    
+    asyncio.run(scenario())
+
+
+def test_child_tasks_do_not_inherit_worker_connection():
+    async def scenario():
+        engine = _engine()
+        async with engine._worker_session():
+            pinned = await _used_connection(engine)
+            # 查询合并的共享执行在继承了上下文的独立任务中运行
+            child = await asyncio.create_task(_used_connection(engine))
+            assert child is not pinned
+    
+    asyncio.run(scenario())
+
+
+def test_worker_returns_connection_before_queueing_for_a_slot():
+    async def scenario():
+        engine = _engine(FairShareScheduler(max_concurrency=1))
+        pool = engine.connection_pool
+        used = []
+        first_done = asyncio.Event()
+        proceed = asyncio.Event()
+        
+        async def execute_query(sql, params=None, timeout=None):
+            used.append(await _used_connection(engine))
+        
+        engine._execute_query = execute_query
+        
+        async def worker():
+            async with engine._worker_session():
+                await engine._execute_scheduled("SELECT 1", None, None)
+                first_done.set()
+                await proceed.wait()
+                await engine._execute_scheduled("SELECT 2", None, None)
+                assert len(pool.in_use) == 1
+        
+        task = asyncio.create_task(worker())
+        await first_done.wait()
+        assert len(pool.in_use) == 1
+        
+        # 名额被其他查询占用时工作协程排队，排队期间不持有连接
+        async with engine.scheduler.slot():
+            proceed.set()
+            for _ in range(3):
+                await asyncio.sleep(0)
+            assert engine.scheduler.queued == 1
+            assert pool.in_use == set()
+        await task
+        
+        assert used[0] is not used[1]
+        assert pool.in_use == set()
+    
+    asyncio.run(scenario())
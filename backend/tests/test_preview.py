@@ -0,0 +1,35 @@
+"""
+预览查询改写测试
+"""
+from services.query_engine.preview import additive_columns, limit_sql
+
+
+def test_only_whole_sum_and_count_calls_are_scaled():
+    sql = (
+        "SELECT region, SUM(amount) AS total, COUNT(*) orders, "
+        "SUM(CASE WHEN status = 'paid' THEN amount END) AS paid, "
+        "SUM(amount) / COUNT(*) AS avg_amount, SUM(amount) * 2 AS doubled, "
+        "SUM(amount) - SUM(refund) AS net, COUNT(DISTINCT user_id) AS users, "
+        "AVG(amount) AS mean "
+        "FROM orders GROUP BY region"
+    )
+    assert additive_columns(sql) == [1, 2, 3]
+
+
+def test_ratio_expression_with_parentheses_is_not_scaled():
+    sql = "SELECT (SUM(amount)) / (COUNT(*)) AS ratio, COUNT(*) / 100.0 AS pct FROM orders"
+    assert additive_columns(sql) == []
+
+
+def test_limit_is_appended_after_top_level_order_by():
+    assert limit_sql("SELECT a FROM t ORDER BY a DESC;", 10) == "SELECT a FROM t ORDER BY a DESC LIMIT 10"
+
+
+def test_limit_wraps_query_without_top_level_order_by():
+    for sql in (
+        "SELECT a FROM t",
+        "SELECT a FROM (SELECT a FROM t ORDER BY a) x",
+        "SELECT a FROM t ORDER BY a LIMIT 5",
+        "SELECT 'ORDER BY' AS a FROM t"
+    ):
+        assert limit_sql(sql, 10) == f"SELECT * FROM ({sql}) AS _preview_limited LIMIT 10"
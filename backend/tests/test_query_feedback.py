@@ -0,0 +1,92 @@
+"""
+查询反馈失效缓存测试
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+pytest.importorskip("langgraph")
+pytest.importorskip("vanna")
+nlquery = pytest.importorskip("api.v1.nlquery")
+
+from schemas.nlquery_schemas import QueryFeedbackCreate
+from services.nl2sql.query_processor import QueryProcessor
+from services.nl2sql.question_cache import QuestionCache, make_question_key
+
+QUESTION = "统计各地区订单金额"
+SQL = "SELECT region, SUM(amount) FROM orders GROUP BY region;"
+OWNER = {"id": 1, "is_superuser": False}
+
+
+class FakeVannaService:
+    def __init__(self):
+        self.invalidated = []
+    
+    def invalidate_cached_sql(self, question=None, sql=None):
+        self.invalidated.append((question, sql))
+        return 1
+
+
+def _processor():
+    processor = QueryProcessor.__new__(QueryProcessor)
+    processor.vanna_service = FakeVannaService()
+    processor.question_cache = QuestionCache()
+    processor.active_tasks = {
+        "task-1": {
+            "task_id": "task-1",
+            "user_id": 1,
+            "user_question": QUESTION,
+            "state": {"user_question": QUESTION, "final_sql": SQL}
+        }
+    }
+    return processor
+
+
+def test_negative_feedback_removes_cached_entries(monkeypatch):
+    processor = _processor()
+    key = make_question_key(QUESTION, None, [], ["analyst"])
+    processor.question_cache.put(key, SQL, "task-1")
+    monkeypatch.setattr(nlquery, "get_query_processor", lambda: processor)
+    
+    feedback = QueryFeedbackCreate(task_id="task-1", feedback_type="bad")
+    asyncio.run(nlquery.submit_query_feedback(feedback, current_user=OWNER, db=None))
+    
+    assert processor.question_cache.get(key) is None
+    assert processor.vanna_service.invalidated == [(QUESTION, SQL)]
+
+
+def test_positive_feedback_keeps_cached_entries(monkeypatch):
+    processor = _processor()
+    key = make_question_key(QUESTION, None, [], ["analyst"])
+    processor.question_cache.put(key, SQL, "task-1")
+    monkeypatch.setattr(nlquery, "get_query_processor", lambda: processor)
+    
+    feedback = QueryFeedbackCreate(task_id="task-1", feedback_type="good", rating=5)
+    asyncio.run(nlquery.submit_query_feedback(feedback, current_user=OWNER, db=None))
+    
+    assert processor.question_cache.get(key) is not None
+    assert processor.vanna_service.invalidated == []
+
+
+def test_negative_feedback_for_unknown_task_is_not_found(monkeypatch):
+    monkeypatch.setattr(nlquery, "get_query_processor", _processor)
+    
+    feedback = QueryFeedbackCreate(task_id="missing", feedback_type="bad")
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(nlquery.submit_query_feedback(feedback, current_user=OWNER, db=None))
+    assert excinfo.value.status_code == 404
+
+
+def test_negative_feedback_from_other_user_is_forbidden(monkeypatch):
+    processor = _processor()
+    key = make_question_key(QUESTION, None, [], ["analyst"])
+    processor.question_cache.put(key, SQL, "task-1")
+    monkeypatch.setattr(nlquery, "get_query_processor", lambda: processor)
+    
+    feedback = QueryFeedbackCreate(task_id="task-1", feedback_type="bad")
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(nlquery.submit_query_feedback(feedback, current_user={"id": 2, "is_superuser": False}, db=None))
+    assert excinfo.value.status_code == 403
+    assert processor.question_cache.get(key) is not None
+    assert processor.vanna_service.invalidated == []
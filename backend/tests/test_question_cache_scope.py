@@ -0,0 +1,57 @@
+"""
+问题缓存用户范围测试
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("langgraph")
+pytest.importorskip("vanna")
+nlquery = pytest.importorskip("api.v1.nlquery")
+
+from schemas.nlquery_schemas import QueryTaskCreate
+from services.nl2sql.query_processor import QueryProcessor
+from services.nl2sql.question_cache import QuestionCache
+
+SQL = "SELECT region, SUM(amount) FROM orders GROUP BY region;"
+
+
+def _processor():
+    processor = QueryProcessor.__new__(QueryProcessor)
+    processor.active_tasks = {}
+    processor._background_tasks = set()
+    processor.question_cache = QuestionCache()
+    
+    async def execute_query_workflow(task_id, initial_state):
+        processor._remember_question_sql(task_id, SQL)
+    
+    processor._execute_query_workflow = execute_query_workflow
+    return processor
+
+
+def _user(user_id, role):
+    return {"id": user_id, "roles": [{"id": user_id, "name": role}]}
+
+
+def test_users_with_different_roles_do_not_share_question_cache(monkeypatch):
+    processor = _processor()
+    monkeypatch.setattr(nlquery, "get_query_processor", lambda: processor)
+    query = QueryTaskCreate(user_question="统计各地区订单金额")
+    
+    async def submit(user):
+        response = await nlquery.submit_query(query, db=None, current_user=user)
+        await asyncio.gather(*processor._background_tasks)
+        return response.data
+    
+    async def scenario():
+        first = await submit(_user(1, "analyst"))
+        other_role = await submit(_user(2, "finance"))
+        same_role = await submit(_user(3, "analyst"))
+        return first, other_role, same_role
+    
+    first, other_role, same_role = asyncio.run(scenario())
+    
+    assert first["cache_hit"] is False
+    assert other_role["cache_hit"] is False
+    assert same_role["cache_hit"] is True
+    assert processor.active_tasks[same_role["task_id"]]["user_id"] == 3
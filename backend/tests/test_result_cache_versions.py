@@ -0,0 +1,86 @@
+"""
+结果缓存数据版本测试
+"""
+import asyncio
+
+from config.settings import Settings
+from services.query_engine.duckdb_engine import DuckDBQueryEngine
+from services.query_engine.result_cache import extract_tables
+
+QUERY = "SELECT SUM(amount) AS total FROM orders"
+
+
+async def _prepare_engine():
+    engine = DuckDBQueryEngine({"type": "duckdb", "path": ":memory:", "result_cache_enabled": True})
+    await engine.connect()
+    engine.connection.execute("CREATE TABLE orders AS SELECT i AS id, i AS amount FROM range(100) r(i)")
+    return engine
+
+
+def test_duckdb_result_cache_is_disabled_by_default(tmp_path):
+    settings = Settings(QUERY_ENGINE_TYPE="duckdb", QUERY_ENGINE_PATH=str(tmp_path / "query.duckdb"))
+    assert settings.DUCKDB_RESULT_CACHE_ENABLED is False
+    assert settings.get_query_engine_config()["result_cache_enabled"] is False
+
+
+def test_invalidation_during_execution_rejects_stale_entry():
+    async def scenario():
+        engine = await _prepare_engine()
+        try:
+            # 查询执行前读取版本，执行期间发生原地更新并失效
+            versions = await engine._get_table_versions(["orders"])
+            engine.connection.execute("UPDATE orders SET amount = amount + 1")
+            engine.invalidate_result_cache(["orders"])
+            assert await engine._get_table_versions(["orders"]) != versions
+            
+            first = await engine.execute_query(QUERY)
+            engine.connection.execute("UPDATE orders SET amount = amount + 1")
+            engine.invalidate_result_cache(["orders"])
+            second = await engine.execute_query(QUERY)
+            assert second.rows[0][0] == first.rows[0][0] + 100
+        finally:
+            await engine.disconnect()
+    
+    asyncio.run(scenario())
+
+
+def test_comma_separated_from_list_tables_are_extracted():
+    assert extract_tables("SELECT * FROM a, b WHERE a.id = b.id") == ["a", "b"]
+    assert extract_tables("SELECT * FROM a x, b AS y, `db`.`c` WHERE 1 = 1") == ["a", "b", "db.c"]
+    assert extract_tables("SELECT EXTRACT(YEAR FROM d) FROM t, (SELECT * FROM u) s") == ["t", "u"]
+    assert extract_tables("WITH x AS (SELECT * FROM t) SELECT * FROM x, range(3) r, u") == ["t", "u"]
+
+
+def test_write_to_second_from_list_table_invalidates_entry():
+    async def scenario():
+        engine = await _prepare_engine()
+        try:
+            engine.connection.execute("CREATE TABLE regions AS SELECT i AS id FROM range(10) r(i)")
+            sql = "SELECT COUNT(*) FROM orders o, regions r WHERE o.id = r.id"
+            await engine.execute_query(sql)
+            assert (await engine.execute_query(sql)).metadata.get("cache_hit") is True
+            
+            engine.connection.execute("DELETE FROM regions WHERE id > 4")
+            engine.invalidate_result_cache(["regions"])
+            result = await engine.execute_query(sql)
+            assert result.metadata.get("cache_hit") is not True
+            assert result.rows[0][0] == 5
+        finally:
+            await engine.disconnect()
+    
+    asyncio.run(scenario())
+
+
+def test_query_on_view_is_not_cached():
+    async def scenario():
+        engine = await _prepare_engine()
+        try:
+            engine.connection.execute("CREATE VIEW big_orders AS SELECT * FROM orders WHERE amount > 50")
+            sql = "SELECT COUNT(*) FROM big_orders"
+            await engine.execute_query(sql)
+            assert (await engine.execute_query(sql)).metadata.get("cache_hit") is not True
+            assert engine.result_cache.get_stats()["entries"] == 0
+        finally:
+            await engine.disconnect()
+    
+    asyncio.run(scenario())
@@ -0,0 +1,27 @@
+"""
+查询结果JSON编码测试
+"""
+import json
+
+from services.query_engine import result_encoder
+
+
+class _RecordingLogger:
+    def __init__(self):
+        self.warnings = []
+    
+    def warning(self, message):
+        self.warnings.append(message)
+
+
+def test_stdlib_fallback_is_logged_once(monkeypatch):
+    recorder = _RecordingLogger()
+    monkeypatch.setattr(result_encoder, "orjson", None)
+    monkeypatch.setattr(result_encoder, "_fallback_logged", False)
+    monkeypatch.setattr(result_encoder, "logger", recorder)
+    
+    content = {"columns": ["total"], "rows": [[1.5], [None]]}
+    encoder = result_encoder.ResultEncoder([result_encoder.ColumnKind.FLOAT])
+    assert json.loads(result_encoder.encode_json(content)) == content
+    assert json.loads(encoder.encode_json(content)) == content
+    assert len(recorder.warnings) == 1
@@ -0,0 +1,99 @@
+"""
+预聚合表刷新测试
+"""
+import asyncio
+
+from services.query_engine.duckdb_engine import DuckDBQueryEngine
+
+QUERY = "SELECT region, SUM(amount) AS total FROM orders GROUP BY region ORDER BY region"
+
+
+def _engine_config(**overrides):
+    config = {
+        "type": "duckdb",
+        "path": ":memory:",
+        "result_cache_enabled": False,
+        "rollup_enabled": True,
+        "rollup_min_base_rows": 1000,
+        "rollup_refresh_interval": 3600
+    }
+    config.update(overrides)
+    return config
+
+
+async def _run_with_and_without_rollups(engine):
+    """分别经预聚合表和直接查询基表执行，返回 (改写结果, 基表结果, 使用的预聚合表)"""
+    rewritten = await engine.execute_query(QUERY)
+    saved, engine.rollups._rollups = engine.rollups._rollups, {}
+    try:
+        base = await engine.execute_query(QUERY)
+    finally:
+        engine.rollups._rollups = saved
+    return [list(row) for row in rewritten.rows], [list(row) for row in base.rows], rewritten.metadata.get("rollup")
+
+
+async def _prepare_engine(**overrides):
+    engine = DuckDBQueryEngine(_engine_config(**overrides))
+    await engine.connect()
+    engine.connection.execute(
+        "CREATE TABLE orders AS SELECT i AS id, 'r' || (i % 5) AS region, (i % 100)::DECIMAL(12, 2) AS amount "
+        "FROM range(20000) r(i)"
+    )
+    built = await engine.rollups.build_from_statements([(QUERY, 10)])
+    assert built
+    return engine
+
+
+def test_in_place_update_is_not_served_from_rollup():
+    async def scenario():
+        engine = await _prepare_engine()
+        try:
+            rows, base, rollup = await _run_with_and_without_rollups(engine)
+            assert rollup is not None
+            assert rows == base
+            
+            # 行数和最大rowid都不变的原地修改
+            engine.connection.execute("UPDATE orders SET amount = amount + 1000 WHERE id < 50")
+            rows, base, rollup = await _run_with_and_without_rollups(engine)
+            assert rollup is None
+            assert rows == base
+            
+            # 整体重建后重新使用预聚合表
+            await engine.rollups.refresh_all()
+            rows, base, rollup = await _run_with_and_without_rollups(engine)
+            assert rollup is not None
+            assert rows == base
+        finally:
+            await engine.disconnect()
+    
+    asyncio.run(scenario())
+
+
+def test_delete_then_insert_is_detected():
+    async def scenario():
+        engine = await _prepare_engine()
+        try:
+            engine.connection.execute("DELETE FROM orders WHERE id = 7")
+            engine.connection.execute("INSERT INTO orders VALUES (7, 'r2', 99999)")
+            rows, base, rollup = await _run_with_and_without_rollups(engine)
+            assert rollup is None
+            assert rows == base
+        finally:
+            await engine.disconnect()
+    
+    asyncio.run(scenario())
+
+
+def test_append_is_merged_incrementally():
+    async def scenario():
+        engine = await _prepare_engine()
+        try:
+            engine.connection.execute("INSERT INTO orders SELECT i, 'r9', 1 FROM range(20000, 20100) r(i)")
+            rows, base, rollup = await _run_with_and_without_rollups(engine)
+            assert rollup is not None
+            assert rows == base
+            assert engine.rollups.get_stats()["incremental_refreshes"] == 1
+        finally:
+            await engine.disconnect()
+    
+    asyncio.run(scenario())
@@ -0,0 +1,77 @@
+"""
+语义SQL缓存在SQL生成路径上的测试
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("vanna")
+
+from config.settings import get_settings
+from services.nl2sql.llm_executor import LLMExecutor
+from services.nl2sql.sql_cache import SemanticSQLCache
+from services.nl2sql.vanna_service import VannaService
+
+GENERATED_SQL = "SELECT SUM(amount) FROM orders"
+
+
+class FakeVannaClient:
+    """同义问题返回相同向量，记录LLM调用次数"""
+    
+    def __init__(self):
+        self.generate_calls = 0
+    
+    def generate_embedding(self, text):
+        return [1.0, 0.0] if "订单" in text else [0.0, 1.0]
+    
+    def generate_sql(self, question):
+        self.generate_calls += 1
+        return GENERATED_SQL
+    
+    def get_related_training_data(self, question):
+        return []
+
+
+def _service():
+    service = VannaService.__new__(VannaService)
+    service.settings = get_settings()
+    service.executor = LLMExecutor(max_workers=2)
+    service.sql_cache = SemanticSQLCache(similarity_threshold=0.9)
+    service.vanna_client = FakeVannaClient()
+    return service
+
+
+def test_recorded_sql_is_reused_by_similar_question():
+    async def scenario():
+        service = _service()
+        first = await service.generate_sql("订单总金额是多少", user_id=1)
+        assert first["cache_hit"] is False
+        assert await service.record_validated_sql("订单总金额是多少", first["sql"], user_id=1)
+        
+        second = await service.generate_sql("所有订单的金额合计", user_id=1)
+        assert second["cache_hit"] is True
+        assert second["sql"] == first["sql"]
+        assert service.vanna_client.generate_calls == 1
+        
+        # 重新生成时跳过缓存
+        third = await service.generate_sql("所有订单的金额合计", user_id=1, use_cache=False)
+        assert third["cache_hit"] is False
+        assert service.vanna_client.generate_calls == 2
+    
+    asyncio.run(scenario())
+
+
+def test_question_differing_only_in_year_misses():
+    async def scenario():
+        service = _service()
+        first = await service.generate_sql("2023年各区域订单金额", user_id=1)
+        assert await service.record_validated_sql("2023年各区域订单金额", first["sql"], user_id=1)
+        
+        other_year = await service.generate_sql("2024年各区域订单金额", user_id=1)
+        assert other_year["cache_hit"] is False
+        
+        paraphrase = await service.generate_sql("2023年每个区域的订单金额", user_id=1)
+        assert paraphrase["cache_hit"] is True
+        assert service.vanna_client.generate_calls == 2
+    
+    asyncio.run(scenario())
@@ -0,0 +1,104 @@
+"""
+工作流SQL生成节点测试
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("langgraph")
+pytest.importorskip("vanna")
+
+from services.nl2sql import workflow_engine
+from services.nl2sql.workflow_engine import WorkflowEngine
+
+
+class FakeVannaService:
+    """记录调用参数并返回固定SQL"""
+    
+    def __init__(self, result):
+        self.result = result
+        self.calls = []
+    
+    async def generate_sql(self, question, user_id, theme_id=None, table_ids=None, task_id=None, use_cache=True):
+        self.calls.append({
+            "question": question,
+            "user_id": user_id,
+            "theme_id": theme_id,
+            "table_ids": table_ids,
+            "task_id": task_id,
+            "use_cache": use_cache
+        })
+        return self.result
+
+
+def _state(**overrides):
+    state = {
+        "task_id": "task-1",
+        "user_id": 7,
+        "user_question": "统计各地区订单金额",
+        "selected_theme_id": 3,
+        "selected_table_ids": [2],
+        "cached_sql": None,
+        "node_execution_log": []
+    }
+    state.update(overrides)
+    return state
+
+
+def test_generate_sql_node_calls_vanna_with_task_id(monkeypatch):
+    service = FakeVannaService({
+        "sql": "SELECT region, SUM(amount) FROM orders GROUP BY region LIMIT 1000;",
+        "original_sql": "SELECT region, SUM(amount) FROM orders GROUP BY region",
+        "cache_hit": False
+    })
+    monkeypatch.setattr(workflow_engine, "get_vanna_service", lambda: service)
+    
+    state = asyncio.run(WorkflowEngine()._generate_sql_node(_state()))
+    
+    assert service.calls == [{
+        "question": "统计各地区订单金额",
+        "user_id": 7,
+        "theme_id": 3,
+        "table_ids": [2],
+        "task_id": "task-1",
+        "use_cache": True
+    }]
+    assert state["generated_sql"] == "SELECT region, SUM(amount) FROM orders GROUP BY region"
+    assert state["final_sql"] == "SELECT region, SUM(amount) FROM orders GROUP BY region LIMIT 1000;"
+    assert not state.get("error_message")
+    assert state["semantic_cache_hit"] is False
+    assert state["node_execution_log"][-1]["status"] == "success"
+
+
+def test_regeneration_skips_semantic_cache(monkeypatch):
+    service = FakeVannaService({"sql": "SELECT 2;", "cache_hit": False})
+    monkeypatch.setattr(workflow_engine, "get_vanna_service", lambda: service)
+    
+    state = asyncio.run(WorkflowEngine()._generate_sql_node(_state(generated_sql="SELECT 1;", final_sql="SELECT 1;")))
+    
+    assert service.calls[0]["use_cache"] is False
+    assert state["final_sql"] == "SELECT 2;"
+
+
+def test_generate_sql_node_reuses_question_cache_without_vanna(monkeypatch):
+    service = FakeVannaService({"sql": "SELECT 2;"})
+    monkeypatch.setattr(workflow_engine, "get_vanna_service", lambda: service)
+    
+    state = asyncio.run(WorkflowEngine()._generate_sql_node(_state(cached_sql="SELECT 1;")))
+    
+    assert service.calls == []
+    assert state["final_sql"] == "SELECT 1;"
+    assert state["cached_sql"] is None
+
+
+def test_generate_sql_node_reports_vanna_failure(monkeypatch):
+    class FailingVannaService:
+        async def generate_sql(self, *args, **kwargs):
+            raise RuntimeError("LLM不可用")
+    
+    monkeypatch.setattr(workflow_engine, "get_vanna_service", lambda: FailingVannaService())
+    
+    state = asyncio.run(WorkflowEngine()._generate_sql_node(_state()))
+    
+    assert state["error_code"] == "NODE_ERROR"
+    assert "LLM不可用" in state["error_message"]
@@ -0,0 +1,93 @@
+"""
+流式SQL拼装测试
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("langgraph")
+pytest.importorskip("vanna")
+
+from config.settings import get_settings
+from services.nl2sql.llm_executor import LLMExecutor
+from services.nl2sql.sql_stream import SQLStreamAssembler
+from services.nl2sql.vanna_service import VannaService
+
+
+def _assemble(reply: str, chunk_size: int = 3) -> SQLStreamAssembler:
+    assembler = SQLStreamAssembler()
+    for start in range(0, len(reply), chunk_size):
+        assembler.feed(reply[start:start + chunk_size])
+    return assembler
+
+
+def test_prose_before_unfenced_sql_is_dropped():
+    assembler = _assemble("Here is the query:\nSELECT region, sum(x) FROM t GROUP BY 1;")
+    assert assembler.complete_sql == "SELECT region, sum(x) FROM t GROUP BY 1;"
+    assert assembler.finish() == "SELECT region, sum(x) FROM t GROUP BY 1;"
+
+
+def test_semicolon_in_prose_before_fence_is_not_latched():
+    assembler = _assemble("Note: totals are daily; grouped by month.\n```sql\nSELECT 1;```")
+    assert assembler.complete_sql == "SELECT 1;"
+    assert assembler.finish() == "SELECT 1;"
+
+
+def test_reply_without_sql_has_no_statement():
+    assembler = _assemble("Sorry, I cannot answer that; please rephrase.")
+    assert assembler.complete_sql is None
+    assert assembler.partial_sql == ""
+    assert assembler.finish() == ""
+
+
+def test_fenced_sql_overrides_earlier_select_line():
+    assembler = _assemble("select the regions first;\n```sql\nSELECT region FROM t;\n```")
+    assert assembler.finish() == "SELECT region FROM t;"
+
+
+class FakeVannaClient:
+    """记录 extract_sql 的输入，按Vanna的方式去掉结尾分号"""
+    
+    def __init__(self):
+        self.extracted = []
+    
+    def get_related_training_data(self, question):
+        return []
+    
+    def extract_sql(self, text):
+        self.extracted.append(text)
+        return text.rstrip(";")
+
+
+def test_streamed_sql_is_extracted_before_precheck():
+    reply = "Note: totals are daily; grouped by month.\n```sql\nSELECT 1;```"
+    prechecked = []
+    
+    async def enhance(question, context_info):
+        return question
+    
+    async def precheck(task_id, sql):
+        prechecked.append(sql)
+        return {"valid": True, "errors": [], "warnings": []}
+    
+    async def notify(task_id, data):
+        pass
+    
+    def stream(prompt, push, stop):
+        for start in range(0, len(reply), 5):
+            push(reply[start:start + 5])
+    
+    service = VannaService.__new__(VannaService)
+    service.settings = get_settings()
+    service.executor = LLMExecutor(max_workers=2)
+    service.vanna_client = FakeVannaClient()
+    service._enhance_question_with_context = enhance
+    service._build_sql_prompt = lambda question: []
+    service._stream_completion = stream
+    service._precheck_sql = precheck
+    service._notify_stream_progress = notify
+    
+    result = asyncio.run(service._call_vanna_generate_sql_stream("问题", {}, "task-1"))
+    assert service.vanna_client.extracted == ["SELECT 1;"]
+    assert result["sql"] == "SELECT 1"
+    assert prechecked[-1] == "SELECT 1"
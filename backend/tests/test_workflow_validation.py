@@ -0,0 +1,57 @@
+"""
+工作流SQL验证汇总节点测试
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("langgraph")
+pytest.importorskip("vanna")
+
+from services.nl2sql.workflow_engine import WorkflowEngine
+
+SQL = "SELECT * FROM orders ORDER BY amount DESC;"
+PASSED = {"valid": True, "errors": []}
+
+
+def _engine(monkeypatch, admission_result):
+    engine = WorkflowEngine()
+    
+    async def check_sql_admission(sql):
+        return {"sql": sql, "row_limit": None, "reason": None, "estimate": {}, **admission_result}
+    
+    monkeypatch.setattr(engine, "_check_sql_admission", check_sql_admission)
+    return engine
+
+
+def _validated_state(engine):
+    state = {
+        "task_id": "task-1",
+        "user_id": 7,
+        "final_sql": SQL,
+        "execution_row_limit": None,
+        "node_execution_log": []
+    }
+    state = asyncio.run(engine._validate_sql_node(state))
+    state.update({"syntax_check": PASSED, "security_check": PASSED, "permission_check": PASSED})
+    return asyncio.run(engine._merge_sql_validation_node(state))
+
+
+def test_rejected_query_sets_error_code_in_node(monkeypatch):
+    engine = _engine(monkeypatch, {"decision": "reject", "reason": "预计扫描 2000000000 行"})
+    state = _validated_state(engine)
+    
+    assert state["error_code"] == "QUERY_REJECTED"
+    assert "预计扫描" in state["error_message"]
+    assert engine._should_execute_sql(state) == "error"
+
+
+def test_downgraded_query_keeps_final_sql_and_limits_execution(monkeypatch):
+    engine = _engine(monkeypatch, {"decision": "downgrade", "row_limit": 100000, "reason": "预计返回 500000 行"})
+    state = _validated_state(engine)
+    
+    assert not state.get("error_message")
+    assert state["final_sql"] == SQL
+    assert state["execution_row_limit"] == 100000
+    assert engine._should_execute_sql(state) == "execute"
+    assert WorkflowEngine.execution_sql(state) == "SELECT * FROM orders ORDER BY amount DESC LIMIT 100000"
@@ -2,7 +2,7 @@
 工具模块初始化
 """
 from .logger import setup_logging, get_logger
-from .database import DatabaseManager, QueryEngineManager, get_db, db_manager, query_engine_manager
+from .database import DatabaseManager, get_db, db_manager
 from .exceptions import (
     TaoshaException,
     ValidationException,
@@ -17,6 +17,8 @@ from .exceptions import (
     ConfigurationException,
     BusinessLogicException,
     RateLimitException,
+    QueryCancelledException,
+    QueryTimeoutException,
     ExternalServiceException,
     get_error_message
 )
@@ -28,10 +30,8 @@ __all__ = [
     
     # 数据库
     "DatabaseManager",
-    "QueryEngineManager",
     "get_db",
     "db_manager",
-    "query_engine_manager",
     
     # 异常
     "TaoshaException",
@@ -47,6 +47,8 @@ __all__ = [
     "ConfigurationException",
     "BusinessLogicException",
     "RateLimitException",
+    "QueryCancelledException",
+    "QueryTimeoutException",
     "ExternalServiceException",
     "get_error_message",
 ]
\ No newline at end of file
@@ -168,6 +168,30 @@ class RateLimitException(TaoshaException):
         )
 
 
+class QueryCancelledException(TaoshaException):
+    """查询已取消异常"""
+    
+    def __init__(self, message: str = "查询已取消", details: Optional[Any] = None):
+        super().__init__(
+            message=message,
+            error_code=400003,
+            status_code=400,
+            details=details
+        )
+
+
+class QueryTimeoutException(TaoshaException):
+    """查询超时异常"""
+    
+    def __init__(self, message: str = "查询执行超时", details: Optional[Any] = None):
+        super().__init__(
+            message=message,
+            error_code=504001,
+            status_code=504,
+            details=details
+        )
+
+
 class ExternalServiceException(TaoshaException):
     """外部服务异常"""
     
@@ -184,6 +208,7 @@ class ExternalServiceException(TaoshaException):
 EXCEPTION_CODE_MAP = {
     400001: "参数验证失败",
     400002: "业务逻辑错误",
+    400003: "查询已取消",
     401001: "认证失败",
     403001: "权限不足",
     404001: "资源未找到",
@@ -196,6 +221,7 @@ EXCEPTION_CODE_MAP = {
     500005: "查询处理错误",
     500006: "配置错误",
     502001: "外部服务错误",
+    504001: "查询超时",
 }
 
 